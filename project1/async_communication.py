@@ -0,0 +1,285 @@
+"""
+Asyncio version of the client communication with the trusted server.
+Same protocol as `communication.py`, but requests do not block the event loop, so that many of them
+can be in flight at the same time.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+import aiohttp
+import numpy as np
+
+from communication import Call, ServerRoutes
+from metrics import Metrics
+from secret_sharing import DEFAULT_FIELD, Field
+from transport import Transport, TransportResponse
+
+
+class AsyncCommunication(ServerRoutes):
+    """
+    Non-blocking network communications with the server.
+
+    Must be used from a running event loop, and closed with `close` (or used as an async context
+    manager) once done.
+
+    Attributes:
+        server_host: hostname of the server
+        server_port: port of the server
+        protocol: network protocol to use (default: "http")
+        pool_size: maximum number of simultaneous connections to the server (default: 100)
+        retries: number of retries of a request when connecting to the server fails (default: 3)
+        transport: how requests reach the server (default: None, HTTP with aiohttp), see
+            `transport.py`. Its requests are sent from a thread, so that they do not block the
+            event loop.
+        other attributes: see `communication.ServerRoutes`
+    """
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            poll_delay: float = 0.2,
+            protocol: str = "http",
+            long_poll_timeout: float = 10.0,
+            pool_size: int = 100,
+            retries: int = 3,
+            log_level: int = logging.WARNING,
+            field: Field = DEFAULT_FIELD,
+            session_id: Optional[str] = None,
+            transport: Optional[Transport] = None,
+            metrics: Optional[Metrics] = None
+    ):
+        super().__init__(client_id, poll_delay, long_poll_timeout, log_level, field, session_id, metrics)
+        self.base_url = f"{protocol}://{server_host}:{server_port}"
+        self.pool_size = pool_size
+        self.retries = retries
+        self.transport = transport
+
+        # Created lazily: an aiohttp session has to be created inside the event loop.
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def close(self) -> None:
+        """
+        Close the connections to the server.
+        """
+        if self.transport is not None:
+            self.transport.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+    async def _request(
+            self,
+            method: str,
+            path: str,
+            body: Union[bytes, str, None] = None,
+            params: Optional[dict] = None
+        ) -> TransportResponse:
+        """
+        Send a request to a route of our session, retrying when connecting fails.
+        Return the status, the body and whether the server advertised long-polling.
+        """
+        path = self.session_path + path
+        self.logger.debug("%s %s", method, path)
+        if self.transport is not None:
+            status, content, long_poll = await asyncio.to_thread(self.transport.request, method, path, body, params)
+        else:
+            status, content, long_poll = await self._http_request(method, self.base_url + path, body, params)
+        sent = len(body.encode("utf-8") if isinstance(body, str) else body or b"")
+        self.metrics.record_request(sent, len(content))
+        return status, content, long_poll
+
+    async def _http_request(
+            self,
+            method: str,
+            url: str,
+            data: Union[bytes, str, None],
+            params: Optional[dict]
+        ) -> TransportResponse:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+
+        # Only retry when connecting fails, see `transport.Transport`
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._session.request(method, url, data=data, params=params) as res:
+                    return res.status, await res.read(), "X-Long-Poll" in res.headers
+            except aiohttp.ClientConnectorError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.05 * 2 ** attempt)
+        raise AssertionError("unreachable")
+
+    async def _call(self, call: Call) -> Any:
+        """
+        Send the request of a call and return its result, see `Communication._call`.
+        """
+        params = self._params(call)
+        start = time.perf_counter()
+        polls = 0
+        while True:
+            status, content, long_poll = await self._request(call.method, call.path, call.body, params)
+            if not call.poll or status != 404:
+                break
+            polls += 1
+            if "wait" not in (params or {}) or not long_poll:
+                await asyncio.sleep(self.poll_delay)
+        if call.poll:
+            self.metrics.record_wait(time.perf_counter() - start, polls)
+        return self._result(call, status, content)
+
+
+    async def register_session(
+            self,
+            participant_ids: Sequence[str],
+            modulus: int = DEFAULT_FIELD.modulus
+        ) -> None:
+        """
+        Create our session on the server, see `Communication.register_session`.
+        """
+        await self._call(self.register_session_call(participant_ids, modulus))
+
+    async def send_private_message(
+            self,
+            receiver_id: str,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Send a private message to the server.
+        """
+        await self._call(self.send_private_message_call(receiver_id, label, message))
+
+    async def retrieve_private_message(
+            self,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a private message from the server, waiting for it without blocking the loop.
+        """
+        return await self._call(self.retrieve_private_message_call(label))
+
+    async def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Publish a message on the server.
+        """
+        await self._call(self.publish_message_call(label, message))
+
+    async def retrieve_public_message(
+            self,
+            sender_id: str,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a public message from the server, waiting for it without blocking the loop.
+        """
+        return await self._call(self.retrieve_public_message_call(sender_id, label))
+
+    async def send_private_messages(
+            self,
+            messages: Sequence[Tuple[str, str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Send many private messages, given as (receiver_id, label, message), in one request.
+        """
+        await self._call(self.send_private_messages_call(messages))
+
+    async def retrieve_private_messages(
+            self,
+            labels: Sequence[str]
+        ) -> List[bytes]:
+        """
+        Retrieve many private messages in one request, once they are all on the server.
+        """
+        return await self._call(self.retrieve_private_messages_call(labels))
+
+    async def publish_messages(
+            self,
+            messages: Sequence[Tuple[str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Publish many messages, given as (label, message), in one request.
+        """
+        await self._call(self.publish_messages_call(messages))
+
+    async def retrieve_public_messages(
+            self,
+            keys: Sequence[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve many public messages, given as (sender_id, label), in one request, once they are
+        all on the server.
+        """
+        return await self._call(self.retrieve_public_messages_call(keys))
+
+    async def retrieve_beaver_triplet_shares(
+            self,
+            op_id: str,
+            count: Optional[int] = None,
+            shape: Optional[Tuple[int, int, int]] = None
+        ) -> Union[Tuple[int, int, int], Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Retrieve a triplet of shares generated by the trusted server, see
+        `Communication.retrieve_beaver_triplet_shares`.
+        """
+        return await self._call(self.retrieve_beaver_triplet_shares_call(op_id, count, shape))
+
+    async def retrieve_beaver_triplet_shares_batch(
+            self,
+            op_ids: List[str],
+            count: Optional[int] = None,
+            shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+        ) -> Union[List[Tuple[int, int, int]], List[Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+        """
+        Retrieve the triplets of shares of many operations in a single request, see
+        `Communication.retrieve_beaver_triplet_shares_batch`.
+        """
+        return await self._call(self.retrieve_beaver_triplet_shares_batch_call(op_ids, count, shapes))
+
+    async def retrieve_triplet_seed(self, run: str) -> Tuple[int, bool]:
+        """
+        Retrieve the seed our triplet shares of a run are expanded from, see
+        `Communication.retrieve_triplet_seed`.
+        """
+        return await self._call(self.retrieve_triplet_seed_call(run))
+
+    async def retrieve_triplet_corrections(
+            self,
+            run: str,
+            op_ids: List[str],
+            count: int,
+            shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+        ) -> List[np.ndarray]:
+        """
+        Retrieve the corrections of our shares of c for the triplets of many operations, see
+        `Communication.retrieve_triplet_corrections`.
+        """
+        return await self._call(self.retrieve_triplet_corrections_call(run, op_ids, count, shapes))
+
+    async def retrieve_random_bits(
+            self,
+            op_ids: List[str],
+            count: int,
+            bits: Sequence[int]
+        ) -> List[np.ndarray]:
+        """
+        Retrieve our shares of the random bits of many operations, see
+        `Communication.retrieve_random_bits`.
+        """
+        return await self._call(self.retrieve_random_bits_call(op_ids, count, bits))
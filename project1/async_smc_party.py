@@ -0,0 +1,164 @@
+"""
+Asyncio version of the SMC client.
+
+Runs the same protocol as `SMCParty`, but the independent requests of a step (share distribution,
+triplet prefetch, publication of a round and retrieval of the messages of the others) are sent concurrently.
+"""
+
+import asyncio
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from async_communication import AsyncCommunication
+from communication import encode_values
+from expression import Secret
+from metrics import PHASE_BEAVER, PHASE_INPUT_SHARING, PHASE_LOCAL, PHASE_RECONSTRUCTION, PHASE_SETUP
+from protocol import ProtocolSpec
+from smc_party import LABEL_FINAL, LABEL_SEED_RUN, SMCParty
+from transport import Transport
+
+
+class AsyncSMCParty(SMCParty):
+    """
+    A client that executes an SMC protocol with non-blocking communications.
+
+    `run` can be called like the one of `SMCParty`; from a running event loop, await `run_async`
+    instead. The triplets are fetched at the same time as the shares of the secrets, so their
+    requests are counted in the input_sharing phase of `metrics`.
+    """
+
+    def __init__(
+            self,
+            client_id: str,
+            server_host: str,
+            server_port: int,
+            protocol_spec: ProtocolSpec,
+            value_dict: Dict[Secret, Union[int, Sequence[int]]],
+            seed: Optional[int] = None,
+            transport: Optional[Transport] = None
+        ):
+        if protocol_spec.peer_to_peer:
+            raise ValueError("AsyncSMCParty relays its messages through the server, use SMCParty for peer_to_peer")
+        super().__init__(client_id, server_host, server_port, protocol_spec, value_dict, seed, transport)
+
+    def make_communication(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            protocol_spec: ProtocolSpec,
+            transport: Optional[Transport]
+        ) -> AsyncCommunication: # type: ignore
+        return AsyncCommunication(
+            server_host,
+            server_port,
+            client_id,
+            field=self.field,
+            session_id=protocol_spec.session_id,
+            transport=transport,
+            metrics=self.metrics
+        )
+
+    def run(self) -> Union[int, np.ndarray]:
+        """
+        The method the client use to do the SMC.
+        """
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> Union[int, np.ndarray]:
+        """
+        The method the client use to do the SMC, from an event loop.
+        """
+        try:
+            return await self._run()
+        finally:
+            await self.comm.close()
+
+    async def _run(self) -> Union[int, np.ndarray]:
+        comm: AsyncCommunication = self.comm # type: ignore
+        op_ids = self.beaver_op_ids()
+        bits_ids, bits = self.random_bits_requests()
+
+        if self.protocol_spec.session_id is not None:
+            with self.metrics.phase(PHASE_SETUP):
+                await comm.register_session(self.protocol_spec.participant_ids, self.protocol_spec.modulus)
+
+        # Send our shares, fetch the triplets, the random bits and the shares of the other
+        # participants at once
+        with self.metrics.phase(PHASE_INPUT_SHARING):
+            messages = self.input_share_messages()
+            secret_ids = self.foreign_secret_ids()
+            requests = []
+            if messages:
+                requests.append(comm.send_private_messages(messages))
+            if secret_ids:
+                requests.append(comm.retrieve_private_messages([self.label(secret_id) for secret_id in secret_ids]))
+            if op_ids:
+                requests.append(self._fetch_triplets(op_ids, self.beaver_shapes()))
+            if bits_ids:
+                requests.append(comm.retrieve_random_bits(bits_ids, self.batch_size, bits))
+
+            results = await asyncio.gather(*requests)
+
+            if bits_ids:
+                self.random_bits.update(zip(bits_ids, results.pop()))
+            if op_ids:
+                self.triplets.update(zip(op_ids, results.pop()))
+            if secret_ids:
+                for secret_id, message in zip(secret_ids, results.pop()):
+                    self.store_secret_share(secret_id, message)
+
+        # One round per level of multiplicative depth
+        for depth, (beavers, local) in enumerate(self.program.levels):
+            if beavers:
+                with self.metrics.phase(PHASE_BEAVER):
+                    label = self.beaver_label(depth)
+                    state, message = self.mask_beaver_layer(beavers)
+                    _, others = await asyncio.gather(
+                        comm.publish_message(self.client_id + label, message),
+                        comm.retrieve_public_messages([(p_id, p_id + label) for p_id in self.other_participants()])
+                    )
+                    self.unmask_beaver_layer(beavers, state, others)
+            with self.metrics.phase(PHASE_LOCAL):
+                self.evaluate_local(local)
+
+        # Publish our share of the result and retrieve the others' at once
+        with self.metrics.phase(PHASE_RECONSTRUCTION):
+            own = encode_values(self.result_share().values, self.field)
+            _, parts_to_combine = await asyncio.gather(
+                comm.publish_message(self.label(LABEL_FINAL), own),
+                comm.retrieve_public_messages([
+                    (participant_id, self.label(LABEL_FINAL)) for participant_id in self.other_participants()
+                ])
+            )
+            return self.combine_results([own] + parts_to_combine)
+
+    async def _fetch_triplets(
+            self,
+            op_ids: List[str],
+            shapes: List[Optional[Tuple[int, int, int]]]
+        ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        # See `SMCParty.fetch_triplets`
+        comm: AsyncCommunication = self.comm # type: ignore
+        if not self.protocol_spec.seeded_triplets:
+            return await comm.retrieve_beaver_triplet_shares_batch(op_ids, self.batch_size, shapes) # type: ignore
+        run = await self._seed_run_async()
+        seed, corrected = await comm.retrieve_triplet_seed(run)
+        corrections = None
+        if corrected:
+            corrections = await comm.retrieve_triplet_corrections(run, op_ids, self.batch_size, shapes)
+        return self.expand_triplets(seed, op_ids, shapes, corrections)
+
+    async def _seed_run_async(self) -> str:
+        # See `SMCParty.seed_run`
+        comm: AsyncCommunication = self.comm # type: ignore
+        if self._seed_run is None:
+            if self.is_first_participant():
+                self._seed_run = os.urandom(16).hex()
+                await comm.publish_message(LABEL_SEED_RUN, self._seed_run)
+            else:
+                first = self.protocol_spec.participant_ids[0]
+                self._seed_run = (await comm.retrieve_public_message(first, LABEL_SEED_RUN)).decode()
+        return self._seed_run
@@ -4,9 +4,156 @@ You should not need to change this file.
 """
 
 import json
+import logging
+import struct
 import time
-from typing import Union, Tuple
-import requests
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Union, Tuple
+import numpy as np
+
+from metrics import Metrics
+from secret_sharing import DEFAULT_FIELD, Field
+from transport import HTTPTransport, Transport, TransportResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+def encode_values(values, field: Field = DEFAULT_FIELD) -> bytes:
+    """
+    Encode field elements (an int or a sequence of ints) in the binary wire format: little-endian
+    unsigned integers, of 32 bits for moduli up to 2**32 and 64 bits above (see `Field.wire_dtype`).
+    """
+    return field.reduce(values).astype(field.wire_dtype).reshape(-1).tobytes()
+
+
+def decode_values(data: bytes, field: Field = DEFAULT_FIELD) -> np.ndarray:
+    """
+    Decode field elements from the binary wire format, as an array of `field.dtype`.
+    """
+    return np.frombuffer(data, dtype=field.wire_dtype).astype(field.dtype)
+
+
+def decode_triplets(
+        content: bytes,
+        count: Optional[int],
+        field: Field = DEFAULT_FIELD,
+        shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+    ) -> Union[List[Tuple[int, int, int]], List[Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+    """
+    Triplets of shares sent by the server: tuples of ints, or of arrays of `count` values.
+    Given the shapes (m, k, n) of matrix triples (None for the others), their arrays are A (m x k x count),
+    B (k x n x count) and C (m x n x count).
+    """
+    values = decode_values(content, field)
+    if count is None:
+        return [tuple(row) for row in values.reshape(-1, 3).tolist()] # type: ignore
+    if shapes is None or not any(shapes):
+        return [tuple(row) for row in values.reshape(-1, 3, count)] # type: ignore
+
+    res = []
+    offset = 0
+    for shape in shapes:
+        if shape is None:
+            res.append(tuple(values[offset:offset + 3 * count].reshape(3, count)))
+            offset += 3 * count
+            continue
+        m, k, n = shape
+        triple = []
+        for rows, cols in ((m, k), (k, n), (m, n)):
+            triple.append(values[offset:offset + rows * cols * count].reshape(rows, cols, count))
+            offset += rows * cols * count
+        res.append(tuple(triple))
+    return res # type: ignore
+
+
+def decode_corrections(
+        content: bytes,
+        count: int,
+        field: Field,
+        shapes: Sequence[Optional[Tuple[int, int, int]]]
+    ) -> List[np.ndarray]:
+    """
+    Corrections of the shares of c of many operations sent by the server (see
+    `TrustedParamGenerator.retrieve_correction`): arrays of `count` values, or of m x n x count
+    values for the matrix triples of shape (m, k, n).
+    """
+    values = decode_values(content, field)
+    res = []
+    offset = 0
+    for shape in shapes:
+        rows, cols = (1, 1) if shape is None else (shape[0], shape[2])
+        correction = values[offset:offset + rows * cols * count]
+        res.append(correction if shape is None else correction.reshape(rows, cols, count))
+        offset += rows * cols * count
+    return res
+
+
+def encode_operations(
+        op_ids: Sequence[str],
+        shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+    ) -> str:
+    """
+    JSON body of the requests for the triplets of many operations: their op_ids, or
+    {"op_id": op_id, "shape": [m, k, n]} for matrix triples.
+    """
+    return json.dumps([
+        sanitize_url_param(op_id) if shape is None else {"op_id": sanitize_url_param(op_id), "shape": shape}
+        for op_id, shape in zip(op_ids, shapes or [None] * len(op_ids))
+    ])
+
+
+def encode_random_bits(op_ids: Sequence[str], bits: Sequence[int]) -> str:
+    """
+    JSON body of the requests for the random bits of many operations.
+    """
+    return json.dumps([{"op_id": sanitize_url_param(op_id), "bits": nb} for op_id, nb in zip(op_ids, bits)])
+
+
+def decode_random_bits(
+        content: bytes,
+        count: int,
+        field: Field,
+        bits: Sequence[int]
+    ) -> List[np.ndarray]:
+    """
+    Shares of the random bits of many operations sent by the server: arrays of bits x count values.
+    """
+    values = decode_values(content, field)
+    res = []
+    offset = 0
+    for nb in bits:
+        res.append(values[offset:offset + nb * count].reshape(nb, count))
+        offset += nb * count
+    return res
+
+
+def pack_envelope(entries: Sequence[Sequence[Union[bytes, str]]]) -> bytes:
+    """
+    Pack many messages in one binary envelope. Each entry is a tuple of fields (e.g. label and
+    payload), every field is written as its little-endian uint32 length followed by its bytes.
+    """
+    parts = []
+    for entry in entries:
+        for field in entry:
+            if isinstance(field, str):
+                field = field.encode("utf-8")
+            parts.append(struct.pack("<I", len(field)))
+            parts.append(field)
+    return b"".join(parts)
+
+
+def unpack_envelope(data: bytes, nb_fields: int) -> List[Tuple[bytes, ...]]:
+    """
+    Unpack an envelope built by `pack_envelope` with entries of `nb_fields` fields.
+    """
+    fields = []
+    offset = 0
+    while offset < len(data):
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        fields.append(data[offset:offset + length])
+        offset += length
+    return [tuple(fields[i:i + nb_fields]) for i in range(0, len(fields), nb_fields)]
 
 def sanitize_url_param(url_param: Union[bytes, str]) -> str:
     """
@@ -22,94 +169,387 @@ def sanitize_url_param(url_param: Union[bytes, str]) -> str:
     return url_param.replace("/", "_").replace("+", "-") # type: ignore
 
 
-class Communication:
+class ServerError(RuntimeError):
     """
-    Network communications with the server.
+    The server failed a request: unknown session, triplets dropped, bad request...
+
+    Attributes:
+        status: HTTP status of the response
+    """
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class Call(NamedTuple):
+    """
+    A request to a route of the server (its path relative to our session), and how to handle the
+    response: `poll` asks again while the server does not have the message (404), `decode` turns
+    the body of the response into the result of the call. Any other status than 200 raises a
+    `ServerError`.
+    """
+    method: str
+    path: str
+    body: Union[bytes, str, None] = None
+    params: Optional[Dict[str, str]] = None
+    poll: bool = False
+    decode: Optional[Callable[[bytes], Any]] = None
+    # Description of the call in its errors (default: the method and the path)
+    error: Optional[str] = None
+
+
+class ServerRoutes:
+    """
+    What the clients ask the server, without the I/O: the request of each route and the decoding of
+    its response, shared by `Communication` and `async_communication.AsyncCommunication`.
 
     Attributes:
-        server_host: hostname of the server
-        server_port: port of the server
         client_id: Identifier of this client
         poll_delay: delay between requests in seconds (default: 0.2 s)
-        protocol: network protocol to use (default: "http")
+        long_poll_timeout: how long the server may hold a retrieve request until the message
+            arrives, 0 to disable long-polling (default: 10 s)
+        log_level: level of the request logs, they are emitted at DEBUG (default: logging.WARNING)
+        field: field of the Beaver triplet shares (default: modulus q)
+        session_id: session of the server the messages and triplets belong to (default: None,
+            the default session)
+        metrics: where the requests, bytes and polls are counted, in the phase the caller is in
+            (default: metrics of our own), see `metrics.py`
     """
 
     def __init__(
             self,
-            server_host: str,
-            server_port: int,
             client_id: str,
             poll_delay: float = 0.2,
-            protocol: str = "http"
+            long_poll_timeout: float = 10.0,
+            log_level: int = logging.WARNING,
+            field: Field = DEFAULT_FIELD,
+            session_id: Optional[str] = None,
+            metrics: Optional[Metrics] = None
     ):
-        self.base_url = f"{protocol}://{server_host}:{server_port}"
+        self.session_id = session_id
+        # Prefix of the routes of our session
+        self.session_path = ""
+        if session_id is not None:
+            self.session_path = f"/sessions/{sanitize_url_param(session_id)}"
         self.client_id = client_id
         self.poll_delay = poll_delay
+        self.long_poll_timeout = long_poll_timeout
+        self.field = field
         self.bytes_total = 0
+        self.metrics = metrics or Metrics()
 
+        self.logger = logger.getChild(sanitize_url_param(client_id))
+        self.logger.setLevel(log_level)
 
-    def send_private_message(
+    def _params(self, call: Call) -> Optional[Dict[str, str]]:
+        # Query parameters of a call, asking the server to hold the polls until the message arrives
+        if call.poll and self.long_poll_timeout > 0:
+            return {**(call.params or {}), "wait": str(self.long_poll_timeout)}
+        return call.params
+
+    def _result(self, call: Call, status: int, content: bytes) -> Any:
+        # Result of a call from the response of the server
+        if status != 200:
+            error = call.error or f"{call.method} {self.session_path}{call.path} failed"
+            raise ServerError(f"{error}: {status} {content[:200]!r}", status)
+        self.bytes_total += len(call.body or b"") + len(content)
+        return call.decode(content) if call.decode is not None else None
+
+
+    def register_session_call(
+            self,
+            participant_ids: Sequence[str],
+            modulus: int = DEFAULT_FIELD.modulus
+        ) -> Call:
+        body = {"participants": [sanitize_url_param(p_id) for p_id in participant_ids], "modulus": modulus}
+        return Call("POST", "", json.dumps(body), error=f"Could not register session {self.session_id}")
+
+    def send_private_message_call(
             self,
             receiver_id: str,
             label: str,
             message: Union[bytes, str]
-        ) -> None:
-        """
-        Send a private message to the server.
-        """
-
-        self.bytes_total += len(message)
-
+        ) -> Call:
         client_id_san = sanitize_url_param(self.client_id)
         receiver_id_san = sanitize_url_param(receiver_id)
         label_san = sanitize_url_param(label)
-        
-        url = f"{self.base_url}/private/{client_id_san}/{receiver_id_san}/{label_san}"
-        print(f"POST {url}")
-        requests.post(url, message)
+        return Call("POST", f"/private/{client_id_san}/{receiver_id_san}/{label_san}", message)
 
+    def retrieve_private_message_call(
+            self,
+            label: str
+        ) -> Call:
+        client_id_san = sanitize_url_param(self.client_id)
+        label_san = sanitize_url_param(label)
+        return Call("GET", f"/private/{client_id_san}/{label_san}", poll=True, decode=bytes)
 
-    def retrieve_private_message(
+    def publish_message_call(
             self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> Call:
+        client_id_san = sanitize_url_param(self.client_id)
+        label_san = sanitize_url_param(label)
+        return Call("POST", f"/public/{client_id_san}/{label_san}", message)
+
+    def retrieve_public_message_call(
+            self,
+            sender_id: str,
             label: str
-        ) -> bytes:
+        ) -> Call:
+        client_id_san = sanitize_url_param(self.client_id)
+        sender_id_san = sanitize_url_param(sender_id)
+        label_san = sanitize_url_param(label)
+        return Call("GET", f"/public/{client_id_san}/{sender_id_san}/{label_san}", poll=True, decode=bytes)
+
+    def send_private_messages_call(
+            self,
+            messages: Sequence[Tuple[str, str, Union[bytes, str]]]
+        ) -> Call:
+        body = pack_envelope([
+            (sanitize_url_param(receiver_id), sanitize_url_param(label), message)
+            for receiver_id, label, message in messages
+        ])
+        return Call("POST", f"/batch/private/{sanitize_url_param(self.client_id)}", body)
+
+    def retrieve_private_messages_call(
+            self,
+            labels: Sequence[str]
+        ) -> Call:
+        # Batch retrieves send the list of messages they want in the body.
+        body = pack_envelope([(sanitize_url_param(label),) for label in labels])
+        return Call(
+            "POST",
+            f"/batch/private/{sanitize_url_param(self.client_id)}/retrieve",
+            body,
+            poll=True,
+            decode=lambda content: [message for (message,) in unpack_envelope(content, 1)]
+        )
+
+    def publish_messages_call(
+            self,
+            messages: Sequence[Tuple[str, Union[bytes, str]]]
+        ) -> Call:
+        body = pack_envelope([(sanitize_url_param(label), message) for label, message in messages])
+        return Call("POST", f"/batch/public/{sanitize_url_param(self.client_id)}", body)
+
+    def retrieve_public_messages_call(
+            self,
+            keys: Sequence[Tuple[str, str]]
+        ) -> Call:
+        body = pack_envelope([
+            (sanitize_url_param(sender_id), sanitize_url_param(label)) for sender_id, label in keys
+        ])
+        return Call(
+            "POST",
+            f"/batch/public/{sanitize_url_param(self.client_id)}/retrieve",
+            body,
+            poll=True,
+            decode=lambda content: [message for (message,) in unpack_envelope(content, 1)]
+        )
+
+    def retrieve_beaver_triplet_shares_call(
+            self,
+            op_id: str,
+            count: Optional[int] = None,
+            shape: Optional[Tuple[int, int, int]] = None
+        ) -> Call:
+        client_id_san = sanitize_url_param(self.client_id)
+        op_id_san = sanitize_url_param(op_id)
+        params = {"format": "bin"} if count is None else {"format": "bin", "count": str(count)}
+        if shape is not None:
+            params["shape"] = ",".join(str(dim) for dim in shape)
+        return Call(
+            "GET",
+            f"/shares/{client_id_san}/{op_id_san}",
+            params=params,
+            decode=lambda content: decode_triplets(content, count, self.field, [shape])[0]
+        )
+
+    def retrieve_beaver_triplet_shares_batch_call(
+            self,
+            op_ids: List[str],
+            count: Optional[int] = None,
+            shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+        ) -> Call:
+        params = {"format": "bin"} if count is None else {"format": "bin", "count": str(count)}
+        return Call(
+            "POST",
+            f"/shares/{sanitize_url_param(self.client_id)}",
+            encode_operations(op_ids, shapes),
+            params,
+            decode=lambda content: decode_triplets(content, count, self.field, shapes)
+        )
+
+    def retrieve_triplet_seed_call(self, run: str) -> Call:
+        def decode(content: bytes) -> Tuple[int, bool]:
+            res = json.loads(content)
+            return int(res["seed"]), res["corrected"]
+        return Call("GET", f"/seeds/{sanitize_url_param(self.client_id)}", params={"run": run}, decode=decode)
+
+    def retrieve_triplet_corrections_call(
+            self,
+            run: str,
+            op_ids: List[str],
+            count: int,
+            shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+        ) -> Call:
+        return Call(
+            "POST",
+            f"/corrections/{sanitize_url_param(self.client_id)}",
+            encode_operations(op_ids, shapes),
+            {"count": str(count), "run": run},
+            decode=lambda content: decode_corrections(content, count, self.field, shapes or [None] * len(op_ids))
+        )
+
+    def retrieve_random_bits_call(
+            self,
+            op_ids: List[str],
+            count: int,
+            bits: Sequence[int]
+        ) -> Call:
+        return Call(
+            "POST",
+            f"/bits/{sanitize_url_param(self.client_id)}",
+            encode_random_bits(op_ids, bits),
+            {"count": str(count)},
+            decode=lambda content: decode_random_bits(content, count, self.field, bits)
+        )
+
+
+class Communication(ServerRoutes):
+    """
+    Network communications with the server.
+
+    Attributes:
+        server_host: hostname of the server
+        server_port: port of the server
+        protocol: network protocol to use (default: "http")
+        pool_size: number of keep-alive connections kept open to the server (default: 10)
+        retries: number of retries of a request when connecting to the server fails (default: 3)
+        transport: how requests reach the server (default: HTTP to `server_host`:`server_port`,
+            with `protocol`, `pool_size` and `retries`), see `transport.py`
+        other attributes: see `ServerRoutes`
+    """
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            poll_delay: float = 0.2,
+            protocol: str = "http",
+            long_poll_timeout: float = 10.0,
+            pool_size: int = 10,
+            retries: int = 3,
+            log_level: int = logging.WARNING,
+            field: Field = DEFAULT_FIELD,
+            session_id: Optional[str] = None,
+            transport: Optional[Transport] = None,
+            metrics: Optional[Metrics] = None
+    ):
+        super().__init__(client_id, poll_delay, long_poll_timeout, log_level, field, session_id, metrics)
+        self.base_url = f"{protocol}://{server_host}:{server_port}"
+        self.transport = transport or HTTPTransport(self.base_url, pool_size, retries)
+
+    def close(self) -> None:
         """
-        Retrieve a private message from the server.
+        Close the connections to the server.
         """
+        self.transport.close()
 
-        client_id_san = sanitize_url_param(self.client_id)
-        label_san = sanitize_url_param(label)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _request(
+            self,
+            method: str,
+            path: str,
+            body: Union[bytes, str, None] = None,
+            params: Optional[dict] = None
+        ) -> TransportResponse:
+        """
+        Send a request to a route of our session, return the status, the body and whether the server
+        advertised long-polling.
+        """
+        path = self.session_path + path
+        self.logger.debug("%s %s", method, path)
+        status, content, long_poll = self.transport.request(method, path, body, params)
+        sent = len(body.encode("utf-8") if isinstance(body, str) else body or b"")
+        self.metrics.record_request(sent, len(content))
+        return status, content, long_poll
+
+    def _call(self, call: Call) -> Any:
+        """
+        Send the request of a call and return its result.
+
+        A call that polls is sent until the server has the message (it answers 404 meanwhile). If the server supports
+        long-polling (it answers with a "X-Long-Poll" header), it holds the request until the message
+        arrives, so we can ask again right away. Otherwise, we sleep `poll_delay` between requests.
+        """
 
-        url = f"{self.base_url}/private/{client_id_san}/{label_san}"
         # We can either use a websocket, or do some polling, but websockets would require asyncio.
         # So we are doing polling to avoid introducing a new programming paradigm.
+        params = self._params(call)
+        start = time.perf_counter()
+        polls = 0
         while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
-            if res.status_code == 200:
-                self.bytes_total += len(res.content)
-                return res.content
-            time.sleep(self.poll_delay)
+            status, content, long_poll = self._request(call.method, call.path, call.body, params)
+            if not call.poll or status != 404:
+                break
+            polls += 1
+            if "wait" not in (params or {}) or not long_poll:
+                time.sleep(self.poll_delay)
+        if call.poll:
+            self.metrics.record_wait(time.perf_counter() - start, polls)
+        return self._result(call, status, content)
 
 
-    def publish_message(
+    def register_session(
+            self,
+            participant_ids: Sequence[str],
+            modulus: int = DEFAULT_FIELD.modulus
+        ) -> None:
+        """
+        Create our session on the server, or check that the one created by another participant
+        has the same participants and modulus.
+        """
+        self._call(self.register_session_call(participant_ids, modulus))
+
+    def send_private_message(
             self,
+            receiver_id: str,
             label: str,
             message: Union[bytes, str]
         ) -> None:
         """
-        Publish a message on the server.
+        Send a private message to the server.
         """
-        
-        self.bytes_total += len(message)
-
-        client_id_san = sanitize_url_param(self.client_id)
-        label_san = sanitize_url_param(label)
+        self._call(self.send_private_message_call(receiver_id, label, message))
 
-        url = f"{self.base_url}/public/{client_id_san}/{label_san}"
-        print(f"POST {url}")
-        requests.post(url, message)
+    def retrieve_private_message(
+            self,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a private message from the server.
+        """
+        return self._call(self.retrieve_private_message_call(label))
 
+    def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Publish a message on the server.
+        """
+        self._call(self.publish_message_call(label, message))
 
     def retrieve_public_message(
             self,
@@ -119,38 +559,100 @@ class Communication:
         """
         Retrieve a public message from the server.
         """
+        return self._call(self.retrieve_public_message_call(sender_id, label))
 
-        client_id_san = sanitize_url_param(self.client_id)
-        sender_id_san = sanitize_url_param(sender_id)
-        label_san = sanitize_url_param(label)
+    def send_private_messages(
+            self,
+            messages: Sequence[Tuple[str, str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Send many private messages, given as (receiver_id, label, message), in one request.
+        """
+        self._call(self.send_private_messages_call(messages))
 
-        url = f"{self.base_url}/public/{client_id_san}/{sender_id_san}/{label_san}"
+    def retrieve_private_messages(
+            self,
+            labels: Sequence[str]
+        ) -> List[bytes]:
+        """
+        Retrieve many private messages in one request, once they are all on the server.
+        """
+        return self._call(self.retrieve_private_messages_call(labels))
 
-        # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
-        while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
-            if res.status_code == 200:
-                self.bytes_total += len(res.content)
-                return res.content
-            time.sleep(self.poll_delay)
+    def publish_messages(
+            self,
+            messages: Sequence[Tuple[str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Publish many messages, given as (label, message), in one request.
+        """
+        self._call(self.publish_messages_call(messages))
 
+    def retrieve_public_messages(
+            self,
+            keys: Sequence[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve many public messages, given as (sender_id, label), in one request, once they are
+        all on the server.
+        """
+        return self._call(self.retrieve_public_messages_call(keys))
 
     def retrieve_beaver_triplet_shares(
             self,
-            op_id: str
-        ) -> Tuple[int, int, int]:
+            op_id: str,
+            count: Optional[int] = None,
+            shape: Optional[Tuple[int, int, int]] = None
+        ) -> Union[Tuple[int, int, int], Tuple[np.ndarray, np.ndarray, np.ndarray]]:
         """
         Retrieve a triplet of shares generated by the trusted server.
+        With a count, retrieve `count` triplets for the operation, as three arrays (a, b and c), or
+        `count` matrix triples of a shape (m, k, n), see `decode_triplets`.
         """
+        return self._call(self.retrieve_beaver_triplet_shares_call(op_id, count, shape))
 
-        client_id_san = sanitize_url_param(self.client_id)
-        op_id_san = sanitize_url_param(op_id)
+    def retrieve_beaver_triplet_shares_batch(
+            self,
+            op_ids: List[str],
+            count: Optional[int] = None,
+            shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+        ) -> Union[List[Tuple[int, int, int]], List[Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+        """
+        Retrieve the triplets of shares of many operations in a single request, see
+        `retrieve_beaver_triplet_shares`. `shapes` gives the shapes of matrix triples, None for the
+        other operations.
+        """
+        return self._call(self.retrieve_beaver_triplet_shares_batch_call(op_ids, count, shapes))
+
+    def retrieve_triplet_seed(self, run: str) -> Tuple[int, bool]:
+        """
+        Retrieve the seed our triplet shares of a run are expanded from (see `ttp.expand_seed`), and
+        whether we are the participant that retrieves the corrections of its shares of c. `run` is
+        a label every participant of the evaluation gives, see `TrustedParamGenerator.retrieve_seed`.
+        """
+        return self._call(self.retrieve_triplet_seed_call(run))
 
-        url = f"{self.base_url}/shares/{client_id_san}/{op_id_san}"
-        print(f"GET  {url}")
+    def retrieve_triplet_corrections(
+            self,
+            run: str,
+            op_ids: List[str],
+            count: int,
+            shapes: Optional[Sequence[Optional[Tuple[int, int, int]]]] = None
+        ) -> List[np.ndarray]:
+        """
+        Retrieve the corrections of our shares of c for the triplets of many operations expanded
+        from the seeds of a run, see `decode_corrections`.
+        """
+        return self._call(self.retrieve_triplet_corrections_call(run, op_ids, count, shapes))
 
-        res = requests.get(url)
-        self.bytes_total += len(res.content)
-        return tuple(json.loads(res.text)) # type: ignore
+    def retrieve_random_bits(
+            self,
+            op_ids: List[str],
+            count: int,
+            bits: Sequence[int]
+        ) -> List[np.ndarray]:
+        """
+        Retrieve our shares of the random bits of many operations, `bits` of them for each of
+        `count` values, see `decode_random_bits`.
+        """
+        return self._call(self.retrieve_random_bits_call(op_ids, count, bits))
@@ -0,0 +1,57 @@
+"""
+Fixtures shared by the tests.
+"""
+
+import queue
+import threading
+
+import pytest
+
+import server
+from harness import reset_server
+from transport import QueueTransport
+
+
+@pytest.fixture(autouse=True)
+def fresh_server():
+    # The integration tests fork the server from this process, do not leak our state to them.
+    ttp, store = server.ttp, server.store
+    yield
+    server.ttp, server.store = ttp, store
+    server.store.clear()
+    server.sessions.clear()
+    server._sessions_used.clear()
+
+
+@pytest.fixture
+def run_parties():
+    """
+    Run parties in threads, their requests going through queues to the server in another thread:
+    `run_parties(party_class, prot, value_dicts)` returns the parties once they are done, and their
+    results.
+    """
+    def run(party_class, prot, value_dicts):
+        reset_server(prot.participant_ids)
+        queues = [(queue.Queue(), queue.Queue()) for _ in prot.participant_ids]
+        server_thread = threading.Thread(target=server.serve_queues, args=(queues,), daemon=True)
+        server_thread.start()
+
+        parties = [
+            party_class(p_id, "localhost", 0, protocol_spec=prot, value_dict=value_dict, transport=QueueTransport(*pair))
+            for p_id, value_dict, pair in zip(prot.participant_ids, value_dicts, queues)
+        ]
+        results = [None] * len(parties)
+
+        def run_party(index):
+            results[index] = parties[index].run()
+
+        threads = [threading.Thread(target=run_party, args=(index,)) for index in range(len(parties))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        server_thread.join(5)
+        assert not server_thread.is_alive()
+        return parties, results
+
+    return run
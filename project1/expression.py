@@ -9,19 +9,22 @@ Example expression:
 MODIFY THIS FILE.
 """
 
-import base64
+import itertools
 import random
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 
-ID_BYTES = 4
+from secret_sharing import q
 
 
-def gen_id() -> bytes:
-    id_bytes = bytearray(
-        random.getrandbits(8) for _ in range(ID_BYTES)
-    )
-    return base64.b64encode(id_bytes)
+# IDs come from a counter, so they never collide within a process. The counter starts at a random
+# offset, so that expressions built in different processes are unlikely to share IDs either.
+_id_counter = itertools.count(random.getrandbits(32) << 32)
+
+
+def gen_id() -> int:
+    return next(_id_counter)
 
 
 class Expression:
@@ -29,9 +32,11 @@ class Expression:
     Base class for an arithmetic expression.
     """
 
+    __slots__ = ("id",)
+
     def __init__(
             self,
-            id: Optional[bytes] = None
+            id: Optional[int] = None
         ):
         # If ID is not given, then generate one.
         if id is None:
@@ -50,20 +55,25 @@ class Expression:
     def __hash__(self):
         return hash(self.id)
 
-    def getId(self):
-        return int.from_bytes(base64.b64decode(self.id), byteorder='big', signed=False)
+    def getId(self) -> int:
+        return self.id
 
 
     # Feel free to add as many methods as you like.
 
 
 class Scalar(Expression):
-    """Term representing a scalar finite field value."""
+    """
+    Term representing a scalar finite field value, or a vector of values for protocols evaluated
+    over vectors (see `ProtocolSpec.batch_size`).
+    """
+
+    __slots__ = ("value",)
 
     def __init__(
             self,
             value: int,
-            id: Optional[bytes] = None
+            id: Optional[int] = None
         ):
         self.value = value
         super().__init__(id)
@@ -82,10 +92,12 @@ class Scalar(Expression):
 class Secret(Expression):
     """Term representing a secret finite field value (variable)."""
 
+    __slots__ = ("value",)
+
     def __init__(
             self,
             value: Optional[int] = None,
-            id: Optional[bytes] = None
+            id: Optional[int] = None
         ):
         self.value = value
         super().__init__(id)
@@ -101,11 +113,13 @@ class Secret(Expression):
 
 # Feel free to add as many classes as you like.
 class AddOp(Expression):
+    __slots__ = ("a", "b")
+
     def __init__(
             self,
             a: Expression,
             b: Expression,
-            id: Optional[bytes] = None
+            id: Optional[int] = None
         ):
         self.a = a
         self.b = b
@@ -116,11 +130,13 @@ class AddOp(Expression):
 
 
 class SubOp(Expression):
+    __slots__ = ("a", "b")
+
     def __init__(
             self,
             a: Expression,
             b: Expression,
-            id: Optional[bytes] = None
+            id: Optional[int] = None
         ):
         self.a = a
         self.b = b
@@ -131,11 +147,13 @@ class SubOp(Expression):
 
 
 class MultOp(Expression):
+    __slots__ = ("a", "b")
+
     def __init__(
             self,
             a: Expression,
             b: Expression,
-            id: Optional[bytes] = None
+            id: Optional[int] = None
         ):
         self.a = a
         self.b = b
@@ -144,3 +162,689 @@ class MultOp(Expression):
     def __repr__(self):
         return f"{repr(self.a)} * {repr(self.b)}"
 
+
+class LinearCombination(Expression):
+    """
+    constant + sum(coefficient * term), produced by `optimize` out of the linear parts of an
+    expression. The terms are secrets or products of secret-dependent expressions.
+    """
+
+    __slots__ = ("terms", "constant")
+
+    def __init__(
+            self,
+            terms: List[Tuple[int, Expression]],
+            constant: int = 0,
+            id: Optional[int] = None
+        ):
+        self.terms = terms
+        self.constant = constant
+        super().__init__(id)
+
+    def __repr__(self):
+        parts = [f"{coef} * {repr(term)}" for coef, term in self.terms]
+        if self.constant:
+            parts.append(str(self.constant))
+        return f"({' + '.join(parts)})"
+
+
+class MatMulOp(Expression):
+    """
+    Product of a matrix of expressions (m x k, as a list of rows) by another one (k x n).
+
+    Its value is a matrix: use `product[i, j]` for the expression of an entry. The product of two
+    secret matrices takes a single matrix Beaver triple, and opens only the m*k + k*n masked
+    entries of the operands in one round.
+    """
+
+    __slots__ = ("a", "b")
+
+    def __init__(
+            self,
+            a: List[List[Expression]],
+            b: List[List[Expression]],
+            id: Optional[int] = None
+        ):
+        if not a or not b or not a[0] or not b[0]:
+            raise ValueError("Cannot multiply empty matrices")
+        if any(len(row) != len(a[0]) for row in a) or any(len(row) != len(b[0]) for row in b):
+            raise ValueError("The rows of a matrix must all have the same length")
+        if len(a[0]) != len(b):
+            raise ValueError(f"Cannot multiply a {len(a)} x {len(a[0])} matrix by a {len(b)} x {len(b[0])} one")
+        self.a = a
+        self.b = b
+        super().__init__(id)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """
+        (m, k, n) for the product of a m x k matrix by a k x n one.
+        """
+        return len(self.a), len(self.b), len(self.b[0])
+
+    def __getitem__(self, idx: Tuple[int, int]) -> "MatrixEntry":
+        return MatrixEntry(self, *idx)
+
+    def __repr__(self):
+        return f"matmul({repr(self.a)}, {repr(self.b)})"
+
+
+class DotOp(MatMulOp):
+    """
+    Dot product of two vectors of expressions, the product of a 1 x k matrix by a k x 1 one. Like
+    any 1 x 1 product, its value is a scalar.
+    """
+
+    __slots__ = ()
+
+    def __init__(
+            self,
+            a: List[Expression],
+            b: List[Expression],
+            id: Optional[int] = None
+        ):
+        if len(a) != len(b):
+            raise ValueError(f"Cannot compute the dot product of vectors of sizes {len(a)} and {len(b)}")
+        super().__init__([list(a)], [[term] for term in b], id)
+
+    def __repr__(self):
+        return f"dot({repr(self.a[0])}, {repr([row[0] for row in self.b])})"
+
+
+class MatrixEntry(Expression):
+    """Entry (row, col) of the value of a MatMulOp."""
+
+    __slots__ = ("matrix", "row", "col")
+
+    def __init__(
+            self,
+            matrix: MatMulOp,
+            row: int,
+            col: int,
+            id: Optional[int] = None
+        ):
+        m, _, n = matrix.shape
+        if not (0 <= row < m and 0 <= col < n):
+            raise IndexError(f"No entry ({row}, {col}) in a {m} x {n} matrix")
+        self.matrix = matrix
+        self.row = row
+        self.col = col
+        super().__init__(id)
+
+    def __repr__(self):
+        return f"{repr(self.matrix)}[{self.row}, {self.col}]"
+
+
+class RandomBits(Expression):
+    """
+    Shares of `bits` random bits (of each element of the vectors), supplied by the trusted server.
+    Like a matrix, its value is used through its entries, `Bit(random_bits, i)`.
+    """
+
+    __slots__ = ("bits",)
+
+    def __init__(
+            self,
+            bits: int,
+            id: Optional[int] = None
+        ):
+        self.bits = bits
+        super().__init__(id)
+
+    def __repr__(self):
+        return f"random_bits({self.bits})"
+
+
+class Bit(Expression):
+    """
+    Bit i of a value: of a public value, or one of the bits of a RandomBits.
+    """
+
+    __slots__ = ("source", "index")
+
+    def __init__(
+            self,
+            source: Expression,
+            index: int,
+            id: Optional[int] = None
+        ):
+        self.source = source
+        self.index = index
+        super().__init__(id)
+
+    def __repr__(self):
+        return f"{repr(self.source)}[bit {self.index}]"
+
+
+class Reveal(Expression):
+    """
+    Value of a secret-dependent expression, opened to all the participants (it takes one round,
+    together with the Beaver multiplications of the same depth). Only meant for masked values.
+    """
+
+    __slots__ = ("x",)
+
+    def __init__(
+            self,
+            x: Expression,
+            id: Optional[int] = None
+        ):
+        self.x = x
+        super().__init__(id)
+
+    def __repr__(self):
+        return f"reveal({repr(self.x)})"
+
+
+class Comparison(Expression):
+    """
+    Base class of the comparisons of two expressions, whose value is 1 if they hold, 0 otherwise.
+
+    A comparison is computed on the bits of a - b masked by random bits from the trusted server, with
+    a circuit of logarithmic depth in the number of bits: the multiplications of a level are opened
+    together, so a comparison takes O(log(bits)) rounds. `optimize` replaces comparisons by this
+    circuit, it needs a power-of-two modulus.
+    """
+
+    __slots__ = ("a", "b")
+
+    def __init__(
+            self,
+            a: Expression,
+            b: Expression,
+            id: Optional[int] = None
+        ):
+        self.a = a
+        self.b = b
+        super().__init__(id)
+
+    def lower(self, modulus: int) -> Expression:
+        """
+        The circuit computing the comparison mod `modulus`.
+        """
+        raise NotImplementedError
+
+    def _masked_bits(self, modulus: int):
+        # Node factory giving the new nodes ids derived from ours (all the participants must agree
+        # on them), the bits r_i of a random mask and the public bits c_i of c = a - b + r.
+        # Derived ids are negative, so they never collide with the ones of `gen_id`.
+        if modulus & (modulus - 1) != 0:
+            raise ValueError(f"Comparisons need a power-of-two modulus, got {modulus}")
+        bits = modulus.bit_length() - 1
+        ids = itertools.count()
+
+        def new(cls, *args):
+            return cls(*args, id=-((self.id << 16) + next(ids)) - 1)
+
+        mask = new(RandomBits, bits)
+        r_bits = [new(Bit, mask, i) for i in range(bits)]
+        r = new(LinearCombination, [(2**i, r_bit) for i, r_bit in enumerate(r_bits)])
+        c = new(Reveal, new(AddOp, new(SubOp, self.a, self.b), r))
+        c_bits = [new(Bit, c, i) for i in range(bits)]
+        return new, r_bits, c_bits
+
+    @staticmethod
+    def _equal_bit(new, modulus: int, x: Expression, y: Expression) -> Expression:
+        # 1 - (x XOR y) = 1 - x - y + 2xy, for bits x and y
+        return new(LinearCombination, [(modulus - 1, x), (modulus - 1, y), (2, new(MultOp, x, y))], 1)
+
+
+class LessThan(Comparison):
+    """
+    1 if a < b, 0 otherwise, for values seen as signed integers: a - b must be in
+    [-modulus/2, modulus/2), e.g. a and b both in [0, modulus/2).
+    """
+
+    __slots__ = ()
+
+    def lower(self, modulus: int) -> Expression:
+        # a < b is the most significant bit of x = c - r. With c' and r' the other bits of c and r,
+        # it is c_top XOR r_top XOR (c' < r'). c' < r' if, at the most significant bit where c and
+        # r differ, r_i = 1: it is the G of (G, P) pairs (g_i = r_i (1 - c_i), p_i = c_i == r_i)
+        # combined in a tree, (G, P) o (G', P') = (G + P G', P P').
+        new, r_bits, c_bits = self._masked_bits(modulus)
+        pairs = [
+            (new(MultOp, r_bit, new(LinearCombination, [(modulus - 1, c_bit)], 1)), self._equal_bit(new, modulus, c_bit, r_bit))
+            for r_bit, c_bit in zip(r_bits[-2::-1], c_bits[-2::-1])
+        ]
+        while len(pairs) > 1:
+            combined = []
+            for (g_hi, p_hi), (g_lo, p_lo) in zip(pairs[0::2], pairs[1::2]):
+                p = new(MultOp, p_hi, p_lo) if len(pairs) > 2 else None
+                combined.append((new(AddOp, g_hi, new(MultOp, p_hi, g_lo)), p))
+            if len(pairs) % 2:
+                combined.append(pairs[-1])
+            pairs = combined
+
+        top = r_bits[-1]
+        if pairs:
+            # r_top XOR borrow
+            borrow = pairs[0][0]
+            top = new(LinearCombination, [(1, top), (1, borrow), (modulus - 2, new(MultOp, top, borrow))])
+        # c_top XOR top, c_top is public
+        return new(LinearCombination, [(1, c_bits[-1]), (1, top), (modulus - 2, new(MultOp, c_bits[-1], top))])
+
+    def __repr__(self):
+        return f"({repr(self.a)} < {repr(self.b)})"
+
+
+class Equal(Comparison):
+    """
+    1 if a == b, 0 otherwise.
+    """
+
+    __slots__ = ()
+
+    def lower(self, modulus: int) -> Expression:
+        # a == b if all the bits of c = a - b + r are equal to the ones of r: a tree of products
+        new, r_bits, c_bits = self._masked_bits(modulus)
+        factors = [self._equal_bit(new, modulus, c_bit, r_bit) for r_bit, c_bit in zip(r_bits, c_bits)]
+        while len(factors) > 1:
+            products = [new(MultOp, x, y) for x, y in zip(factors[0::2], factors[1::2])]
+            if len(factors) % 2:
+                products.append(factors[-1])
+            factors = products
+        return factors[0]
+
+    def __repr__(self):
+        return f"({repr(self.a)} == {repr(self.b)})"
+
+
+# Linear form of a subexpression while optimizing: (constant, {term id: [coefficient, term]}).
+# Constants and coefficients are ints, or arrays of ints when vector scalars are involved.
+_LinearForm = Tuple[int, Dict[int, list]]
+
+
+def _fold(value, modulus: int) -> int:
+    # Scalar value reduced mod the modulus (as an int, NumPy scalars and 0-d arrays included),
+    # vectors as object arrays so that any modulus is exact
+    if np.ndim(value) == 0:
+        return int(value) % modulus
+    return np.array([int(v) % modulus for v in np.ravel(value)], dtype=object)
+
+
+def _is_zero(value) -> bool:
+    return value == 0 if isinstance(value, int) else not np.any(value)
+
+
+def _is_one(value) -> bool:
+    return value == 1 if isinstance(value, int) else bool(np.all(value == 1))
+
+
+def optimize(expr: Expression, modulus: int = q) -> Expression:
+    """
+    Simplify an expression before evaluating it, without recursion:
+    * scalar-only subtrees are folded into one Scalar (mod the modulus of the protocol),
+    * additions, subtractions and multiplications by a scalar are collapsed into
+      LinearCombination nodes, e.g. `a + a + Scalar(2) * (a - b)` becomes `4 * a + (q - 2) * b`.
+    Only products of two secret-dependent expressions remain, and need a Beaver triplet.
+    Comparisons are replaced by their circuit, see `Comparison`.
+
+    The new nodes reuse the ids of the nodes they replace, so that every participant optimizing the
+    same expression gets the same ids (they label the messages of the protocol).
+    """
+    # Circuit of each comparison, built once
+    lowered: Dict[int, Expression] = dict()
+
+    def children(node: Expression) -> List[Expression]:
+        if not isinstance(node, Comparison):
+            return _children(node)
+        if node.id not in lowered:
+            lowered[node.id] = node.lower(modulus)
+        return [lowered[node.id]]
+
+    # Number of parents of each node: a linear form used once can be updated in place.
+    uses: Dict[int, int] = {expr.id: 1}
+    stack = [expr]
+    seen = {expr.id}
+    while stack:
+        node = stack.pop()
+        for child in children(node):
+            uses[child.id] = uses.get(child.id, 0) + 1
+            if child.id not in seen:
+                seen.add(child.id)
+                stack.append(child)
+
+    forms: Dict[int, _LinearForm] = dict()
+    built: Dict[int, Expression] = dict()
+
+    def take(node: Expression) -> _LinearForm:
+        # Form of a child, that the caller may modify
+        uses[node.id] -= 1
+        if uses[node.id] == 0:
+            return forms.pop(node.id)
+        constant, terms = forms[node.id]
+        return constant, {key: list(term) for key, term in terms.items()}
+
+    def add_into(form: _LinearForm, other: _LinearForm, sign: int) -> _LinearForm:
+        constant, terms = form
+        for key, (coef, term) in other[1].items():
+            if key in terms:
+                terms[key][0] = (terms[key][0] + sign * coef) % modulus
+                if _is_zero(terms[key][0]):
+                    del terms[key]
+            else:
+                terms[key] = [(sign * coef) % modulus, term]
+        return (constant + sign * other[0]) % modulus, terms
+
+    def scale(form: _LinearForm, k: int) -> _LinearForm:
+        if _is_zero(k):
+            return 0, dict()
+        constant, terms = form
+        for term in terms.values():
+            term[0] = term[0] * k % modulus
+        return constant * k % modulus, terms
+
+    def build(node: Expression) -> Expression:
+        # Expression computing the linear form of a node
+        if node.id not in built:
+            constant, terms = forms[node.id]
+            if not terms:
+                built[node.id] = Scalar(constant, id=node.id)
+            elif len(terms) == 1 and _is_zero(constant) and _is_one(next(iter(terms.values()))[0]):
+                built[node.id] = next(iter(terms.values()))[1]
+            else:
+                built[node.id] = LinearCombination(
+                    [(coef, term) for coef, term in terms.values()], constant, id=node.id
+                )
+        return built[node.id]
+
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if node.id in forms:
+            continue
+        if not visited and not isinstance(node, (Scalar, Secret, RandomBits)):
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children(node)))
+            continue
+
+        if isinstance(node, Scalar):
+            form: _LinearForm = (_fold(node.value, modulus), dict())
+        elif isinstance(node, (Secret, RandomBits)):
+            form = (0, {node.id: [1, node]})
+        elif isinstance(node, Comparison):
+            form = take(lowered[node.id])
+        elif isinstance(node, Bit):
+            bit = Bit(build(node.source), node.index, id=node.id)
+            take(node.source)
+            form = (0, {node.id: [1, bit]})
+        elif isinstance(node, Reveal):
+            # Public, but only known once opened: a term of the linear forms above it
+            revealed = Reveal(build(node.x), id=node.id)
+            take(node.x)
+            form = (0, {node.id: [1, revealed]})
+        elif isinstance(node, LinearCombination):
+            form = (_fold(node.constant, modulus), dict())
+            for coef, term in node.terms:
+                form = add_into(form, scale(take(term), coef), 1)
+        elif isinstance(node, (AddOp, SubOp)):
+            form = add_into(take(node.a), forms[node.b.id], 1 if isinstance(node, AddOp) else -1)
+            take(node.b)
+        elif isinstance(node, DotOp) and any(
+                not any(forms[x.id][1] for x in side) for side in (node.a[0], [y for [y] in node.b])
+            ):
+            # One of the vectors is public: the dot product is a linear combination of the other
+            if not any(forms[x.id][1] for x in node.a[0]):
+                pairs = zip(node.a[0], [y for [y] in node.b])
+            else:
+                pairs = zip([y for [y] in node.b], node.a[0])
+            form = (0, dict())
+            for public, term in pairs:
+                form = add_into(form, scale(take(term), take(public)[0]), 1)
+        elif isinstance(node, MatMulOp):
+            # Kept as is (a public matrix is multiplied locally), with the operands optimized. A
+            # 1 x 1 product is a scalar, it may be a term of the linear forms above it.
+            a = [[build(x) for x in row] for row in node.a]
+            b = [[build(x) for x in row] for row in node.b]
+            for child in _children(node):
+                take(child)
+            form = (0, {node.id: [1, MatMulOp(a, b, id=node.id)]})
+        elif isinstance(node, MatrixEntry):
+            entry = MatrixEntry(build(node.matrix), node.row, node.col, id=node.id)
+            take(node.matrix)
+            form = (0, {node.id: [1, entry]})
+        elif isinstance(node, MultOp):
+            a_terms = forms[node.a.id][1]
+            b_terms = forms[node.b.id][1]
+            if not a_terms:
+                form = scale(take(node.b), take(node.a)[0])
+            elif not b_terms:
+                form = scale(take(node.a), take(node.b)[0])
+            else:
+                # Non-linear: keep the product, as a term of the linear forms above it
+                product = MultOp(build(node.a), build(node.b), id=node.id)
+                take(node.a)
+                take(node.b)
+                form = (0, {node.id: [1, product]})
+        else:
+            raise TypeError(f"Cannot optimize expressions of type {type(node).__name__}")
+        forms[node.id] = form
+
+    return build(expr)
+
+
+def _children(node: Expression) -> List[Expression]:
+    if isinstance(node, LinearCombination):
+        return [term for _, term in node.terms]
+    if isinstance(node, MatMulOp):
+        return [x for row in node.a for x in row] + [x for row in node.b for x in row]
+    if isinstance(node, MatrixEntry):
+        return [node.matrix]
+    if isinstance(node, Bit):
+        return [node.source]
+    if isinstance(node, Reveal):
+        return [node.x]
+    if isinstance(node, (AddOp, SubOp, MultOp, Comparison)):
+        return [node.a, node.b]
+    return []
+
+
+# Opcodes of the instructions of a compiled expression
+OP_SCALAR = "scalar"  # public constant
+OP_SECRET = "secret"  # share of a secret input
+OP_ADD = "add"
+OP_SUB = "sub"
+OP_MUL = "mul"        # at most one operand depends on a secret, computed locally
+OP_BEAVER = "beaver"  # both operands depend on a secret, needs a Beaver triplet
+OP_LINEAR = "linear"  # LinearCombination of shares, computed locally
+OP_MATMUL = "matmul"  # matrix product, at most one operand depends on a secret, computed locally
+OP_BEAVER_MATMUL = "beaver_matmul"  # matrix product of two secret-dependent operands, needs a matrix triple
+OP_ENTRY = "entry"    # entry of the result of a matrix product
+OP_RANDOM_BITS = "random_bits"  # shares of random bits from the trusted server
+OP_BIT = "bit"        # bit of a public value, or one of the random bits
+OP_OPEN = "open"      # opening of a secret-dependent value, public
+
+# Opcodes of the instructions that need a Beaver triple, and whose value is a matrix (unless 1 x 1)
+BEAVER_OPS = (OP_BEAVER, OP_BEAVER_MATMUL)
+MATMUL_OPS = (OP_MATMUL, OP_BEAVER_MATMUL)
+# Opcodes of the instructions that take a round of communication
+ROUND_OPS = BEAVER_OPS + (OP_OPEN,)
+
+_BINARY_OPS = {AddOp: OP_ADD, SubOp: OP_SUB, MultOp: OP_MUL}
+
+
+class Instruction:
+    """
+    One step of a compiled expression.
+
+    Attributes:
+        op: opcode, one of the OP_* constants
+        expr: expression node the instruction computes
+        args: indices of the instructions computing the operands
+        has_secret: whether the result depends on a secret (it is a share) or is public
+        level: multiplicative depth, number of Beaver multiplications on the longest path to a leaf
+    """
+
+    __slots__ = ("op", "expr", "args", "has_secret", "level")
+
+    def __init__(
+            self,
+            op: str,
+            expr: Expression,
+            args: Tuple[int, ...],
+            has_secret: bool,
+            level: int
+        ):
+        self.op = op
+        self.expr = expr
+        self.args = args
+        self.has_secret = has_secret
+        self.level = level
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.op}, {self.args}, level={self.level})"
+
+
+class Program:
+    """
+    An expression flattened into a list of instructions in topological order: the operands of an
+    instruction always come before it. A subexpression shared by several nodes appears only once.
+
+    Attributes:
+        instructions: the instructions
+        output: index of the instruction computing the whole expression
+        levels: for each multiplicative depth d, the indices of the Beaver multiplications (scalar
+            or matrix) and openings of depth d, that take one round together
+            (their operands are all of depth < d) and of the other instructions of depth d
+    """
+
+    def __init__(self, instructions: List[Instruction], output: int):
+        self.instructions = instructions
+        self.output = output
+
+        nb_levels = max(ins.level for ins in instructions) + 1
+        self.levels: List[Tuple[List[int], List[int]]] = [([], []) for _ in range(nb_levels)]
+        for idx, ins in enumerate(instructions):
+            self.levels[ins.level][0 if ins.op in ROUND_OPS else 1].append(idx)
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def beaver_layers(self) -> List[List[int]]:
+        """
+        Indices of the Beaver multiplications (scalar or matrix) and openings, grouped by depth
+        (starting at depth 1).
+        """
+        return [beavers for beavers, _ in self.levels[1:]]
+
+    def secrets(self) -> List[Secret]:
+        """
+        The secrets the expression uses.
+        """
+        return [ins.expr for ins in self.instructions if ins.op == OP_SECRET]  # type: ignore
+
+    def random_bits(self) -> List[int]:
+        """
+        Indices of the instructions whose random bits come from the trusted server.
+        """
+        return [idx for idx, ins in enumerate(self.instructions) if ins.op == OP_RANDOM_BITS]
+
+
+def compile_expression(expr: Expression) -> Program:
+    """
+    Compile an expression into a Program, without recursion so that deep expressions are fine.
+    """
+    instructions: List[Instruction] = []
+    # Instruction computing each node, by object identity: the IDs of the nodes are not trusted to be
+    # unique (they can be given explicitly)
+    index: Dict[int, int] = dict()
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if id(node) in index:
+            continue
+
+        if isinstance(node, Scalar):
+            ins = Instruction(OP_SCALAR, node, (), False, 0)
+        elif isinstance(node, Secret):
+            ins = Instruction(OP_SECRET, node, (), True, 0)
+        elif isinstance(node, RandomBits):
+            ins = Instruction(OP_RANDOM_BITS, node, (), True, 0)
+        elif isinstance(node, (Bit, Reveal)):
+            child = node.source if isinstance(node, Bit) else node.x
+            if not visited:
+                stack.append((node, True))
+                stack.append((child, False))
+                continue
+            arg = instructions[index[id(child)]]
+            if isinstance(node, Reveal):
+                ins = Instruction(OP_OPEN, node, (index[id(child)],), False, arg.level + 1)
+            elif arg.has_secret and arg.op != OP_RANDOM_BITS:
+                raise TypeError(f"The bits of a secret value are only available through comparisons: {node!r}")
+            else:
+                ins = Instruction(OP_BIT, node, (index[id(child)],), arg.has_secret, arg.level)
+        elif isinstance(node, Comparison):
+            raise TypeError(f"Comparisons must be replaced by their circuit with `optimize` first: {node!r}")
+        elif isinstance(node, LinearCombination):
+            if not visited:
+                stack.append((node, True))
+                stack.extend((term, False) for _, term in reversed(node.terms))
+                continue
+            args = tuple(index[id(term)] for _, term in node.terms)
+            terms = [instructions[arg] for arg in args]
+            if not terms:
+                raise ValueError("A LinearCombination needs terms")
+            # Public terms are values only known while evaluating, e.g. opened bits
+            has_secret = any(term.has_secret for term in terms)
+            ins = Instruction(OP_LINEAR, node, args, has_secret, max(term.level for term in terms))
+        elif isinstance(node, MatMulOp):
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(_children(node)))
+                continue
+            args = tuple(index[id(child)] for child in _children(node))
+            m, k, n = node.shape
+            a = [instructions[arg] for arg in args[:m * k]]
+            b = [instructions[arg] for arg in args[m * k:]]
+            a_secret = any(x.has_secret for x in a)
+            b_secret = any(x.has_secret for x in b)
+            level = max(x.level for x in a + b)
+            if a_secret and b_secret:
+                ins = Instruction(OP_BEAVER_MATMUL, node, args, True, level + 1)
+            else:
+                ins = Instruction(OP_MATMUL, node, args, a_secret or b_secret, level)
+        elif isinstance(node, MatrixEntry):
+            if not visited:
+                stack.append((node, True))
+                stack.append((node.matrix, False))
+                continue
+            matrix = instructions[index[id(node.matrix)]]
+            ins = Instruction(OP_ENTRY, node, (index[id(node.matrix)],), matrix.has_secret, matrix.level)
+        elif type(node) not in _BINARY_OPS:
+            raise TypeError(f"Cannot compile expressions of type {type(node).__name__}")
+        elif not visited:
+            # Compile the operands first
+            stack.append((node, True))
+            stack.append((node.b, False))
+            stack.append((node.a, False))
+            continue
+        else:
+            a = instructions[index[id(node.a)]]
+            b = instructions[index[id(node.b)]]
+            op = _BINARY_OPS[type(node)]
+            level = max(a.level, b.level)
+            if op == OP_MUL and a.has_secret and b.has_secret:
+                op = OP_BEAVER
+                level += 1
+            ins = Instruction(op, node, (index[id(node.a)], index[id(node.b)]), a.has_secret or b.has_secret, level)
+
+        if ins.op not in (OP_ENTRY, OP_BIT) and any(_is_matrix(instructions[arg]) for arg in ins.args):
+            raise TypeError(f"A matrix cannot be an operand of {node!r}, use its entries product[i, j]")
+
+        index[id(node)] = len(instructions)
+        instructions.append(ins)
+
+    if _is_matrix(instructions[index[id(expr)]]):
+        raise TypeError("The expression is a matrix, compute one of its entries product[i, j]")
+    return Program(instructions, index[id(expr)])
+
+
+def _is_matrix(ins: Instruction) -> bool:
+    # Whether the value of an instruction is a matrix with more than one entry
+    if ins.op == OP_RANDOM_BITS:
+        return ins.expr.bits > 1 # type: ignore
+    if ins.op not in MATMUL_OPS:
+        return False
+    m, _, n = ins.expr.shape # type: ignore
+    return m * n > 1
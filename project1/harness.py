@@ -0,0 +1,81 @@
+"""
+Helpers shared by the tests: the server and the clients run in processes, and the reset of the
+server state for the tests that run it in this process.
+"""
+
+import time
+from multiprocessing import Process, Queue
+
+import server
+from async_smc_party import AsyncSMCParty
+from protocol import ProtocolSpec
+from smc_party import SMCParty
+
+
+def reset_server(participants):
+    # Empty the default session, with a fresh generator of triplets for the participants
+    server.store.clear()
+    server.ttp = server.TrustedParamGenerator(pool_size=16, low_water_mark=4)
+    for p in participants:
+        server.ttp.add_participant(p)
+
+
+def smc_server(args, **kwargs):
+    server.run("localhost", 5000, args, **kwargs)
+
+
+def smc_client(client_id, prot, value_dict, use_async=False):
+    party_class = AsyncSMCParty if use_async else SMCParty
+    cli = party_class(
+        client_id,
+        "localhost",
+        5000,
+        protocol_spec=prot,
+        value_dict=value_dict
+    )
+    return cli.run()
+
+
+def _client_process(client, index, args, queue):
+    queue.put((index, client(*args)))
+
+
+def run_processes(server_args, *client_args, server_kwargs=None, client=smc_client):
+    """
+    Run the server with the participants `server_args` (and the keyword arguments `server_kwargs` of
+    `server.run`), and one process per arguments of `client_args`, calling `client(*args)`.
+    Return the results of the clients, in the order of `client_args`.
+    """
+    queue = Queue()
+
+    server_process = Process(target=smc_server, args=(server_args,), kwargs=server_kwargs or dict())
+    clients = [
+        Process(target=_client_process, args=(client, index, args, queue))
+        for index, args in enumerate(client_args)
+    ]
+
+    server_process.start()
+    time.sleep(3)
+    for process in clients:
+        process.start()
+    for process in clients:
+        process.join()
+    results = dict(queue.get() for _ in clients)
+
+    server_process.terminate()
+    server_process.join()
+    # To "ensure" the workers are dead.
+    time.sleep(2)
+
+    return [results[index] for index in range(len(clients))]
+
+
+def suite(parties, expr, expected):
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants)
+    clients = [(name, prot, value_dict) for name, value_dict in parties.items()]
+
+    results = run_processes(participants, *clients)
+
+    for result in results:
+        assert result == expected
@@ -0,0 +1,260 @@
+"""
+Thread-safe message store of the trusted server.
+"""
+
+import collections
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+Channel = Tuple[str, str]
+
+# Most messages remembered as dropped, so that the store stays bounded without a ttl
+MAX_DROPPED = 2**16
+
+
+class MessageDropped(Exception):
+    """
+    A message expired or was evicted before one of its readers retrieved it: waiting for it would
+    never end.
+    """
+
+
+class MessageStore:
+    """
+    Messages exchanged through the server, grouped in pools ("private", "public") and keyed by
+    channel.
+
+    Requests waiting for a message sleep on a condition of their own channel, so that storing a
+    message only wakes up the requests that wait for it.
+
+    The store can be bounded, so that a long-running server does not keep the messages of past
+    protocols forever. A message that expires or is evicted before all the readers given to `set`
+    retrieved it is remembered (for another `ttl`, and at most `MAX_DROPPED` of them): those readers
+    then get a `MessageDropped` error instead of waiting forever.
+
+    Attributes:
+        ttl: messages older than this many seconds are dropped (default: None, never)
+        max_bytes: when the messages take more bytes than this, the oldest ones are dropped, even
+            if some readers did not retrieve them yet (default: None, no limit)
+        delete_on_consume: drop a message once all the readers given to `set` retrieved it
+            (default: False)
+    """
+
+    def __init__(
+            self,
+            ttl: Optional[float] = None,
+            max_bytes: Optional[int] = None,
+            delete_on_consume: bool = False
+        ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.delete_on_consume = delete_on_consume
+
+        self._pools: Dict[str, Dict[Channel, bytes]] = collections.defaultdict(dict)
+        self._lock = threading.Lock()
+        # Conditions of the channels someone waits for, with their number of waiters
+        self._waiting: Dict[Tuple[str, Channel], Tuple[threading.Condition, int]] = dict()
+
+        # Time of arrival, size and readers that did not retrieve it yet (None if unknown) of each
+        # message, oldest first
+        self._entries: Dict[Tuple[str, Channel], Tuple[float, int, Optional[Set[str]]]] = collections.OrderedDict()
+        self._bytes = 0
+        # Messages dropped before all their readers retrieved them, with the time they were
+        # dropped and those readers, oldest first
+        self._dropped: Dict[Tuple[str, Channel], Tuple[float, Set[str]]] = collections.OrderedDict()
+        self._counters = collections.Counter({"consumed": 0, "expired": 0, "evicted": 0})
+
+    def set(
+            self,
+            pool: str,
+            channel: Channel,
+            data: bytes,
+            readers: Optional[Iterable[str]] = None
+        ) -> None:
+        """
+        Push data to a channel in a given pool and wake up the requests waiting for it.
+        `readers` are the clients that will retrieve the message, see `delete_on_consume`.
+        """
+        key = (pool, channel)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._dropped.pop(key, None)
+            self._pools[pool][channel] = data
+            self._entries[key] = (time.monotonic(), len(data), None if readers is None else set(readers))
+            self._bytes += len(data)
+            self._evict()
+
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                waiting[0].notify_all()
+
+    def get(self, pool: str, channel: Channel, reader: Optional[str] = None) -> Optional[bytes]:
+        """
+        Data of a channel, None if it was not set yet.
+        Raise `MessageDropped` if it was dropped before `reader` retrieved it.
+        """
+        with self._lock:
+            data = self._pools[pool].get(channel)
+            if data is not None:
+                self._consume((pool, channel), reader)
+            else:
+                self._check_dropped((pool, channel), reader)
+            return data
+
+    def wait(
+            self,
+            pool: str,
+            channel: Channel,
+            timeout: float,
+            reader: Optional[str] = None
+        ) -> Optional[bytes]:
+        """
+        Data of a channel, waiting at most `timeout` seconds for it to be set.
+        Raise `MessageDropped` if it was dropped before `reader` retrieved it.
+        """
+        data = self._wait(pool, channel, timeout, reader)
+        if data is not None:
+            with self._lock:
+                self._consume((pool, channel), reader)
+        return data
+
+    def _wait(self, pool: str, channel: Channel, timeout: float, reader: Optional[str]) -> Optional[bytes]:
+        key = (pool, channel)
+        with self._lock:
+            data = self._pools[pool].get(channel)
+            if data is None:
+                self._check_dropped(key, reader)
+            if data is not None or timeout <= 0:
+                return data
+
+            cond, nb_waiters = self._waiting.get(key, (threading.Condition(self._lock), 0))
+            self._waiting[key] = (cond, nb_waiters + 1)
+            try:
+                cond.wait_for(lambda: channel in self._pools[pool], timeout)
+            finally:
+                cond, nb_waiters = self._waiting[key]
+                if nb_waiters == 1:
+                    del self._waiting[key]
+                else:
+                    self._waiting[key] = (cond, nb_waiters - 1)
+            return self._pools[pool].get(channel)
+
+    def wait_all(
+            self,
+            pool: str,
+            channels: List[Channel],
+            timeout: float,
+            reader: Optional[str] = None
+        ) -> Optional[List[bytes]]:
+        """
+        Data of many channels of a pool, waiting at most `timeout` seconds for all of them to be set.
+        None if some are still missing, in which case none of them is consumed.
+        """
+        deadline = time.monotonic() + timeout
+        res = []
+        for channel in channels:
+            data = self._wait(pool, channel, deadline - time.monotonic(), reader)
+            if data is None:
+                return None
+            res.append(data)
+
+        with self._lock:
+            for channel in channels:
+                self._consume((pool, channel), reader)
+        return res
+
+    def clear(self, pools: Optional[Iterable[str]] = None) -> None:
+        """
+        Drop all the messages, or only the ones of some pools.
+        """
+        with self._lock:
+            if pools is None:
+                self._pools.clear()
+                self._entries.clear()
+                self._dropped.clear()
+                self._bytes = 0
+                return
+            pools = set(pools)
+            for key in [key for key in self._entries if key[0] in pools]:
+                self._drop(key)
+            for key in [key for key in self._dropped if key[0] in pools]:
+                del self._dropped[key]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Current number of messages and bytes held, and number of messages dropped so far because
+        they were consumed, expired or evicted to respect `max_bytes`.
+        """
+        with self._lock:
+            self._evict()
+            return {"messages": len(self._entries), "bytes": self._bytes, **self._counters}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _consume(self, key: Tuple[str, Channel], reader: Optional[str]) -> None:
+        # `reader` retrieved a message, drop it if it was the last one to do so (with
+        # delete_on_consume). Must be called with the lock held.
+        if reader is None or key not in self._entries:
+            return
+        readers = self._entries[key][2]
+        if readers is None:
+            return
+        readers.discard(reader)
+        if not readers and self.delete_on_consume:
+            self._drop(key)
+            self._counters["consumed"] += 1
+
+    def _check_dropped(self, key: Tuple[str, Channel], reader: Optional[str]) -> None:
+        # Raise if the message of a channel was dropped before `reader` retrieved it (before any
+        # of its readers if unknown). Must be called with the lock held.
+        dropped = self._dropped.get(key)
+        if dropped is None:
+            return
+        readers = dropped[1]
+        if reader is None or reader in readers:
+            readers.discard(reader) # type: ignore
+            if not readers:
+                del self._dropped[key]
+            raise MessageDropped(f"The message of {key[1]} in {key[0]} was dropped before it was retrieved")
+
+    def _evict(self) -> None:
+        # Drop the expired messages, then the oldest ones while above max_bytes (but never the
+        # newest one), remembering the readers that missed them. Must be called with the lock held.
+        now = time.monotonic()
+        if self.ttl is not None:
+            expiry = now - self.ttl
+            while self._dropped and next(iter(self._dropped.values()))[0] < expiry:
+                self._dropped.popitem(last=False) # type: ignore
+            while self._entries:
+                key, (arrival, _, _) = next(iter(self._entries.items()))
+                if arrival >= expiry:
+                    break
+                self._drop_unread(key, now)
+                self._counters["expired"] += 1
+
+        if self.max_bytes is not None:
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._drop_unread(next(iter(self._entries)), now)
+                self._counters["evicted"] += 1
+
+        while len(self._dropped) > MAX_DROPPED:
+            self._dropped.popitem(last=False) # type: ignore
+
+    def _drop_unread(self, key: Tuple[str, Channel], now: float) -> None:
+        # Drop a message before its readers retrieved it. Must be called with the lock held.
+        readers = self._entries[key][2]
+        self._drop(key)
+        if readers:
+            self._dropped[key] = (now, readers)
+
+    def _drop(self, key: Tuple[str, Channel]) -> None:
+        # Must be called with the lock held.
+        pool, channel = key
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        del self._pools[pool][channel]
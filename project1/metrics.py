@@ -0,0 +1,131 @@
+"""
+Instrumentation of the clients: where a run spends its time and its bytes.
+
+A run of `SMCParty` goes through phases (the PHASE_* names below), and `Metrics` accumulates for
+each of them:
+* time: wall-clock seconds spent in the phase, excluding the phases nested in it (e.g. the
+  triplets fetched lazily while evaluating locally count as triplet_fetch),
+* requests: requests sent to the server,
+* bytes_sent / bytes_received: bodies of the requests and of the responses, and of the messages
+  exchanged directly with the other participants (see `peer_communication.py`),
+* polls: retrieve requests answered before the message was available, to be sent again,
+* wait_time: seconds spent in retrieves until their message arrived (summed over the retrieves of
+  `AsyncCommunication` that wait at the same time).
+
+Work done outside of any phase is counted in PHASE_OTHER. `to_json` exports everything.
+"""
+
+import contextlib
+import json
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+PHASE_SETUP = "setup"                   # session registration, rendezvous with the peers
+PHASE_INPUT_SHARING = "input_sharing"   # sending the shares of our secrets, retrieving the others'
+PHASE_TRIPLETS = "triplet_fetch"        # Beaver triplets and random bits
+PHASE_LOCAL = "local_eval"              # instructions evaluated without communication
+PHASE_BEAVER = "beaver_open"            # rounds opening x-a and y-b (and the comparisons' masks)
+PHASE_RECONSTRUCTION = "reconstruction" # publishing our share of the result, combining the others'
+PHASE_OTHER = "other"
+
+PHASES = [
+    PHASE_SETUP, PHASE_INPUT_SHARING, PHASE_TRIPLETS, PHASE_LOCAL, PHASE_BEAVER, PHASE_RECONSTRUCTION,
+    PHASE_OTHER,
+]
+
+COUNTERS = ["time", "requests", "bytes_sent", "bytes_received", "polls", "wait_time"]
+
+
+class Metrics:
+    """
+    Time, requests, bytes and polls of a client, per phase.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, Dict[str, float]] = {
+            phase: dict.fromkeys(COUNTERS, 0) for phase in PHASES
+        }
+        # Phases entered and not left yet, innermost last, with the time they were (re)started at
+        self._stack: List[List] = []
+
+    @property
+    def current(self) -> str:
+        """
+        The phase the client is in.
+        """
+        return self._stack[-1][0] if self._stack else PHASE_OTHER
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Count the time and the traffic of a block in a phase. Phases may be nested: the outer one is
+        paused meanwhile.
+        """
+        now = time.perf_counter()
+        if self._stack:
+            self._add_time(*self._stack[-1], now)
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._add_time(*self._stack.pop(), now)
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def _add_time(self, name: str, start: float, now: float) -> None:
+        self._stats(name)["time"] += now - start
+
+    def _stats(self, name: Optional[str] = None) -> Dict[str, float]:
+        return self.phases.setdefault(name or self.current, dict.fromkeys(COUNTERS, 0))
+
+    def record_request(self, sent: int, received: int) -> None:
+        """
+        A request to the server, with the sizes of its body and of its response.
+        """
+        stats = self._stats()
+        stats["requests"] += 1
+        stats["bytes_sent"] += sent
+        stats["bytes_received"] += received
+
+    def record_bytes(self, sent: int = 0, received: int = 0) -> None:
+        """
+        Bytes exchanged without a request to the server, directly with another participant.
+        """
+        stats = self._stats()
+        stats["bytes_sent"] += sent
+        stats["bytes_received"] += received
+
+    def record_wait(self, seconds: float, polls: int = 0) -> None:
+        """
+        A retrieve that waited `seconds` for its message, and was answered `polls` times without it.
+        """
+        stats = self._stats()
+        stats["wait_time"] += seconds
+        stats["polls"] += polls
+
+    def total(self) -> Dict[str, float]:
+        """
+        The counters summed over all the phases.
+        """
+        return {counter: sum(stats[counter] for stats in self.phases.values()) for counter in COUNTERS}
+
+    def to_dict(self) -> dict:
+        """
+        {"phases": {phase: counters}, "total": counters}, see the module documentation.
+        """
+        return {
+            "phases": {name: dict(stats) for name, stats in self.phases.items()},
+            "total": self.total(),
+        }
+
+    def to_json(self, path: Optional[str] = None) -> str:
+        """
+        The metrics as JSON, also written to a file if a path is given.
+        """
+        res = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(res)
+        return res
@@ -0,0 +1,271 @@
+"""
+Peer-to-peer communications between the participants.
+
+With `Communication`, every message goes through the server, which carries all the traffic of the
+protocol. `PeerCommunication` sends the messages directly to the other participants instead, over
+TCP connections of their own (with the frames of `transport.TCPTransport`). The server is only
+used to exchange the addresses of the participants (a public message of each, the rendezvous),
+and for the triplets and the sessions.
+"""
+
+import json
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from communication import Communication
+from metrics import PHASE_SETUP
+from transport import encode_frame, read_frame
+
+
+# Label of the public message giving the address a participant listens on
+LABEL_ADDRESS = "_peer_address"
+
+
+class Inbox:
+    """
+    Messages received from the other participants, until they are retrieved: private ones keyed by
+    ("private", label), public ones by ("public", sender_id, label).
+    """
+
+    def __init__(self):
+        self._messages: Dict[tuple, bytes] = dict()
+        self._cond = threading.Condition()
+
+    def put(self, key: tuple, data: bytes) -> None:
+        with self._cond:
+            self._messages[key] = data
+            self._cond.notify_all()
+
+    def take(self, key: tuple, timeout: Optional[float] = None) -> bytes:
+        """
+        Remove a message, waiting for it to arrive. Raise `TimeoutError` if it has not arrived after
+        `timeout` seconds (default: None, wait forever).
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: key in self._messages, timeout):
+                raise TimeoutError(f"message {key} not received after {timeout} s")
+            return self._messages.pop(key)
+
+
+class PeerRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Stores the frames [kind, sender_id, label, message] sent by a participant in the inbox.
+    """
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            fields = read_frame(self.rfile)
+            if fields is None:
+                return
+            kind, sender_id, label, message = fields
+            if kind == b"private":
+                self.server.inbox.put(("private", label.decode()), message) # type: ignore
+            else:
+                self.server.inbox.put(("public", sender_id.decode(), label.decode()), message) # type: ignore
+
+
+class PeerServer(socketserver.ThreadingTCPServer):
+    """
+    Listens for the connections of the other participants, a thread per participant.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], inbox: Inbox):
+        super().__init__(address, PeerRequestHandler)
+        self.inbox = inbox
+
+
+class PeerCommunication(Communication):
+    """
+    Communications that exchange the messages directly with the other participants.
+
+    The first message sent or retrieved starts listening (on an ephemeral port of `listen_host`)
+    and exchanges the addresses through the server. A public message is sent to every other
+    participant, so `bytes_total` counts it once per receiver.
+
+    Attributes:
+        participant_ids: IDs of all the participants, including us
+        listen_host: host to listen on, the others must be able to connect to it (default:
+            "localhost")
+        peer_timeout: how long to wait for a message of another participant before giving up, in
+            seconds (default: 60)
+        other attributes: see `Communication`
+    """
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            participant_ids: Sequence[str],
+            listen_host: str = "localhost",
+            peer_timeout: float = 60.0,
+            **kwargs
+    ):
+        super().__init__(server_host, server_port, client_id, **kwargs)
+        self.participant_ids = list(participant_ids)
+        self.listen_host = listen_host
+        self.peer_timeout = peer_timeout
+        self.inbox = Inbox()
+
+        self._listener: Optional[PeerServer] = None
+        self._addresses: Dict[str, Tuple[str, int]] = dict()
+        self._connections: Dict[str, socket.socket] = dict()
+        self._lock = threading.Lock()
+
+    def connect(self) -> None:
+        """
+        Start listening, and exchange the addresses with the other participants through the server.
+        Done once, by the first message.
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            with self.metrics.phase(PHASE_SETUP):
+                self._listener = PeerServer((self.listen_host, 0), self.inbox)
+                threading.Thread(target=self._listener.serve_forever, daemon=True).start()
+
+                host, port = self._listener.server_address[:2]
+                super().publish_message(LABEL_ADDRESS, json.dumps({"host": host, "port": port}))
+                others = [p_id for p_id in self.participant_ids if p_id != self.client_id]
+                addresses = super().retrieve_public_messages([(p_id, LABEL_ADDRESS) for p_id in others])
+                for p_id, address in zip(others, addresses):
+                    address = json.loads(address)
+                    self._addresses[p_id] = (address["host"], address["port"])
+
+    def close(self) -> None:
+        """
+        Stop listening, and close the connections to the other participants and to the server.
+        """
+        with self._lock:
+            if self._listener is not None:
+                self._listener.shutdown()
+                self._listener.server_close()
+                self._listener = None
+            for connection in self._connections.values():
+                connection.close()
+            self._connections.clear()
+        super().close()
+
+    def _send(self, receiver_id: str, frames: List[bytes]) -> None:
+        # Send frames to a participant, connecting to it the first time
+        self.connect()
+        data = b"".join(frames)
+        self.bytes_total += len(data)
+        self.metrics.record_bytes(sent=len(data))
+        with self._lock:
+            connection = self._connections.get(receiver_id)
+            if connection is None:
+                connection = socket.create_connection(self._addresses[receiver_id])
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._connections[receiver_id] = connection
+            connection.sendall(data)
+
+    def _take(self, key: tuple) -> bytes:
+        self.connect()
+        start = time.perf_counter()
+        data = self.inbox.take(key, self.peer_timeout)
+        self.bytes_total += len(data)
+        self.metrics.record_bytes(received=len(data))
+        self.metrics.record_wait(time.perf_counter() - start)
+        return data
+
+    def _others(self) -> List[str]:
+        return [p_id for p_id in self.participant_ids if p_id != self.client_id]
+
+
+    def send_private_message(
+            self,
+            receiver_id: str,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Send a private message to a participant.
+        """
+        self._send(receiver_id, [encode_frame(["private", self.client_id, label, message])])
+
+
+    def retrieve_private_message(
+            self,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a private message, waiting for it to arrive.
+        """
+        return self._take(("private", label))
+
+
+    def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Send a public message to every other participant.
+        """
+        frame = encode_frame(["public", self.client_id, label, message])
+        for p_id in self._others():
+            self._send(p_id, [frame])
+
+
+    def retrieve_public_message(
+            self,
+            sender_id: str,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a public message of a participant, waiting for it to arrive.
+        """
+        return self._take(("public", sender_id, label))
+
+
+    def send_private_messages(
+            self,
+            messages: Sequence[Tuple[str, str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Send many private messages, given as (receiver_id, label, message), at once to each receiver.
+        """
+        frames: Dict[str, List[bytes]] = dict()
+        for receiver_id, label, message in messages:
+            frames.setdefault(receiver_id, []).append(encode_frame(["private", self.client_id, label, message]))
+        for receiver_id, receiver_frames in frames.items():
+            self._send(receiver_id, receiver_frames)
+
+
+    def retrieve_private_messages(
+            self,
+            labels: Sequence[str]
+        ) -> List[bytes]:
+        """
+        Retrieve many private messages, waiting for all of them.
+        """
+        return [self.retrieve_private_message(label) for label in labels]
+
+
+    def publish_messages(
+            self,
+            messages: Sequence[Tuple[str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Send many public messages, given as (label, message), at once to every other participant.
+        """
+        frames = [encode_frame(["public", self.client_id, label, message]) for label, message in messages]
+        for p_id in self._others():
+            self._send(p_id, frames)
+
+
+    def retrieve_public_messages(
+            self,
+            keys: Sequence[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve many public messages, given as (sender_id, label), waiting for all of them.
+        """
+        return [self.retrieve_public_message(sender_id, label) for sender_id, label in keys]
@@ -1,4 +1,7 @@
+from typing import Optional
+
 from expression import Expression
+from secret_sharing import q
 
 
 class ProtocolSpec:
@@ -7,8 +10,36 @@ class ProtocolSpec:
     Attributes:
         participant_ids: List of IDs of the participating clients
         expr: Expression to be computed
+        batch_size: None to compute a single value, or n to evaluate the expression element-wise
+            over vectors of n values (secrets and scalars are then vectors of size n, a plain int
+            standing for a vector with n times the same value)
+        modulus: modulus of the field of the computation, the server must use the same
+            (2**32 and 2**64 are the fastest, see `secret_sharing.Field`)
+        session_id: None to run in the default session of the server, whose participants are
+            given when it starts, or the ID of a session of its own, created by the participants
+            when they start, so that one server can host many computations at the same time
+        seeded_triplets: expand the shares of the Beaver triplets from a seed given by the server,
+            instead of retrieving them: only one participant then retrieves something per
+            multiplication, the corrections of its shares of c (see `ttp.expand_seed`)
+        peer_to_peer: send the shares and the masked values of the rounds directly to the other
+            participants instead of relaying them through the server, which then only serves the
+            addresses of the participants and the triplets (see `peer_communication.py`)
     """
 
-    def __init__(self, participant_ids: list, expr: Expression):
+    def __init__(
+            self,
+            participant_ids: list,
+            expr: Expression,
+            batch_size: Optional[int] = None,
+            modulus: int = q,
+            session_id: Optional[str] = None,
+            seeded_triplets: bool = False,
+            peer_to_peer: bool = False
+        ):
         self.participant_ids = participant_ids
         self.expr = expr
+        self.batch_size = batch_size
+        self.modulus = modulus
+        self.session_id = session_id
+        self.seeded_triplets = seeded_triplets
+        self.peer_to_peer = peer_to_peer
@@ -2,54 +2,309 @@
 Secret sharing scheme.
 """
 
-from typing import List
+import os
+from typing import List, Optional, Sequence, Tuple, Union
 import numpy as np
 
 #from expression import Secret
 
-q = 2**20 # global variable q
+q = 2**20 # global variable q, the default modulus
 # 2^20 : 1st power of 2 above 10^6
 
+MERSENNE_61 = 2**61 - 1 # prime field with a shift-and-add reduction, see `Field`
+
+
+class Field:
+    """
+    Arithmetic mod `modulus` on NumPy arrays.
+
+    How elements are stored and reduced depends on the modulus:
+    * 2**32 and 2**64: uint32 / uint64 arrays, reduced by the native wrap-around of NumPy integers,
+    * other powers of two up to 2**64: uint64 arrays, wrapping around then masked,
+    * any other modulus up to 2**32: uint64 arrays reduced with `%`, the product of two elements
+      fits in 64 bits. NumPy divides by a constant with a precomputed multiplicative inverse, which
+      measures faster than a Barrett reduction written with NumPy operations.
+    * the Mersenne prime 2**61 - 1: uint64 arrays. As 2**61 = 1 modulo it, a value is reduced by
+      adding its bits above the 61st to the lower ones. Products do not fit in 64 bits, so the
+      elements are split in 32-bit halves, whose partial products are folded back below 2**64.
+    Any other modulus above 2**32 is rejected.
+
+    Attributes:
+        modulus: the modulus, at most 2**64
+        dtype: NumPy dtype of the elements
+        wire_dtype: dtype of the elements on the network (little-endian, 4 or 8 bytes)
+    """
+
+    def __init__(self, modulus: int):
+        if modulus < 2 or modulus > 2**64:
+            raise ValueError(f"The modulus must be between 2 and 2**64, got {modulus}")
+        power_of_two = modulus & (modulus - 1) == 0
+        if modulus > 2**32 and not power_of_two and modulus != MERSENNE_61:
+            raise ValueError(f"A modulus above 2**32 must be a power of two or 2**61 - 1, got {modulus}")
+
+        self.modulus = modulus
+        self.dtype = np.dtype(np.uint32 if modulus == 2**32 else np.uint64)
+        self.wire_dtype = np.dtype("<u4" if modulus <= 2**32 else "<u8")
+
+        # Bit mask of the smaller powers of two, None when the arithmetic of dtype already wraps
+        # around at the modulus.
+        self._mask: Optional[np.uint64] = None
+        if power_of_two and modulus not in (2**32, 2**64):
+            self._mask = np.uint64(modulus - 1)
+        self._power_of_two = power_of_two
+        self._mersenne = modulus == MERSENNE_61
+        self._modulus = np.uint64(modulus % 2**64)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.modulus})"
+
+    def __eq__(self, other):
+        return isinstance(other, Field) and self.modulus == other.modulus
+
+    def __hash__(self):
+        return hash(self.modulus)
+
+    def _reduce(self, values: np.ndarray) -> np.ndarray:
+        # Reduce the result of an operation on reduced elements
+        if self._mask is not None:
+            return values & self._mask
+        if self._power_of_two:
+            return values
+        if self._mersenne:
+            return self._fold(values)
+        return values % self._modulus
+
+    def _fold(self, values: np.ndarray) -> np.ndarray:
+        # Reduce values below 2**64 mod 2**61 - 1: once folded they are below 2**61 + 8, at most
+        # one subtraction away from reduced.
+        values = (values & self._modulus) + (values >> np.uint64(61))
+        return values - self._modulus * (values >= self._modulus)
+
+    def _shift32(self, values: np.ndarray) -> np.ndarray:
+        # values * 2**32 mod 2**61 - 1, for values below 2**62: the bits above the 29th wrap around
+        # to the bottom, below 2**33 + 2**61.
+        return (values >> np.uint64(29)) + ((values & np.uint64(2**29 - 1)) << np.uint64(32))
+
+    def reduce(self, values) -> np.ndarray:
+        """
+        Reduce integers (possibly negative) into an array of field elements.
+        """
+        arr = np.asarray(values)
+        if arr.dtype.kind == "f" and not isinstance(values, np.ndarray):
+            # NumPy turns lists mixing negative and huge ints into floats, keep them exact.
+            arr = np.asarray(values, dtype=object)
+        if arr.dtype.kind in "iub":
+            if self._power_of_two:
+                # Casting to unsigned keeps the value mod 2**64 (2**32 for uint32)
+                return self._reduce(arr.astype(self.dtype))
+            if arr.dtype == np.uint64:
+                return arr % self._modulus
+            return np.mod(arr.astype(np.int64), self.modulus).astype(np.uint64)
+        # Python ints that do not fit in an int64 end up in an object array.
+        return np.array([int(v) % self.modulus for v in arr.ravel()], dtype=self.dtype).reshape(arr.shape)
+
+    def add(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return self._reduce(x + y)
+
+    def sub(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        if self._power_of_two:
+            return self._reduce(x - y)
+        return self._reduce(x + (self._modulus - y))
+
+    def mul(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        if self._mersenne:
+            return self._mul_mersenne(x, y)
+        return self._reduce(x * y)
+
+    def _mul_mersenne(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # x * y = hi * 2**64 + mid * 2**32 + lo, with hi below 2**58, mid below 2**62 and lo below
+        # 2**64. 2**64 = 8 mod p, so the sum of the reduced terms stays below 2**63.
+        low = np.uint64(2**32 - 1)
+        shift = np.uint64(32)
+        x_hi, x_lo = x >> shift, x & low
+        y_hi, y_lo = y >> shift, y & low
+        lo = x_lo * y_lo
+        total = (
+            ((x_hi * y_hi) << np.uint64(3))
+            + self._shift32(x_hi * y_lo + x_lo * y_hi)
+            + (lo & self._modulus) + (lo >> np.uint64(61))
+        )
+        return self._fold(total)
+
+    def sum(self, values: np.ndarray, axis: int = 0) -> np.ndarray:
+        """
+        Sum of elements along an axis (of less than 2**32 elements).
+        """
+        if self._mersenne:
+            # The halves of the elements are summed apart, so that their sums fit in 64 bits
+            low = np.uint64(2**32 - 1)
+            hi = (values >> np.uint64(32)).sum(axis=axis, dtype=self.dtype)
+            lo = (values & low).sum(axis=axis, dtype=self.dtype)
+            return self._fold(self._shift32(hi) + self._fold(lo))
+        return self._reduce(values.sum(axis=axis, dtype=self.dtype))
+
+    def matmul(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Matrix products of x (m x k x w) by y (k x n x w), one per index of the last axis: m x n x w.
+        """
+        if self._power_of_two:
+            # The sums of products may wrap around as well
+            return self._reduce(np.einsum("ikw,kjw->ijw", x, y))
+        return self.sum(self.mul(x[:, :, np.newaxis, :], y[np.newaxis, :, :, :]), axis=1)
+
+    def zeros(self, size: Union[int, Tuple[int, ...]]) -> np.ndarray:
+        return np.zeros(size, dtype=self.dtype)
+
+    def random(
+            self,
+            size: Union[int, Tuple[int, ...]],
+            rng: Optional[np.random.Generator] = None
+        ) -> np.ndarray:
+        """
+        Uniformly random elements, drawn from `rng` (default: a generator of the process, see
+        `make_rng`).
+        """
+        if rng is None:
+            rng = _default_rng
+        return rng.integers(0, self.modulus, size=size, dtype=self.dtype)
+
+
+# Field of the default modulus q
+DEFAULT_FIELD = Field(q)
+
+
+def make_rng(seed: Union[None, int, np.random.SeedSequence] = None) -> np.random.Generator:
+    """
+    Generator of random shares and triplets, to create once and reuse: seeding draws entropy from
+    the OS, which is slow compared to drawing a few values.
+    With a seed, the generator is deterministic, for reproducible benchmarks (the shares are then
+    predictable).
+    """
+    return np.random.Generator(np.random.PCG64DXSM(seed))
+
+
+_default_rng = make_rng()
+
+
+def _reseed_default_rng() -> None:
+    # A forked process would otherwise draw the same values as its parent.
+    global _default_rng
+    _default_rng = make_rng()
+
+
+# Windows has no fork (nor register_at_fork), processes are spawned with a fresh generator.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_default_rng)
+
+
 class Share:
     """
     A secret share in a finite field.
     """
-    
-    def __init__(self, value: int):
+
+    def __init__(self, value: int, field: Field = DEFAULT_FIELD):
         self.value = value
-        self.bn = str(value)
-        
+        self.field = field
+
+    @property
+    def bn(self) -> str:
+        # Only needed when the share is serialized, so build it lazily.
+        return str(self.value)
+
     def __repr__(self):
         # Helps with debugging.
         return f"{self.__class__.__name__}({self.value})"
 
     def __add__(self, other):
-        return Share((self.value + other.value) % q)
+        return Share((self.value + other.value) % self.field.modulus, self.field)
 
     def __sub__(self, other):
-        return Share((self.value - other.value) % q)
+        return Share((self.value - other.value) % self.field.modulus, self.field)
 
     def __mul__(self, other):
-        return Share((self.value * other.value) % q)
+        return Share((self.value * other.value) % self.field.modulus, self.field)
+
+
+class ShareVector:
+    """
+    A vector of secret shares in a finite field, backed by a NumPy array (see `Field`).
 
+    All operations are element-wise in the field.
+    """
+
+    def __init__(self, values, field: Field = DEFAULT_FIELD):
+        self.values = field.reduce(values)
+        self.field = field
+
+    @classmethod
+    def _wrap(cls, values: np.ndarray, field: Field = DEFAULT_FIELD) -> "ShareVector":
+        # Skip the reduction of __init__ for values that are already in the field.
+        vec = cls.__new__(cls)
+        vec.values = values
+        vec.field = field
+        return vec
 
-def share_secret(secret: int, num_shares: int) -> List[Share]:
+    def __repr__(self):
+        # Helps with debugging.
+        return f"{self.__class__.__name__}({self.values.tolist()})"
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, idx: int) -> Share:
+        return Share(int(self.values[idx]), self.field)
+
+    def __add__(self, other):
+        return ShareVector._wrap(self.field.add(self.values, other.values), self.field)
+
+    def __sub__(self, other):
+        return ShareVector._wrap(self.field.sub(self.values, other.values), self.field)
+
+    def __mul__(self, other):
+        return ShareVector._wrap(self.field.mul(self.values, other.values), self.field)
+
+
+def share_secret(
+        secret: int,
+        num_shares: int,
+        field: Field = DEFAULT_FIELD,
+        rng: Optional[np.random.Generator] = None
+    ) -> List[Share]:
     """Generate secret shares."""
-    np.random.seed()
-    s = np.random.randint(0, high=q, size=num_shares)
-    s[0] = (secret - np.sum(s) + s[0]) % q
-    
-    lShare = [Share(s_i) for s_i in s]
-    return lShare
-    
-
-def reconstruct_secret(shares: List[Share]) -> int: 
+    return [shares[0] for shares in share_secrets([secret], num_shares, field, rng)]
+
+
+def share_secrets(
+        secrets: Sequence[int],
+        num_shares: int,
+        field: Field = DEFAULT_FIELD,
+        rng: Optional[np.random.Generator] = None
+    ) -> List[ShareVector]:
+    """
+    Generate secret shares for many secrets at once, with random values drawn from `rng` (see
+    `Field.random`).
+
+    Returns one ShareVector per participant: the i-th element of the j-th vector is the
+    share of the i-th secret that goes to participant j.
+    """
+    s = field.random((num_shares, len(secrets)), rng)
+    # Fix the first share so that each column sums to its secret.
+    s[0] = field.sub(field.reduce(secrets), field.sum(s[1:], axis=0))
+
+    return [ShareVector._wrap(row, field) for row in s]
+
+
+def reconstruct_secret(shares: List[Share]) -> int:
     """Reconstruct the secret from shares."""
-    res = Share(0)
-    for s in shares:
-        res += s
-    return res.value % q
-    
+    modulus = shares[0].field.modulus if shares else q
+    return sum(s.value for s in shares) % modulus
+
+
+def reconstruct_secrets(shares: List[ShareVector]) -> np.ndarray:
+    """Reconstruct many secrets at once from one ShareVector per participant."""
+    field = shares[0].field
+    return field.sum(np.stack([s.values for s in shares]), axis=0)
+
 
 
 # Feel free to add as many methods as you want.
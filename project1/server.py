@@ -3,103 +3,704 @@ Trusted server that should help SMC client to communicate.
 You should not need to change this file.
 """
 
-import collections
+import io
+import socketserver
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote_to_bytes, urlencode
 
-from flask import Flask, request, Response, jsonify
+import numpy as np
+from flask import Flask, abort, request, Response, jsonify
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, make_server
 
-from ttp import TrustedParamGenerator
+from communication import encode_values, pack_envelope, unpack_envelope
+from message_store import MessageDropped, MessageStore
+from secret_sharing import Field, q
+from transport import decode_request, encode_frame, read_frame, TransportResponse
+from ttp import OperationDropped, TrustedParamGenerator
 
 
 environ["WERKZEUG_RUN_MAIN"] = "true"
 app: Flask = Flask("Trusted Third Party Server")
-store: Dict[str, Dict[Tuple[str, str], bytes]] = collections.defaultdict(dict)
+store: MessageStore = MessageStore()
+
+# Upper bound on how long a GET may block waiting for a message (long-poll mode).
+MAX_WAIT = 30.0
+# Session of the participants given to `run`, the one of the routes without a session prefix.
+DEFAULT_SESSION = "default"
 ttp: TrustedParamGenerator = TrustedParamGenerator()
+# Triplets of the sessions created by the participants (see `register_session`), with the time
+# they were last used.
+sessions: Dict[str, TrustedParamGenerator] = dict()
+_sessions_used: Dict[str, float] = dict()
+_sessions_lock = threading.Lock()
+
+
+@app.errorhandler(MessageDropped)
+@app.errorhandler(OperationDropped)
+def dropped(error: Exception):
+    """
+    A message or the shares of an operation were dropped before the client retrieved them: waiting
+    or generating new shares would not help, the protocol has to be run again.
+    """
+    return Response(str(error), status=410)
+
+
+def session_route(rule: str, **options):
+    """
+    Register a view for a rule, in the default session, and under "/sessions/<session_id>" for the
+    other sessions. The view gets the session as a `session_id` argument.
+    """
+    def decorator(view):
+        app.add_url_rule(rule, view_func=view, defaults={"session_id": DEFAULT_SESSION}, **options)
+        app.add_url_rule("/sessions/<session_id>" + rule, view_func=view, **options)
+        return view
+    return decorator
+
+
+@app.route("/sessions/<session_id>", methods=["POST"])
+def register_session(session_id: str):
+    """
+    A participant creates a session. The body is a JSON object with the "participants" of the
+    session and the "modulus" of its triplets.
+    Registering an existing session is a no-op if the participants and the modulus are the same, and
+    a conflict otherwise.
+    """
+    body = request.get_json(force=True)
+    participants = sorted(body["participants"])
+    modulus = int(body.get("modulus", q))
+
+    with _sessions_lock:
+        _expire_sessions()
+        session_ttp = ttp if session_id == DEFAULT_SESSION else sessions.get(session_id)
+        created = session_ttp is None
+        if created:
+            try:
+                session_ttp = TrustedParamGenerator(
+                    ttp.pool_size,
+                    ttp.low_water_mark,
+                    modulus,
+                    delete_on_consume=ttp.delete_on_consume,
+                    ttl=ttp.ttl,
+                    max_operations=ttp.max_operations
+                )
+            except ValueError as e:
+                return Response(str(e), status=400)
+            for participant in participants:
+                session_ttp.add_participant(participant)
+            sessions[session_id] = session_ttp
+        if session_id != DEFAULT_SESSION:
+            _sessions_used[session_id] = time.monotonic()
+
+    if sorted(session_ttp.participant_ids) != participants or session_ttp.field.modulus != modulus:
+        return Response(f"Session {session_id} has other participants or another modulus", status=409)
+    if created:
+        print(f"[ SESSION  ] SESSION {session_id} / PARTICIPANTS {', '.join(participants)}")
+        # Offline phase of the session
+        session_ttp.generate_triplets(session_ttp.pool_size)
+    return Response(status=200)
+
+
+@app.route("/sessions/<session_id>", methods=["DELETE"])
+def end_session(session_id: str):
+    """
+    Drop a session, with its triplets and the messages it still holds.
+    """
+    with _sessions_lock:
+        if session_id not in sessions:
+            return Response(status=404)
+        _drop_session(session_id)
+    return Response(status=200)
 
 
-@app.route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
-def send_private_message(sender_id: str, receiver_id: str, label: str):
+@session_route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
+def send_private_message(sender_id: str, receiver_id: str, label: str, session_id: str):
     """
     The client send a private message to the server.
     """
     print(
         f"[ SEND     ] SENDER {sender_id} / LABEL {label} / RECEIVER {receiver_id}"
     )
-    _set_value("private", (receiver_id, label), request.get_data())
+    _set_value(_pool(session_id, "private"), (receiver_id, label), request.get_data(), [receiver_id])
     return Response(status=200)
 
 
-@app.route("/private/<receiver_id>/<label>", methods=["GET"])
-def retrieve_private_message(receiver_id: str, label: str):
+@session_route("/private/<receiver_id>/<label>", methods=["GET"])
+def retrieve_private_message(receiver_id: str, label: str, session_id: str):
     """
     The client retrieve a private message from the server.
+    With `?wait=<seconds>`, block until the message is available or the delay expires.
     """
-    res = _get_value("private", (receiver_id, label))
+    res = _wait_value(_pool(session_id, "private"), (receiver_id, label), _requested_wait(), receiver_id)
     if res is not None:
         print(f"[ RETRIEVE ] RECEIVER {receiver_id} / LABEL {label}")
         return res, 200
 
-    return Response(status=404)
+    return _not_found()
 
 
-@app.route("/public/<sender_id>/<label>", methods=["POST"])
-def publish_message(sender_id: str, label: str):
+@session_route("/public/<sender_id>/<label>", methods=["POST"])
+def publish_message(sender_id: str, label: str, session_id: str):
     """
     The client publish a public message on the server.
     """
     print(f"[ PUBLISH  ] SENDER {sender_id} / LABEL {label}")
-    _set_value("public", (sender_id, label), request.get_data())
+    readers = _public_readers(session_id, sender_id)
+    _set_value(_pool(session_id, "public"), (sender_id, label), request.get_data(), readers)
     return Response(status=200)
 
 
-@app.route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
-def retrieve_public_message(receiver_id: str, sender_id: str, label: str):
+@session_route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
+def retrieve_public_message(receiver_id: str, sender_id: str, label: str, session_id: str):
     """
     The client retrieve a public message from the server.
+    With `?wait=<seconds>`, block until the message is available or the delay expires.
     """
-    res = _get_value("public", (sender_id, label))
+    res = _wait_value(_pool(session_id, "public"), (sender_id, label), _requested_wait(), receiver_id)
     if res is not None:
         print(
             f"[ RETRIEVE ] RECEIVER {receiver_id}. LABEL {label} / SENDER {sender_id}"
         )
         return res, 200
-    return Response(status=404)
+    return _not_found()
+
+
+@session_route("/batch/private/<sender_id>", methods=["POST"])
+def send_private_messages(sender_id: str, session_id: str):
+    """
+    The client send many private messages at once. The body is an envelope of
+    (receiver_id, label, message) entries.
+    """
+    entries = unpack_envelope(request.get_data(), 3)
+    print(f"[ SEND     ] SENDER {sender_id} / {len(entries)} MESSAGES")
+    pool = _pool(session_id, "private")
+    for receiver_id, label, message in entries:
+        _set_value(pool, (receiver_id.decode(), label.decode()), message, [receiver_id.decode()])
+    return Response(status=200)
+
+
+@session_route("/batch/private/<receiver_id>/retrieve", methods=["POST"])
+def retrieve_private_messages(receiver_id: str, session_id: str):
+    """
+    The client retrieve many private messages at once. The body is an envelope of (label,) entries,
+    the answer an envelope of (message,) entries, sent once all of them are available.
+    """
+    channels = [(receiver_id, label.decode()) for (label,) in unpack_envelope(request.get_data(), 1)]
+    res = store.wait_all(_pool(session_id, "private"), channels, _requested_wait(), receiver_id)
+    if res is not None:
+        print(f"[ RETRIEVE ] RECEIVER {receiver_id} / {len(res)} MESSAGES")
+        return pack_envelope([(message,) for message in res]), 200
+    return _not_found()
+
+
+@session_route("/batch/public/<sender_id>", methods=["POST"])
+def publish_messages(sender_id: str, session_id: str):
+    """
+    The client publish many public messages at once. The body is an envelope of (label, message)
+    entries.
+    """
+    entries = unpack_envelope(request.get_data(), 2)
+    print(f"[ PUBLISH  ] SENDER {sender_id} / {len(entries)} MESSAGES")
+    pool = _pool(session_id, "public")
+    readers = _public_readers(session_id, sender_id)
+    for label, message in entries:
+        _set_value(pool, (sender_id, label.decode()), message, readers)
+    return Response(status=200)
 
 
-@app.route("/shares/<client_id>/<op_id>", methods=["GET"])
-def retrieve_share(client_id: str, op_id: str):
+@session_route("/batch/public/<receiver_id>/retrieve", methods=["POST"])
+def retrieve_public_messages(receiver_id: str, session_id: str):
+    """
+    The client retrieve many public messages at once. The body is an envelope of (sender_id, label)
+    entries, the answer an envelope of (message,) entries, sent once all of them are available.
+    """
+    channels = [
+        (sender_id.decode(), label.decode())
+        for sender_id, label in unpack_envelope(request.get_data(), 2)
+    ]
+    res = store.wait_all(_pool(session_id, "public"), channels, _requested_wait(), receiver_id)
+    if res is not None:
+        print(f"[ RETRIEVE ] RECEIVER {receiver_id} / {len(res)} MESSAGES")
+        return pack_envelope([(message,) for message in res]), 200
+    return _not_found()
+
+
+@session_route("/shares/<client_id>/<op_id>", methods=["GET"])
+def retrieve_share(client_id: str, op_id: str, session_id: str):
     """
     The client retrieve Beaver triplets generated by the server.
+    With `?format=bin`, the shares are sent in the binary wire format instead of JSON.
+    With `?count=n`, the operation gets n triplets (for vector secrets), sent as a_0..a_n-1, b_0.., c_0..
+    With `?count=n&shape=m,k,l` as well, they are matrix triples (A, B and C, flattened, see
+    `TrustedParamGenerator.generate_triplet_vector`).
+    """
+    session_ttp = _session_ttp(session_id)
+    shape = request.args.get("shape")
+    values = _triplet_values(
+        session_ttp,
+        client_id,
+        op_id,
+        request.args.get("count", type=int),
+        tuple(int(dim) for dim in shape.split(",")) if shape else None
+    )
+    if request.args.get("format") == "bin":
+        return _binary_response(values, session_ttp.field)
+    return jsonify([str(value) for value in values]), 200
+
+
+@session_route("/shares/<client_id>", methods=["POST"])
+def retrieve_shares(client_id: str, session_id: str):
+    """
+    The client retrieve the Beaver triplets of many operations at once.
+    The body is a JSON list of op_ids, or of {"op_id": op_id, "shape": [m, k, l]} for matrix
+    triples. The answer is the concatenation of the triplets of each operation, as for a single one
+    (a JSON list, or the binary wire format with `?format=bin`).
+    """
+    session_ttp = _session_ttp(session_id)
+    operations = _requested_operations()
+    count = request.args.get("count", type=int)
+    print(f"[ SHARES   ] CLIENT {client_id} / {len(operations)} TRIPLETS")
+    res = []
+    for op_id, shape in operations:
+        res.extend(_triplet_values(session_ttp, client_id, op_id, count, shape))
+    if request.args.get("format") == "bin":
+        return _binary_response(res, session_ttp.field)
+    return jsonify(res), 200
+
+
+@session_route("/seeds/<client_id>", methods=["GET"])
+def retrieve_seed(client_id: str, session_id: str):
+    """
+    The client retrieve the seed it expands its shares of the Beaver triplets of the run `?run=`
+    from, and whether it has to retrieve corrections of its shares of c (see
+    `TrustedParamGenerator.retrieve_seed`).
     """
-    shares = ttp.retrieve_share(client_id, op_id)
-    return jsonify([share.bn for share in shares]), 200
+    seed, corrected = _session_ttp(session_id).retrieve_seed(client_id, _run())
+    print(f"[ SEED     ] CLIENT {client_id}")
+    return jsonify({"seed": str(seed), "corrected": corrected}), 200
+
+
+@session_route("/corrections/<client_id>", methods=["POST"])
+def retrieve_corrections(client_id: str, session_id: str):
+    """
+    The client retrieve the corrections of its shares of c for the triplets of many operations
+    expanded from the seeds of the run `?run=`. The body is the one of the batch shares route, and
+    `?count=n` gives the number of triplets of each operation. The answer is in the binary wire
+    format.
+    """
+    session_ttp = _session_ttp(session_id)
+    operations = _requested_operations()
+    count = request.args.get("count", default=1, type=int)
+    run = _run()
+    print(f"[ CORRECT  ] CLIENT {client_id} / {len(operations)} TRIPLETS")
+    res = [
+        session_ttp.retrieve_correction(client_id, run, op_id, count, shape).ravel() # type: ignore
+        for op_id, shape in operations
+    ]
+    return Response(
+        encode_values(np.concatenate(res) if res else [], session_ttp.field),
+        status=200,
+        mimetype="application/octet-stream"
+    )
+
+
+@session_route("/bits/<client_id>", methods=["POST"])
+def retrieve_random_bits(client_id: str, session_id: str):
+    """
+    The client retrieve its shares of the random bits of many operations (the masks of the
+    comparisons, see `TrustedParamGenerator.generate_random_bits`). The body is a JSON list of
+    {"op_id": op_id, "bits": b}, and `?count=n` gives the number of values of each operation. The
+    answer is the concatenation of the b x n shares of each operation, in the binary wire format.
+    """
+    session_ttp = _session_ttp(session_id)
+    operations = request.get_json(force=True)
+    count = request.args.get("count", default=1, type=int)
+    print(f"[ BITS     ] CLIENT {client_id} / {len(operations)} OPERATIONS")
+    res = [
+        session_ttp.retrieve_random_bits(client_id, operation["op_id"], count, operation["bits"]).values
+        for operation in operations
+    ]
+    return Response(
+        encode_values(np.concatenate(res) if res else [], session_ttp.field),
+        status=200,
+        mimetype="application/octet-stream"
+    )
 
 
-def _set_value(pool: str, channel: Tuple[str, str], data: bytes) -> None:
+def _requested_operations() -> List[Tuple[str, Optional[Tuple[int, ...]]]]:
+    """
+    Operations whose triplets the client asks for, with their shape for matrix triples (None
+    otherwise), from a JSON body of op_ids or {"op_id": op_id, "shape": [m, k, l]}.
+    """
+    return [
+        (op_id["op_id"], tuple(op_id["shape"])) if isinstance(op_id, dict) else (op_id, None)
+        for op_id in request.get_json(force=True)
+    ]
+
+
+def _run() -> str:
+    """
+    Run of the seeded triplets the client asks for, the request is aborted with a 400 without one.
+    """
+    run = request.args.get("run")
+    if not run:
+        abort(400, "The run of the seeds is missing")
+    return run # type: ignore
+
+
+def _triplet_values(
+        session_ttp: TrustedParamGenerator,
+        client_id: str,
+        op_id: str,
+        count: Optional[int],
+        shape: Optional[Tuple[int, ...]] = None
+    ) -> List[int]:
+    """
+    Shares of the triplet(s) of an operation: a, b, c, or the vectors of a, b and c given a count.
+    """
+    if count is None:
+        return [share.value for share in session_ttp.retrieve_share(client_id, op_id)]
+    shares = session_ttp.retrieve_share_vector(client_id, op_id, count, shape or (1, 1, 1)) # type: ignore
+    return [value for vec in shares for value in vec.values.tolist()]
+
+
+def _binary_response(values: List[int], field: Field) -> Response:
+    """
+    Response holding field elements in the binary wire format.
+    """
+    return Response(encode_values(values, field), status=200, mimetype="application/octet-stream")
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """
+    Size of the message store and of the triplet storage (of the default session and of the
+    others), and how many entries were dropped.
+    """
+    with _sessions_lock:
+        session_ttps = dict(sessions)
+    return jsonify({
+        "store": store.stats(),
+        "ttp": ttp.stats(),
+        "sessions": {session_id: session_ttp.stats() for session_id, session_ttp in session_ttps.items()}
+    }), 200
+
+
+def _session_ttp(session_id: str) -> TrustedParamGenerator:
+    """
+    TTP of a session, the request is aborted with a 404 if there is no such session.
+    """
+    if session_id == DEFAULT_SESSION:
+        return ttp
+    with _sessions_lock:
+        session_ttp = sessions.get(session_id)
+        if session_ttp is not None:
+            _sessions_used[session_id] = time.monotonic()
+    if session_ttp is None:
+        abort(404, f"Unknown session {session_id}")
+    return session_ttp
+
+
+def _expire_sessions() -> None:
+    """
+    Drop the sessions unused for longer than the TTL of the triplets.
+    Must be called with `_sessions_lock` held.
+    """
+    if ttp.ttl is None:
+        return
+    expiry = time.monotonic() - ttp.ttl
+    for session_id in [s_id for s_id, used in _sessions_used.items() if used < expiry]:
+        _drop_session(session_id)
+
+
+def _drop_session(session_id: str) -> None:
+    """
+    Must be called with `_sessions_lock` held.
+    """
+    del sessions[session_id]
+    del _sessions_used[session_id]
+    store.clear([_pool(session_id, "private"), _pool(session_id, "public")])
+
+
+def _pool(session_id: str, kind: str) -> str:
+    """
+    Pool of the store holding the messages of a kind ("private" or "public") of a session.
+    """
+    if session_id == DEFAULT_SESSION:
+        return kind
+    return f"{session_id}/{kind}"
+
+
+def _set_value(
+        pool: str,
+        channel: Tuple[str, str],
+        data: bytes,
+        readers: Optional[Iterable[str]] = None
+    ) -> None:
     """
     Push data to a channel in a given pool and send an event.
+    `readers` are the clients that will retrieve it, it is dropped once they all did.
     """
-    store[pool][channel] = data
+    store.set(pool, channel, data, readers)
 
 
-def _get_value(pool: str, channel: Tuple[str, str]) -> Optional[bytes]:
+def _get_value(pool: str, channel: Tuple[str, str], reader: Optional[str] = None) -> Optional[bytes]:
     """
     Subscribe to a channel in a given pool and get it once ready.
     """
-    if channel not in store[pool]:
-        return None
-    return store[pool][channel]
+    return store.get(pool, channel, reader)
+
+
+def _wait_value(
+        pool: str,
+        channel: Tuple[str, str],
+        timeout: float,
+        reader: Optional[str] = None
+    ) -> Optional[bytes]:
+    """
+    Get the data of a channel, waiting at most `timeout` seconds for it to be set.
+    """
+    return store.wait(pool, channel, timeout, reader)
+
+
+def _public_readers(session_id: str, sender_id: str) -> Optional[List[str]]:
+    """
+    Clients that retrieve the public messages of a sender: all the other participants of the
+    session, None if they are not known.
+    """
+    readers = [p_id for p_id in _session_ttp(session_id).participant_ids if p_id != sender_id]
+    return readers or None
+
+
+def _requested_wait() -> float:
+    """
+    Long-poll delay asked by the client, 0 if it does not want to wait.
+    """
+    try:
+        wait = float(request.args.get("wait", 0))
+    except ValueError:
+        wait = 0
+    return min(max(wait, 0), MAX_WAIT)
+
+
+def _not_found() -> Response:
+    """
+    Message not (yet) available. The header tells the client that we support long-polling, so that
+    it does not need to sleep before asking again.
+    """
+    return Response(status=404, headers={"X-Long-Poll": "1"})
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    HTTP/1.1 lets the clients keep their connections alive between requests. Nagle's algorithm
+    is disabled, otherwise the small responses of a kept-alive connection wait for delayed ACKs.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # Close idle kept-alive connections, so that they do not hold a worker forever.
+    timeout = 30
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server that handles the connections with a fixed number of worker threads.
+
+    With keep-alive, a worker serves one connection until the client closes it (or it stays idle
+    for `KeepAliveRequestHandler.timeout`), so the pool should be larger than the number of
+    connections the parties open at the same time.
+    """
+    multithread = True
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, app: Flask, workers: int, handler=None):
+        super().__init__(host, port, app, handler=handler)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smc-worker")
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def dispatch(
+        method: str,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        body: bytes = b""
+    ) -> TransportResponse:
+    """
+    Answer a request that did not come over HTTP: call the WSGI application with the smallest
+    environ it needs, without parsing or writing HTTP. Returns the status, the body and whether the
+    route long-polls.
+    """
+    wsgi_environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        # WSGI paths are percent-decoded, as latin-1 strings
+        "PATH_INFO": unquote_to_bytes(path).decode("latin-1"),
+        "QUERY_STRING": urlencode(params or {}),
+        "CONTENT_LENGTH": str(len(body)),
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "0",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [int(status.split(" ", 1)[0]), headers]
+        return lambda data: None
+
+    chunks = app.wsgi_app(wsgi_environ, start_response)
+    try:
+        content = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close() # type: ignore
+    status, headers = response
+    return status, content, any(name == "X-Long-Poll" for name, _ in headers)
+
+
+class FrameRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the requests of a `transport.TCPTransport` connection: length-prefixed frames, answered
+    one after the other.
+    """
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            fields = read_frame(self.rfile)
+            if fields is None:
+                return
+            status, content, long_poll = dispatch(*decode_request(fields))
+            self.wfile.write(encode_frame([str(status), b"1" if long_poll else b"0", content]))
 
 
-def run(host: str, port: int, participants: List[str]) -> None:
+class FrameServer(socketserver.ThreadingTCPServer):
     """
-    Register the participants, then run the server.
+    Server of the TCP transport, a thread per connection (a long-polling request blocks its
+    connection).
     """
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve_tcp(host: str, port: int) -> None:
+    """
+    Answer requests sent with `transport.TCPTransport` on a port, forever.
+    """
+    with FrameServer((host, port), FrameRequestHandler) as server:
+        server.serve_forever()
+
+
+def serve_queues(queues: Iterable[Tuple[object, object]]) -> None:
+    """
+    Answer requests sent with `transport.QueueTransport`, given the (requests, responses) queues of
+    each client, until all the clients closed their transport.
+    """
+    def serve(requests, responses):
+        while True:
+            req = requests.get()
+            if req is None:
+                return
+            responses.put(dispatch(*req))
+
+    threads = [threading.Thread(target=serve, args=pair, daemon=True) for pair in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(
+        host: str,
+        port: int,
+        participants: List[str],
+        workers: Optional[int] = None,
+        modulus: int = q,
+        ttl: Optional[float] = 3600.0,
+        max_bytes: Optional[int] = 256 * 2**20,
+        max_operations: Optional[int] = 2**20,
+        seed: Optional[int] = None,
+        transport: str = "http",
+        queues: Iterable[Tuple[object, object]] = ()
+    ) -> None:
+    """
+    Register the participants of the default session, then run the server. The parties of other
+    computations can run them at the same time in sessions of their own, see `register_session`.
+
+    Each connection is handled in a thread of its own, or by a pool of `workers` threads if given.
+    The Beaver triplets are generated mod `modulus`, which must be the one of the protocol.
+
+    Messages and triplets are dropped once all their recipients retrieved them, after `ttl`
+    seconds, or when the store holds more than `max_bytes` bytes of messages (resp. the TTP of a
+    session more than `max_operations` triplets), oldest first. Sessions unused for `ttl` seconds
+    are dropped as well.
+
+    With a `seed`, the triplets of the default session are reproducible, for benchmarks.
+
+    The parties reach the server with the `transport` of their Communication: "http" (default),
+    "tcp" (raw TCP frames on `port`, see `serve_tcp`) or "queue" (the (requests, responses)
+    `queues` of each party, see `serve_queues`).
+    """
+    global store, ttp
+    with _sessions_lock:
+        sessions.clear()
+        _sessions_used.clear()
+    store = MessageStore(ttl=ttl, max_bytes=max_bytes, delete_on_consume=True)
+    ttp = TrustedParamGenerator(
+        ttp.pool_size,
+        ttp.low_water_mark,
+        modulus,
+        delete_on_consume=True,
+        ttl=ttl,
+        max_operations=max_operations,
+        seed=seed
+    )
+
     for participant in participants:
         ttp.add_participant(participant)
-    app.run(host, port, threaded=False, processes=1)
+    # Offline phase: have a first batch of triplets ready before the parties connect.
+    if participants:
+        ttp.generate_triplets(ttp.pool_size)
+
+    if transport == "tcp":
+        serve_tcp(host, port)
+        return
+    if transport == "queue":
+        serve_queues(queues)
+        return
+    if transport != "http":
+        raise ValueError(f"Unknown transport {transport}")
+
+    # Long-polling requests block a thread each, so the server has to be threaded.
+    if workers is None:
+        server = make_server(host, port, app, threaded=True, request_handler=KeepAliveRequestHandler)
+    else:
+        server = PooledWSGIServer(host, port, app, workers, handler=KeepAliveRequestHandler)
+    server.serve_forever()
 
 
 def main(args: List[str]) -> None:
@@ -5,28 +5,50 @@ MODIFY THIS FILE.
 """
 # You might want to import more classes if needed.
 
-import collections
-import json
+import os
 from typing import (
     Dict,
-    Set,
+    List,
+    Optional,
+    Sequence,
     Tuple,
     Union
 )
-from communication import Communication
+import numpy as np
+
+from communication import Communication, decode_values, encode_values
 from expression import (
-    Expression,
-    Secret, Scalar,
-    AddOp, SubOp, MultOp
+    compile_expression,
+    optimize,
+    Instruction,
+    Program,
+    Secret,
+    BEAVER_OPS, OP_ADD, OP_BEAVER, OP_BEAVER_MATMUL, OP_BIT, OP_ENTRY, OP_LINEAR, OP_MATMUL, OP_MUL,
+    OP_OPEN, OP_RANDOM_BITS, OP_SCALAR, OP_SECRET, OP_SUB,
+)
+from metrics import (
+    Metrics,
+    PHASE_BEAVER, PHASE_INPUT_SHARING, PHASE_LOCAL, PHASE_RECONSTRUCTION, PHASE_SETUP, PHASE_TRIPLETS,
 )
+from peer_communication import PeerCommunication
 from protocol import ProtocolSpec
 from secret_sharing import(
-    reconstruct_secret,
-    share_secret,
-    Share,
+    make_rng,
+    reconstruct_secrets,
+    share_secrets,
+    Field,
+    ShareVector,
 )
 
-from ttp import TrustedParamGenerator
+from transport import Transport
+from ttp import expand_seed
+
+
+# Label of the final shares of the result
+LABEL_FINAL = 'computed_shares'
+# Label of the run of the seeded triplets, drawn by the first participant
+LABEL_SEED_RUN = '_seed_run'
+
 
 class SMCParty:
     """
@@ -38,7 +60,20 @@ class SMCParty:
         server_host: hostname of the server
         server_port: port of the server
         protocol_spec (ProtocolSpec): Protocol specification
-        value_dict (dict): Dictionary assigning values to secrets belonging to this client.
+        value_dict (dict): Dictionary assigning values to secrets belonging to this client. With
+            a `batch_size` in the protocol specification, a value may be a sequence of that many
+            values.
+        seed: seed of the generator of our shares, for reproducible benchmarks (default: None,
+            seeded from the OS)
+        transport: how to reach the server (default: None, HTTP), see `transport.py`. With
+            `peer_to_peer` in the protocol specification, only the rendezvous and the triplets
+            go through it.
+
+    Every value of the protocol is handled as a vector of `batch_size` elements (1 without batch
+    size), so that one run evaluates the expression over all of them element-wise.
+
+    `metrics` counts the time, requests and bytes of the runs per phase (see `metrics.py`), e.g.
+    `party.metrics.to_json("metrics.json")` after `run`.
     """
 
     def __init__(
@@ -47,161 +82,526 @@ class SMCParty:
             server_host: str,
             server_port: int,
             protocol_spec: ProtocolSpec,
-            value_dict: Dict[Secret, int]
+            value_dict: Dict[Secret, Union[int, Sequence[int]]],
+            seed: Optional[int] = None,
+            transport: Optional[Transport] = None
         ):
-        self.comm = Communication(server_host, server_port, client_id)
+        self.field = Field(protocol_spec.modulus)
+        self.rng = make_rng(seed)
+        self.metrics = Metrics()
+        self.comm = self.make_communication(server_host, server_port, client_id, protocol_spec, transport)
 
         self.client_id = client_id
         self.protocol_spec = protocol_spec
         self.value_dict = value_dict
-        self.private_shares: Dict[int, Share] = dict() #the key (int) is the id of a Secret
+        self.batch_size = protocol_spec.batch_size or 1
+        self.private_shares: Dict[int, ShareVector] = dict() #the key (int) is the id of a Secret
+        #the key (str) is the op_id of a MultOp, one triplet per element of the vectors
+        self.triplets: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = dict()
+        #the key (str) is the op_id of a RandomBits, bits x batch_size shares
+        self.random_bits: Dict[str, np.ndarray] = dict()
+        #run of our seeded triplets on the server, see `seed_run`
+        self._seed_run: Optional[str] = None
+
+        # The (optimized) expression as a list of instructions, and the result of each of them: a
+        # array of field elements if the result is public, our ShareVector otherwise.
+        self.program: Program = compile_expression(optimize(protocol_spec.expr, protocol_spec.modulus))
+        self.values: List[Union[np.ndarray, ShareVector]] = [None] * len(self.program) # type: ignore
 
-    def run(self) -> int:
+    # Communications with the server (and with the other participants in peer_to_peer mode)
+    def make_communication(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            protocol_spec: ProtocolSpec,
+            transport: Optional[Transport]
+        ) -> Communication:
+        if protocol_spec.peer_to_peer:
+            return PeerCommunication(
+                server_host,
+                server_port,
+                client_id,
+                protocol_spec.participant_ids,
+                field=self.field,
+                session_id=protocol_spec.session_id,
+                transport=transport,
+                metrics=self.metrics
+            )
+        return Communication(
+            server_host,
+            server_port,
+            client_id,
+            field=self.field,
+            session_id=protocol_spec.session_id,
+            transport=transport,
+            metrics=self.metrics
+        )
+
+    def run(self) -> Union[int, np.ndarray]:
         """
-        The method the client use to do the SMC.
+        The method the client use to do the SMC. The connections to the server (and to the other
+        participants) are closed once done.
         """
-        
-        # Generate share
+        try:
+            if self.protocol_spec.session_id is not None:
+                with self.metrics.phase(PHASE_SETUP):
+                    self.comm.register_session(self.protocol_spec.participant_ids, self.protocol_spec.modulus)
+
+            self.evaluate()
+
+            with self.metrics.phase(PHASE_RECONSTRUCTION):
+                # Share, publish_msg
+                own = encode_values(self.result_share().values, self.field)
+                self.comm.publish_message(self.label(LABEL_FINAL), own)
+
+                # Retrieve and combine for final result. Our own share is not fetched back: the server
+                # may drop a message once all its readers got it, and we are not one of them.
+                parts_to_combine = self.comm.retrieve_public_messages([
+                    (participant_id, self.label(LABEL_FINAL)) for participant_id in self.other_participants()
+                ])
+                return self.combine_results([own] + parts_to_combine)
+        finally:
+            self.comm.close()
+
+    # Compute our share of the value of the expression for the inputs of `value_dict`
+    def evaluate(self) -> None:
+        # Generate the shares of our secrets and send them as private msg
+        with self.metrics.phase(PHASE_INPUT_SHARING):
+            messages = self.input_share_messages()
+            if messages:
+                self.comm.send_private_messages(messages)
+
+        with self.metrics.phase(PHASE_TRIPLETS):
+            self.prefetch()
+
+        # Get the shares of the other participants' secrets
+        with self.metrics.phase(PHASE_INPUT_SHARING):
+            secret_ids = self.foreign_secret_ids()
+            if secret_ids:
+                messages = self.comm.retrieve_private_messages([self.label(secret_id) for secret_id in secret_ids])
+                for secret_id, message in zip(secret_ids, messages):
+                    self.store_secret_share(secret_id, message)
+
+        # Multiplications (and openings) of the same depth do not depend on each other: open them
+        # together, so that there is one communication round per level of multiplicative depth.
+        for depth, (beavers, local) in enumerate(self.program.levels):
+            if beavers:
+                with self.metrics.phase(PHASE_BEAVER):
+                    self.open_beaver_layer(depth, beavers)
+            with self.metrics.phase(PHASE_LOCAL):
+                self.evaluate_local(local)
+
+    # Prefetch every Beaver triplet the expression needs in one request, and the random bits of
+    # the comparisons in another
+    def prefetch(self) -> None:
+        op_ids = self.beaver_op_ids()
+        if op_ids:
+            self.triplets.update(zip(op_ids, self.fetch_triplets(op_ids, self.beaver_shapes())))
+
+        bits_ids, bits = self.random_bits_requests()
+        if bits_ids:
+            self.random_bits.update(zip(bits_ids, self.comm.retrieve_random_bits(bits_ids, self.batch_size, bits)))
+
+    # Label of the messages and triplets of a node (given by its id) or of a step of the protocol.
+    # The same in every run, see `StreamingSMCParty` for protocols evaluated many times.
+    def label(self, name: Union[int, str]) -> str:
+        return str(name)
+
+    # Generate the shares of all our secrets at once, keep ours and return the
+    # (receiver_id, label, message) to send to the others
+    def input_share_messages(self) -> List[Tuple[str, str, bytes]]:
         num_shares = len(self.protocol_spec.participant_ids)
-        for (secret,val) in self.value_dict.items():
-            lShares = list(share_secret(val, num_shares)) # generate shares
-            self.private_shares[secret.getId()] = lShares[0]
-        
-            # Send shares as private msg
-            idx = 1
-            for participant_id in [p_id for p_id in self.protocol_spec.participant_ids if p_id != self.client_id]:
-                self.comm.send_private_message(participant_id, str(secret.getId()), str(lShares[idx].value))
-                idx = idx + 1
-        
-        # Process expression
-        res_process = self.process_expression(self.protocol_spec.expr)
-        # Share, publish_msg
-        labelFinal = 'computed_shares'
-        self.comm.publish_message(labelFinal, str(res_process.value))
-        
-        # Retrieve and combine for final result
-        parts_to_combine = []
-        for participant_id in self.protocol_spec.participant_ids:
-            # retrieve
-            part_res = Share(int(self.comm.retrieve_public_message(participant_id, labelFinal)))
-            parts_to_combine.append(part_res)
-        
-        # combine
-        res = reconstruct_secret(parts_to_combine)
+        secrets = list(self.value_dict.keys())
+        if not secrets:
+            return []
+        n = self.batch_size
+        # The vectors of all our secrets end to end, secret i at [i*n, (i+1)*n)
+        lShares = share_secrets(
+            np.concatenate([self.public_value(self.value_dict[secret]) for secret in secrets]),
+            num_shares,
+            self.field,
+            self.rng
+        )
+        for i, secret in enumerate(secrets):
+            self.private_shares[secret.getId()] = ShareVector._wrap(lShares[0].values[i*n:(i+1)*n], self.field)
+
+        messages = []
+        for idx, participant_id in enumerate(self.other_participants(), start=1):
+            for i, secret in enumerate(secrets):
+                messages.append((participant_id, self.label(secret.getId()), encode_values(lShares[idx].values[i*n:(i+1)*n], self.field)))
+        return messages
+
+    def other_participants(self) -> List[str]:
+        return [p_id for p_id in self.protocol_spec.participant_ids if p_id != self.client_id]
+
+    def is_first_participant(self) -> bool:
+        return self.client_id == self.protocol_spec.participant_ids[0]
+
+    # Ids of the secrets of the expression that belong to other participants
+    def foreign_secret_ids(self) -> List[int]:
+        return [
+            secret.getId() for secret in self.program.secrets()
+            if secret.getId() not in self.private_shares
+        ]
+
+    # op_ids of the multiplications that need a Beaver triplet, in the order of the layers
+    def beaver_op_ids(self) -> List[str]:
+        return [
+            self.op_id(idx) for layer in self.program.beaver_layers() for idx in layer
+            if self.program.instructions[idx].op in BEAVER_OPS
+        ]
+
+    # Shapes (m, k, n) of the matrix triples of the Beaver multiplications, in the order of
+    # beaver_op_ids, None for the scalar ones
+    def beaver_shapes(self) -> List[Optional[Tuple[int, int, int]]]:
+        return [
+            self.program.instructions[idx].expr.shape # type: ignore
+            if self.program.instructions[idx].op == OP_BEAVER_MATMUL else None
+            for layer in self.program.beaver_layers() for idx in layer
+            if self.program.instructions[idx].op in BEAVER_OPS
+        ]
+
+    # op_ids of the random bits the expression needs from the server, and their number of bits
+    def random_bits_requests(self) -> Tuple[List[str], List[int]]:
+        indices = self.program.random_bits()
+        return (
+            [self.op_id(idx) for idx in indices],
+            [self.program.instructions[idx].expr.bits for idx in indices] # type: ignore
+        )
 
+    def op_id(self, idx: int) -> str:
+        return self.label(self.program.instructions[idx].expr.getId())
+
+    def store_secret_share(
+            self,
+            secret_id: int,
+            message: bytes
+        ) -> None:
+        share = decode_values(message, self.field)
+        if len(share) != self.batch_size:
+            raise ValueError(f"Got {len(share)} values for secret {secret_id}, expected {self.batch_size}")
+        self.private_shares[secret_id] = ShareVector._wrap(share, self.field)
+
+    # Reconstruct the result from the final shares published by all the participants: an int, or
+    # an array of batch_size results
+    def combine_results(
+            self,
+            messages: List[bytes]
+        ) -> Union[int, np.ndarray]:
+        parts_to_combine = [ShareVector._wrap(decode_values(message, self.field), self.field) for message in messages]
+        res = reconstruct_secrets(parts_to_combine)
+        if self.protocol_spec.batch_size is None:
+            return int(res[0])
         return res
 
-    # Suggestion: To process expressions, make use of the *visitor pattern* like so:
-    def process_expression(
+    # Our share of the value of the whole expression
+    def result_share(self) -> ShareVector:
+        return self.as_share(self.values[self.program.output])
+
+    # A public value (an int or a sequence of batch_size ints) as a vector of field elements
+    def public_value(
             self,
-            expr: Expression,
-            curr_in_mult=False # Check if we are currently in a mult
-        ) -> Share:
-        
-        # if expr is an addition operation:
-        if(isinstance(expr, AddOp)):
-            return self.process_expression(expr.a) + self.process_expression(expr.b)
-        
-        # if expr is a substraction operation:
-        if(isinstance(expr, SubOp)):
-            return self.process_expression(expr.a) - self.process_expression(expr.b)
-
-        # if expr is a multiplication operation:
-        if(isinstance(expr, MultOp)):
-            # We use triplets beavers only if there is a secret in each operand.
-            expr_a_has_secret = self.has_secret(expr.a)
-            expr_b_has_secret = self.has_secret(expr.b)
-
-            if expr_a_has_secret and expr_b_has_secret:
-                x = self.process_expression(expr.a, True)
-                y = self.process_expression(expr.b, True)
-
-                x_min_a, y_min_b, c = self.generate_beavers_shares(x, y, expr)
-
-                # Only add the constant once in the computation (here the first participant)
-                if self.client_id == self.protocol_spec.participant_ids[0]:
-                    return c + x * y_min_b + y * x_min_a - x_min_a * y_min_b
-                else:
-                    return c + x * y_min_b + y * x_min_a
-            
-            else:
-                new_curr_in_mult = curr_in_mult or expr_a_has_secret or expr_b_has_secret
-                return self.process_expression(expr.a, new_curr_in_mult) * self.process_expression(expr.b, new_curr_in_mult)
-
-        # if expr is a secret:
-        if(isinstance(expr, Secret)):
-            sec = self.private_shares.get(expr.getId())
-            if(sec != None): #if the secret is its own
-                return Share(sec.value) # return the value of the secret in a Share
-            else:
+            value: Union[int, Sequence[int], np.ndarray]
+        ) -> np.ndarray:
+        arr = np.asarray(value)
+        if arr.ndim > 1 or (arr.ndim == 1 and len(arr) != self.batch_size):
+            raise ValueError(f"Expected a value or {self.batch_size} values, got shape {arr.shape}")
+        return self.field.reduce(np.broadcast_to(arr, (self.batch_size,)))
+
+    # Share of a public value: only the first participant holds the value, the others hold 0,
+    # so that the value is counted once when the shares are added.
+    def as_share(
+            self,
+            value: Union[np.ndarray, ShareVector]
+        ) -> ShareVector:
+        if isinstance(value, ShareVector):
+            return value
+        if self.is_first_participant():
+            return ShareVector._wrap(value, self.field)
+        return ShareVector._wrap(self.field.zeros(self.batch_size), self.field)
+
+    # Evaluate instructions that do not need any communication, in (topological) order
+    def evaluate_local(
+            self,
+            indices: List[int]
+        ) -> None:
+        for idx in indices:
+            self.values[idx] = self.evaluate_instruction(self.program.instructions[idx])
+
+    def evaluate_instruction(
+            self,
+            ins: Instruction
+        ) -> Union[np.ndarray, ShareVector]:
+
+        if ins.op == OP_SCALAR:
+            return self.public_value(ins.expr.value) # type: ignore
+
+        if ins.op == OP_SECRET:
+            secret_id = ins.expr.getId()
+            if secret_id not in self.private_shares:
                 # get the share sent to you corresponding to the secret
-                sec = self.comm.retrieve_private_message(str(expr.getId()))
-                return Share(int(sec))
-            
-        # if expr is a scalar:
-        if(isinstance(expr,Scalar)):
-            # only the first participant adds the Scalar but every participant multiply the scalar
-            if (self.client_id == self.protocol_spec.participant_ids[0]) or curr_in_mult:
-                return Share(expr.value)
-            else:
-                return Share(0)
-        
-        # Call specialized methods for each expression type, and have these specialized
-        # methods in turn call `process_expression` on their sub-expressions to process
-        # further.
-        pass
-
-    # Recursive search checking if an expr contains a secret
-    def has_secret(
+                with self.metrics.phase(PHASE_INPUT_SHARING):
+                    self.store_secret_share(secret_id, self.comm.retrieve_private_message(self.label(secret_id)))
+            return self.private_shares[secret_id]
+
+        if ins.op == OP_ENTRY:
+            # Entries of a matrix are laid out row-major, each a vector of batch_size values
+            matrix = self.values[ins.args[0]]
+            _, _, n = ins.expr.matrix.shape # type: ignore
+            start = (ins.expr.row * n + ins.expr.col) * self.batch_size # type: ignore
+            if isinstance(matrix, ShareVector):
+                return ShareVector._wrap(matrix.values[start:start + self.batch_size], self.field)
+            return matrix[start:start + self.batch_size]
+
+        if ins.op == OP_RANDOM_BITS:
+            op_id = self.label(ins.expr.getId())
+            if op_id not in self.random_bits:
+                bits = ins.expr.bits # type: ignore
+                with self.metrics.phase(PHASE_TRIPLETS):
+                    self.random_bits[op_id] = self.comm.retrieve_random_bits([op_id], self.batch_size, [bits])[0]
+            return ShareVector._wrap(self.random_bits[op_id].ravel(), self.field)
+
+        if ins.op == OP_BIT:
+            # One of the random bits (laid out like the entries of a matrix), or a bit of a public value
+            source = self.values[ins.args[0]]
+            if isinstance(source, ShareVector):
+                start = ins.expr.index * self.batch_size # type: ignore
+                return ShareVector._wrap(source.values[start:start + self.batch_size], self.field)
+            return (source >> source.dtype.type(ins.expr.index)) & source.dtype.type(1) # type: ignore
+
+        if ins.op == OP_MATMUL:
+            # At most one of the matrices depends on a secret: a local product
+            m, k, n = ins.expr.shape # type: ignore
+            a_args, b_args = ins.args[:m * k], ins.args[m * k:]
+            a = self.matrix(a_args, (m, k), any(self.program.instructions[arg].has_secret for arg in a_args))
+            b = self.matrix(b_args, (k, n), any(self.program.instructions[arg].has_secret for arg in b_args))
+            res = self.field.matmul(a, b).ravel()
+            return ShareVector._wrap(res, self.field) if ins.has_secret else res
+
+        if ins.op == OP_LINEAR:
+            # One vectorized dot product of the coefficients with the terms, a (terms x batch_size)
+            # matrix of our shares (or of public values if none is a share)
+            coefs = np.stack([self.public_value(coef) for coef, _ in ins.expr.terms]) # type: ignore
+            constant = self.public_value(ins.expr.constant) # type: ignore
+            if not ins.has_secret:
+                terms = np.stack([self.values[arg] for arg in ins.args]) # type: ignore
+                return self.field.add(self.field.sum(self.field.mul(coefs, terms), axis=0), constant)
+            terms = np.stack([self.as_share(self.values[arg]).values for arg in ins.args])
+            res = ShareVector._wrap(self.field.sum(self.field.mul(coefs, terms), axis=0), self.field)
+            return res + self.as_share(constant)
+
+        a, b = (self.values[arg] for arg in ins.args)
+        if not ins.has_secret:
+            # Public operands, plain vectors
+            if ins.op == OP_ADD:
+                return self.field.add(a, b) # type: ignore
+            if ins.op == OP_SUB:
+                return self.field.sub(a, b) # type: ignore
+            return self.field.mul(a, b) # type: ignore
+
+        if ins.op == OP_ADD:
+            return self.as_share(a) + self.as_share(b)
+        if ins.op == OP_SUB:
+            return self.as_share(a) - self.as_share(b)
+        if ins.op == OP_MUL:
+            # Every participant multiplies its share by the public value
+            return (
+                (a if isinstance(a, ShareVector) else ShareVector._wrap(a, self.field))
+                * (b if isinstance(b, ShareVector) else ShareVector._wrap(b, self.field))
+            )
+
+        raise ValueError(f"Instruction {ins} cannot be evaluated locally")
+
+    # Compute x*y with Beaver triplets for all the multiplications of a layer at once
+    def open_beaver_layer(
             self,
-            expr : Expression
-        ):
-        if isinstance(expr, Scalar):
-            return False
-        elif isinstance(expr, Secret):
-            return True
-        
-        return self.has_secret(expr.a) or self.has_secret(expr.b)
-
-    # Generate x-a, y-b and c using beavers
-    def generate_beavers_shares(
-            self, 
-            x : Share, 
-            y : Share, 
-            expr : Expression
-        ) -> Tuple[Share, Share, Share]:
-
-        # messages label for public msg will be: "self.client_id + op_id + _x_min_a"
-        op_id = str(expr.getId())
-        a, b, c = self.comm.retrieve_beaver_triplet_shares(op_id)
-        a = int(a)
-        b = int(b)
-        c = int(c)
-        
-        # Compute x-a and y-b
-        x_min_a_share = x - Share(a)
-        y_min_b_share = y - Share(b)
-        
-        # Broadcast shares
-        self.comm.publish_message(self.client_id + op_id + "_x_min_a", str(x_min_a_share.value))
-        self.comm.publish_message(self.client_id + op_id + "_y_min_b", str(y_min_b_share.value))
-
-        # Reconstruct x-a and y-b
-        rebuilt_x_min_a_share = Share(0)
-        rebuilt_y_min_b_share = Share(0)
-        for p_id in self.protocol_spec.participant_ids:
-            x_other = None
-            y_other = None
-
-            # Can be None if the other has not broadcast his/her share yet
-            while(x_other is None):
-                x_other = self.comm.retrieve_public_message(p_id, p_id + op_id + "_x_min_a")
-            
-            while(y_other is None):
-                y_other = self.comm.retrieve_public_message(p_id, p_id + op_id + "_y_min_b")
-
-            rebuilt_x_min_a_share += Share(int(x_other))
-            rebuilt_y_min_b_share += Share(int(y_other))
-
-        return rebuilt_x_min_a_share, rebuilt_y_min_b_share, Share(c)
+            depth: int,
+            layer: List[int]
+        ) -> None:
+        # Broadcast the shares of the whole layer in one message
+        label = self.beaver_label(depth)
+        state, message = self.mask_beaver_layer(layer)
+        self.comm.publish_message(self.client_id + label, message)
+
+        others = self.comm.retrieve_public_messages([(p_id, p_id + label) for p_id in self.other_participants()])
+        self.unmask_beaver_layer(layer, state, others)
+
+    # messages label for public msg will be: "self.client_id + _beaver_ + depth"
+    def beaver_label(self, depth: int) -> str:
+        return self.label(f"_beaver_{depth}")
+
+    # Compute our shares of x-a and y-b for a layer, and the message to broadcast them. The
+    # vectors of the scalar multiplications of the layer are laid end to end, followed by the
+    # masked operands X-A and Y-B of each matrix product, then by our shares of the values to open.
+    def mask_beaver_layer(
+            self,
+            layer: List[int]
+        ) -> Tuple[tuple, bytes]:
+        products = [idx for idx in layer if self.program.instructions[idx].op == OP_BEAVER]
+        instructions = [self.program.instructions[idx] for idx in products]
+        parts = []
+
+        scalar_state = None
+        if products:
+            x = ShareVector._wrap(np.concatenate([self.values[ins.args[0]].values for ins in instructions]), self.field) # type: ignore
+            y = ShareVector._wrap(np.concatenate([self.values[ins.args[1]].values for ins in instructions]), self.field) # type: ignore
+            a, b, c = (
+                ShareVector._wrap(np.concatenate(v), self.field)
+                for v in zip(*[self.get_triplet(self.op_id(idx)) for idx in products])
+            )
 
+            # Compute x-a and y-b
+            x_min_a = x - a
+            y_min_b = y - b
+            scalar_state = (x, y, c, x_min_a, y_min_b)
+            parts += [x_min_a.values, y_min_b.values]
+
+        matmul_states = []
+        for idx in layer:
+            ins = self.program.instructions[idx]
+            if ins.op == OP_BEAVER_MATMUL:
+                m, k, n = ins.expr.shape # type: ignore
+                x_mat = self.matrix(ins.args[:m * k], (m, k), shares=True)
+                y_mat = self.matrix(ins.args[m * k:], (k, n), shares=True)
+                a_mat, b_mat, c_mat = self.get_triplet(self.op_id(idx), (m, k, n))
+                x_min_a_mat = self.field.sub(x_mat, a_mat)
+                y_min_b_mat = self.field.sub(y_mat, b_mat)
+                matmul_states.append((x_mat, y_mat, c_mat, x_min_a_mat, y_min_b_mat))
+                parts += [x_min_a_mat.ravel(), y_min_b_mat.ravel()]
+
+        opens = [idx for idx in layer if self.program.instructions[idx].op == OP_OPEN]
+        open_state = None
+        if opens:
+            open_state = np.concatenate([
+                self.as_share(self.values[self.program.instructions[idx].args[0]]).values for idx in opens
+            ])
+            parts.append(open_state)
+
+        message = encode_values(np.concatenate(parts), self.field)
+        return (scalar_state, matmul_states, open_state), message
+
+    # Reconstruct x-a and y-b (X-A and Y-B) from the messages of the other participants and
+    # compute x*y (X.Y), and the opened values
+    def unmask_beaver_layer(
+            self,
+            layer: List[int],
+            state: tuple,
+            messages: List[bytes]
+        ) -> None:
+        scalar_state, matmul_states, open_state = state
+        others = [decode_values(message, self.field) for message in messages]
+        width = self.batch_size
+        offset = 0
+
+        if scalar_state is not None:
+            x, y, c, x_min_a, y_min_b = scalar_state
+            n = len(x)
+            for other in others:
+                x_min_a += ShareVector._wrap(other[:n], self.field)
+                y_min_b += ShareVector._wrap(other[n:2 * n], self.field)
+            offset = 2 * n
+
+            z = c + x * y_min_b + y * x_min_a
+            # Only add the constant once in the computation (here the first participant)
+            if self.is_first_participant():
+                z -= x_min_a * y_min_b
+
+            products = [idx for idx in layer if self.program.instructions[idx].op == OP_BEAVER]
+            for i, idx in enumerate(products):
+                self.values[idx] = ShareVector._wrap(z.values[i*width:(i+1)*width], self.field)
+
+        matmuls = [idx for idx in layer if self.program.instructions[idx].op == OP_BEAVER_MATMUL]
+        for idx, (x_mat, y_mat, c_mat, x_min_a_mat, y_min_b_mat) in zip(matmuls, matmul_states):
+            split = offset + x_min_a_mat.size
+            end = split + y_min_b_mat.size
+            for other in others:
+                x_min_a_mat = self.field.add(x_min_a_mat, other[offset:split].reshape(x_min_a_mat.shape))
+                y_min_b_mat = self.field.add(y_min_b_mat, other[split:end].reshape(y_min_b_mat.shape))
+            offset = end
+
+            # Same as for scalars: Z = C + X.(Y-B) + (X-A).Y - (X-A).(Y-B)
+            z_mat = self.field.add(
+                self.field.add(c_mat, self.field.matmul(x_mat, y_min_b_mat)),
+                self.field.matmul(x_min_a_mat, y_mat)
+            )
+            if self.is_first_participant():
+                z_mat = self.field.sub(z_mat, self.field.matmul(x_min_a_mat, y_min_b_mat))
+            self.values[idx] = ShareVector._wrap(z_mat.ravel(), self.field)
+
+        if open_state is not None:
+            opened = open_state
+            for other in others:
+                opened = self.field.add(opened, other[offset:offset + len(open_state)])
+            opens = [idx for idx in layer if self.program.instructions[idx].op == OP_OPEN]
+            for i, idx in enumerate(opens):
+                self.values[idx] = opened[i*width:(i+1)*width]
+
+    # Values of instructions as a (rows x cols x batch_size) array, our shares of them if `shares`
+    def matrix(
+            self,
+            args: Sequence[int],
+            shape: Tuple[int, int],
+            shares: bool
+        ) -> np.ndarray:
+        values = [self.as_share(self.values[arg]).values if shares else self.values[arg] for arg in args]
+        return np.stack(values).reshape(*shape, self.batch_size) # type: ignore
+
+    # batch_size triplets of shares of a multiplication (or matrix triples of a given shape), from
+    # the prefetched ones if possible
+    def get_triplet(
+            self,
+            op_id: str,
+            shape: Optional[Tuple[int, int, int]] = None
+        ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        triplet = self.triplets.get(op_id)
+        if triplet is None:
+            triplet = self.fetch_triplets([op_id], [shape])[0]
+        return triplet
+
+    # Triplets of operations (batch_size of them each, or matrix triples for the given shapes),
+    # retrieved from the server or expanded from our seed
+    def fetch_triplets(
+            self,
+            op_ids: List[str],
+            shapes: List[Optional[Tuple[int, int, int]]]
+        ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        with self.metrics.phase(PHASE_TRIPLETS):
+            if not self.protocol_spec.seeded_triplets:
+                return self.comm.retrieve_beaver_triplet_shares_batch(op_ids, self.batch_size, shapes) # type: ignore
+            run = self.seed_run()
+            seed, corrected = self.comm.retrieve_triplet_seed(run)
+            corrections = None
+            if corrected:
+                corrections = self.comm.retrieve_triplet_corrections(run, op_ids, self.batch_size, shapes)
+            return self.expand_triplets(seed, op_ids, shapes, corrections)
+
+    # Run of our seeded triplets: a nonce the first participant draws and publishes, so that all
+    # the participants get the seeds of this evaluation, and only them (see
+    # `TrustedParamGenerator.retrieve_seed`)
+    def seed_run(self) -> str:
+        if self._seed_run is None:
+            if self.is_first_participant():
+                self._seed_run = os.urandom(16).hex()
+                self.comm.publish_message(LABEL_SEED_RUN, self._seed_run)
+            else:
+                first = self.protocol_spec.participant_ids[0]
+                self._seed_run = self.comm.retrieve_public_message(first, LABEL_SEED_RUN).decode()
+        return self._seed_run
+
+    # Expand our shares of the triplets from our seed, replacing the shares of c by the
+    # corrections if we got some
+    def expand_triplets(
+            self,
+            seed: int,
+            op_ids: List[str],
+            shapes: List[Optional[Tuple[int, int, int]]],
+            corrections: Optional[List[np.ndarray]] = None
+        ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        triplets = [
+            expand_seed(self.field, seed, op_id, self.batch_size, shape)
+            for op_id, shape in zip(op_ids, shapes)
+        ]
+        if corrections is not None:
+            triplets = [(a, b, c) for (a, b, _), c in zip(triplets, corrections)]
+        return triplets
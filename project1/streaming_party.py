@@ -0,0 +1,151 @@
+"""
+Streaming version of the SMC client.
+
+`SMCParty` evaluates the expression once. A streaming party evaluates it on every batch of inputs
+of a feed, and keeps a running aggregate of the results: the number of values processed and the
+sum of the values of the expression. The aggregate stays secret-shared between the batches and is
+only opened every `reveal_every` batches.
+"""
+
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from communication import encode_values
+from expression import Secret
+from metrics import PHASE_RECONSTRUCTION, PHASE_SETUP
+from protocol import ProtocolSpec
+from smc_party import SMCParty
+from transport import Transport
+
+
+# Label of the shares of the running aggregate
+LABEL_AGGREGATE = "aggregate"
+
+
+class StreamingSMCParty(SMCParty):
+    """
+    A client that executes an SMC protocol on a stream of inputs.
+
+    Every participant iterates over a feed of value dicts, one per batch (see `SMCParty.value_dict`,
+    each one gives `batch_size` values to our secrets, or one value without batch size). All the
+    feeds must have the same number of batches: a participant without inputs feeds empty dicts.
+
+    The connection to the server is kept across batches, and the triplets of the next `prefetch`
+    batches are retrieved in one request.
+
+    Attributes:
+        reveal_every: cadence of the partial results, in batches (default: 1, after every batch).
+            The aggregate is always revealed after the last batch.
+        prefetch: number of batches whose triplets are retrieved at once (default: 8)
+    """
+
+    def __init__(
+            self,
+            client_id: str,
+            server_host: str,
+            server_port: int,
+            protocol_spec: ProtocolSpec,
+            reveal_every: int = 1,
+            prefetch: int = 8,
+            seed: Optional[int] = None,
+            transport: Optional[Transport] = None
+        ):
+        if reveal_every < 1 or prefetch < 1:
+            raise ValueError("reveal_every and prefetch must be at least 1")
+        super().__init__(client_id, server_host, server_port, protocol_spec, dict(), seed, transport)
+        self.reveal_every = reveal_every
+        self.prefetch_batches = prefetch
+
+        # Index of the current batch, it labels its messages and triplets
+        self.step = 0
+        # Number of values processed, and our share of the sum of the results
+        self.count = 0
+        self.aggregate = self.field.zeros(1)
+
+    def run(self, feed: Iterable[Dict[Secret, Union[int, Sequence[int]]]] = ()) -> Tuple[int, int]:
+        """
+        Process a whole feed, and return the final (count, sum).
+        """
+        res = (0, 0)
+        for res in self.stream(feed):
+            pass
+        return res
+
+    def stream(self, feed: Iterable[Dict[Secret, Union[int, Sequence[int]]]]) -> Iterator[Tuple[int, int]]:
+        """
+        Process the batches of a feed as they come, and yield the aggregate (count, sum) so far every
+        `reveal_every` batches, and after the last one. The connections are closed once the feed is
+        processed (or the iteration stopped).
+        """
+        try:
+            if self.protocol_spec.session_id is not None:
+                with self.metrics.phase(PHASE_SETUP):
+                    self.comm.register_session(self.protocol_spec.participant_ids, self.protocol_spec.modulus)
+
+            revealed = True
+            for value_dict in feed:
+                self.process_batch(value_dict)
+                revealed = self.step % self.reveal_every == 0
+                if revealed:
+                    yield self.count, self.reveal_aggregate()
+            if not revealed:
+                yield self.count, self.reveal_aggregate()
+        finally:
+            self.comm.close()
+
+    # Evaluate the expression on a batch and add the results to our share of the aggregate
+    def process_batch(self, value_dict: Dict[Secret, Union[int, Sequence[int]]]) -> None:
+        self.value_dict = value_dict
+        self.private_shares = dict()
+        self.values = [None] * len(self.program) # type: ignore
+        self.evaluate()
+
+        self.aggregate = self.field.add(self.aggregate, self.field.sum(self.result_share().values)[np.newaxis])
+        self.count += self.batch_size
+
+        # The triplets of this batch are used up
+        for op_id in self.beaver_op_ids():
+            self.triplets.pop(op_id, None)
+        for op_id in self.random_bits_requests()[0]:
+            self.random_bits.pop(op_id, None)
+        self.step += 1
+
+    # Open the aggregate: publish our share of it and add up the others'
+    def reveal_aggregate(self) -> int:
+        with self.metrics.phase(PHASE_RECONSTRUCTION):
+            label = self.label(LABEL_AGGREGATE)
+            own = encode_values(self.aggregate, self.field)
+            self.comm.publish_message(label, own)
+            others = self.comm.retrieve_public_messages([(p_id, label) for p_id in self.other_participants()])
+            # The aggregate is a vector of one value, whatever the batch size
+            return int(np.ravel(self.combine_results([own] + others))[0])
+
+    # Prefetch the triplets and random bits of the next batches, unless we already have the ones
+    # of this batch
+    def prefetch(self) -> None:
+        op_ids = self.beaver_op_ids()
+        bits_ids, _ = self.random_bits_requests()
+        if all(op_id in self.triplets for op_id in op_ids) and all(op_id in self.random_bits for op_id in bits_ids):
+            return
+
+        step = self.step
+        op_ids, shapes, bits_ids, bits = [], [], [], []
+        try:
+            for self.step in range(step, step + self.prefetch_batches):
+                op_ids += self.beaver_op_ids()
+                shapes += self.beaver_shapes()
+                batch_bits_ids, batch_bits = self.random_bits_requests()
+                bits_ids += batch_bits_ids
+                bits += batch_bits
+        finally:
+            self.step = step
+
+        if op_ids:
+            self.triplets.update(zip(op_ids, self.fetch_triplets(op_ids, shapes)))
+        if bits_ids:
+            self.random_bits.update(zip(bits_ids, self.comm.retrieve_random_bits(bits_ids, self.batch_size, bits)))
+
+    # The messages and triplets of each batch are labeled with its index
+    def label(self, name: Union[int, str]) -> str:
+        return f"{name}.{self.step}"
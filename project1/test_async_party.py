@@ -0,0 +1,56 @@
+"""
+Integration tests of the asyncio SMC client, alone and mixed with synchronous clients.
+"""
+
+from expression import Scalar, Secret
+from harness import run_processes
+from protocol import ProtocolSpec
+
+
+def suite(parties, expr, expected, async_parties):
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants)
+    clients = [(name, prot, value_dict, name in async_parties) for name, value_dict in parties.items()]
+
+    results = run_processes(participants, *clients)
+
+    for result in results:
+        assert result == expected
+
+
+def test_async_parties():
+    """
+    f(a, b, c) = (a ∗ b) + (b ∗ c) ∗ K + a
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 3},
+        "Bob": {bob_secret: 14},
+        "Charlie": {charlie_secret: 2}
+    }
+
+    expr = alice_secret * bob_secret + bob_secret * charlie_secret * Scalar(5) + alice_secret
+    expected = 3 * 14 + 14 * 2 * 5 + 3
+    suite(parties, expr, expected, async_parties=["Alice", "Bob", "Charlie"])
+
+
+def test_mixed_parties():
+    """
+    f(a, b, c) = a ∗ b ∗ c + K
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 3},
+        "Bob": {bob_secret: 14},
+        "Charlie": {charlie_secret: 2}
+    }
+
+    expr = alice_secret * bob_secret * charlie_secret + Scalar(7)
+    expected = 3 * 14 * 2 + 7
+    suite(parties, expr, expected, async_parties=["Bob"])
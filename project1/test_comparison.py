@@ -0,0 +1,55 @@
+"""
+Integration tests of comparisons of secrets.
+"""
+
+from expression import Equal, LessThan, Scalar, Secret
+from harness import run_processes, suite
+from protocol import ProtocolSpec
+
+
+def test_less_than():
+    """
+    f(a, b, c) = (a < b) * c + (b < 3), i.e. c if a < b
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 41},
+        "Bob": {bob_secret: 42},
+        "Charlie": {charlie_secret: 10}
+    }
+
+    expr = LessThan(alice_secret, bob_secret) * charlie_secret + LessThan(bob_secret, Scalar(3))
+    suite(parties, expr, 10)
+
+
+def test_comparisons_batch():
+    """
+    f(a, b) = 2 * (a < b) + (a == b), element-wise over vectors of values, in a larger field (in
+    a session of its own, the default one uses q)
+    """
+    a = [5, 7, 0, 1000000, 123456789, -3]
+    b = [7, 7, 0, 999999, 123456789, 2]
+    alice_secret = Secret()
+    bob_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: a},
+        "Bob": {bob_secret: b}
+    }
+
+    expr = Scalar(2) * LessThan(alice_secret, bob_secret) + Equal(alice_secret, bob_secret)
+    expected = [2 * (x < y) + (x == y) for x, y in zip(a, b)]
+
+    participants = list(parties.keys())
+    prot = ProtocolSpec(
+        expr=expr, participant_ids=participants, batch_size=len(a), modulus=2**32,
+        session_id="comparisons"
+    )
+    results = run_processes(participants, *[(name, prot, value_dict) for name, value_dict in parties.items()])
+
+    for result in results:
+        assert result.tolist() == expected
+    print("test_comparisons_batch ok")
@@ -5,7 +5,31 @@ Testing expressions is not obligatory.
 MODIFY THIS FILE.
 """
 
-from expression import Secret, Scalar
+import pickle
+
+import numpy as np
+import pytest
+
+from expression import (
+    compile_expression,
+    optimize,
+    AddOp,
+    DotOp,
+    Equal,
+    LessThan,
+    LinearCombination,
+    MatMulOp,
+    MultOp,
+    Secret,
+    Scalar,
+    OP_BEAVER,
+    OP_BEAVER_MATMUL,
+    OP_MATMUL,
+    OP_MUL,
+    OP_OPEN,
+    OP_RANDOM_BITS,
+)
+from secret_sharing import q
 
 
 # Example test, you can adapt it to your needs.
@@ -64,3 +88,220 @@ def test_new_secret():
     expr = Secret(0)
     assert repr(expr) == "Secret(0)"
     print("test_new_secret ok")
+
+def test_compile_dedup():
+    a = Secret(1)
+    b = Secret(2)
+    ab = a * b
+    expr = ab + ab * Scalar(3) + a
+    program = compile_expression(expr)
+
+    # a, b, ab, Scalar(3), ab * 3, ab + ab * 3, ... + a
+    assert len(program) == 7
+    assert program.secrets() == [a, b]
+    assert program.instructions[program.output].expr is expr
+    # Operands always come first
+    for idx, ins in enumerate(program.instructions):
+        assert all(arg < idx for arg in ins.args)
+    print("test_compile_dedup ok")
+
+def test_compile_same_ids():
+    # Distinct nodes are not merged, even when their IDs collide
+    a = Secret(1)
+    b = Secret(2)
+    expr = MultOp(a, b, id=7) + AddOp(a, b, id=7)
+    program = compile_expression(expr)
+    assert len(program) == 5
+    assert [ins.op for ins in program.instructions].count(OP_BEAVER) == 1
+    print("test_compile_same_ids ok")
+
+def test_compile_levels():
+    a = Secret()
+    b = Secret()
+    c = Secret()
+    expr = (a * b) * c + (b * c) + Scalar(2) * Scalar(3) * a
+    program = compile_expression(expr)
+
+    ops = [program.instructions[idx].op for idx in range(len(program))]
+    assert ops.count(OP_BEAVER) == 3
+    layers = [[program.instructions[idx].expr for idx in layer] for layer in program.beaver_layers()]
+    assert len(layers) == 2
+    assert len(layers[0]) == 2 and len(layers[1]) == 1
+    assert layers[1][0] is expr.a.a
+    # Scalar-only subtrees are public
+    scalars = [ins for ins in program.instructions if ins.op == OP_MUL and not ins.has_secret]
+    assert len(scalars) == 1
+    print("test_compile_levels ok")
+
+def test_compile_deep():
+    # Deep enough to break a recursive compiler
+    a = Secret()
+    b = Secret()
+    expr = a
+    for _ in range(20000):
+        expr = expr * b + Scalar(1)
+    program = compile_expression(expr)
+    assert len(program.beaver_layers()) == 20000
+    print("test_compile_deep ok")
+
+def test_optimize_folds_scalars():
+    expr = Scalar(10)
+    for _ in range(999):
+        expr = expr + Scalar(10)
+    expr = expr * Scalar(3) - Scalar(q)
+    opt = optimize(expr)
+    assert isinstance(opt, Scalar)
+    assert opt.value == 10 * 1000 * 3 % q
+    assert opt.id == expr.id
+    print("test_optimize_folds_scalars ok")
+
+def test_optimize_linear():
+    a = Secret()
+    b = Secret()
+    expr = a + a + Scalar(2) * (a - b) + Scalar(5) - Scalar(1)
+    opt = optimize(expr)
+    assert isinstance(opt, LinearCombination)
+    assert opt.terms == [(4, a), ((-2) % q, b)]
+    assert opt.constant == 4
+    assert compile_expression(opt).beaver_layers() == []
+    print("test_optimize_linear ok")
+
+def test_optimize_keeps_products():
+    a = Secret()
+    b = Secret()
+    c = Secret()
+    ab = a * b
+    expr = Scalar(3) * ab + (a + c) * (b * Scalar(2)) - ab
+    opt = optimize(expr)
+    assert isinstance(opt, LinearCombination)
+    products = [term for _, term in opt.terms]
+    assert [coef for coef, _ in opt.terms] == [2, 1]
+    # The products keep the ids of the original nodes, to get the same triplets everywhere
+    assert products[0].id == ab.id
+    assert products[1].id == expr.a.b.id
+    assert isinstance(products[1].b, LinearCombination) and products[1].b.terms == [(2, b)]
+    assert sum(len(layer) for layer in compile_expression(opt).beaver_layers()) == 2
+    print("test_optimize_keeps_products ok")
+
+def test_optimize_vector_scalars():
+    a = Secret()
+    expr = Scalar([1, 2, 3]) * (a + a) + Scalar(4) - Scalar([0, 1, q])
+    opt = optimize(expr)
+    assert isinstance(opt, LinearCombination)
+    [(coef, term)] = opt.terms
+    assert term is a
+    assert coef.tolist() == [2, 4, 6]
+    assert opt.constant.tolist() == [4, 3, 4]
+    # Coefficients that cancel element-wise drop the term
+    assert isinstance(optimize(Scalar([1, 2]) * a - Scalar([1, 2]) * a), Scalar)
+    # NumPy scalars and 0-d arrays are scalars, not vectors of one value
+    opt = optimize(Scalar(np.int64(3)) * a + Scalar(np.array(q + 2)))
+    assert opt.terms == [(3, a)] and opt.constant == 2 and type(opt.constant) is int
+    print("test_optimize_vector_scalars ok")
+
+def test_matmul_shapes():
+    a = [[Secret(), Secret()], [Secret(), Secret()], [Secret(), Secret()]]
+    b = [[Secret()], [Secret()]]
+    product = MatMulOp(a, b)
+    assert product.shape == (3, 2, 1)
+    assert product[2, 0].matrix is product
+    with pytest.raises(IndexError):
+        product[0, 1]
+    with pytest.raises(ValueError):
+        MatMulOp(a, a)
+    with pytest.raises(ValueError):
+        DotOp([Secret()], [Secret(), Secret()])
+    print("test_matmul_shapes ok")
+
+def test_compile_matmul():
+    x = [Secret() for _ in range(4)]
+    y = [Secret() for _ in range(4)]
+    a = [[Secret() for _ in range(4)] for _ in range(2)]
+    product = MatMulOp(a, [[v] for v in y])
+    expr = DotOp(x, y) * product[1, 0] + MatMulOp([[Scalar(2), Scalar(3)]], [[x[0]], [x[1]]])[0, 0]
+    program = compile_expression(expr)
+
+    ops = [ins.op for ins in program.instructions]
+    assert ops.count(OP_BEAVER_MATMUL) == 2 and ops.count(OP_MATMUL) == 1
+    # The dot product and the matrix product are opened together, then multiplied
+    layers = [[program.instructions[idx].op for idx in layer] for layer in program.beaver_layers()]
+    assert layers == [[OP_BEAVER_MATMUL, OP_BEAVER_MATMUL], [OP_BEAVER]]
+
+    # A matrix is not a scalar
+    with pytest.raises(TypeError):
+        compile_expression(product + x[0])
+    with pytest.raises(TypeError):
+        compile_expression(product)
+    print("test_compile_matmul ok")
+
+def test_optimize_public_dot():
+    x = [Secret() for _ in range(3)]
+    expr = DotOp([Scalar(2), Scalar(0), Scalar(1) + Scalar(1)], x)
+    opt = optimize(expr)
+    assert isinstance(opt, LinearCombination)
+    assert opt.terms == [(2, x[0]), (2, x[2])]
+    # Products of secrets are kept, with the ids of the original nodes
+    dot = DotOp(x, x)
+    assert optimize(dot).id == dot.id
+    assert compile_expression(optimize(dot)).instructions[-1].op == OP_BEAVER_MATMUL
+    print("test_optimize_public_dot ok")
+
+def test_optimize_is_deterministic():
+    a = Secret()
+    b = Secret()
+    expr = (a + b * Scalar(2)) * (a - b) + Scalar(1) * a
+    assert repr(optimize(expr)) == repr(optimize(expr))
+    assert [ins.expr.id for ins in compile_expression(optimize(expr)).instructions] == \
+        [ins.expr.id for ins in compile_expression(optimize(expr)).instructions]
+    print("test_optimize_is_deterministic ok")
+
+def test_ids_are_unique_ints():
+    nodes = [Secret() for _ in range(50000)] + [Scalar(i) for i in range(50000)]
+    ids = [node.getId() for node in nodes]
+    assert all(isinstance(i, int) for i in ids)
+    assert len(set(ids)) == len(ids)
+    assert Secret(id=42).getId() == 42
+    print("test_ids_are_unique_ints ok")
+
+def test_slots_and_pickle():
+    a = Secret(1)
+    expr = (a + Scalar(2)) * a - a
+    for node in [a, expr, expr.a, expr.a.a, expr.a.a.b]:
+        assert not hasattr(node, "__dict__")
+
+    copy = pickle.loads(pickle.dumps(expr))
+    assert repr(copy) == repr(expr)
+    assert copy.getId() == expr.getId()
+    assert copy.b.getId() == a.getId()
+    # The shared node stays shared
+    assert copy.b is copy.a.a.a
+    print("test_slots_and_pickle ok")
+
+def test_compile_comparisons():
+    a = Secret()
+    b = Secret()
+    for bits in (20, 64):
+        for comparison in (LessThan(a, b), Equal(a, b)):
+            program = compile_expression(optimize(comparison, 2**bits))
+            ops = [ins.op for ins in program.instructions]
+            assert ops.count(OP_RANDOM_BITS) == 1 and ops.count(OP_OPEN) == 1
+            # One round to open the masked difference, then a tree of products of the bits
+            rounds = [layer for layer in program.beaver_layers() if layer]
+            assert [program.instructions[idx].op for idx in rounds[0]] == [OP_OPEN]
+            assert len(rounds) <= (bits - 1).bit_length() + 2
+
+    # The comparisons of a level are opened together
+    expr = LessThan(a, b) + Equal(a, b) * LessThan(b, a)
+    program = compile_expression(optimize(expr))
+    assert len([layer for layer in program.beaver_layers() if layer]) == 8
+    assert [program.instructions[idx].op for idx in program.beaver_layers()[0]] == [OP_OPEN] * 3
+
+    # Every participant gets the same ids
+    assert [ins.expr.id for ins in compile_expression(optimize(expr)).instructions] == \
+        [ins.expr.id for ins in program.instructions]
+
+    with pytest.raises(ValueError):
+        optimize(LessThan(a, b), 10**6)
+    with pytest.raises(TypeError):
+        compile_expression(LessThan(a, b))
+    print("test_compile_comparisons ok")
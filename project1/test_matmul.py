@@ -0,0 +1,90 @@
+"""
+Integration tests of dot products and matrix products of secrets.
+"""
+
+import numpy as np
+
+from expression import DotOp, MatMulOp, Scalar, Secret
+from harness import run_processes, suite
+from protocol import ProtocolSpec
+from secret_sharing import q
+
+
+def test_linear_model():
+    """
+    Score of a linear model: f(w, x) = <w, x> + K, w from Alice and x from Bob
+    """
+    weights = [Secret() for _ in range(4)]
+    features = [Secret() for _ in range(4)]
+    w = [3, 1, 4, 1]
+    x = [5, 9, 2, 6]
+
+    parties = {
+        "Alice": dict(zip(weights, w)),
+        "Bob": dict(zip(features, x))
+    }
+
+    expr = DotOp(weights, features) + Scalar(7)
+    expected = sum(wi * xi for wi, xi in zip(w, x)) + 7
+    suite(parties, expr, expected)
+
+
+def test_matrix_product():
+    """
+    f(A, B) = 2 * (A.B)[0, 1] + (A.B)[1, 0] * (P.B)[0, 0], over vectors of 2 values, P public
+    """
+    a_secrets = [[Secret() for _ in range(3)] for _ in range(2)]
+    b_secrets = [[Secret() for _ in range(2)] for _ in range(3)]
+    a = np.arange(6).reshape(2, 3, 1) * np.array([1, 1000])
+    b = np.arange(6, 12).reshape(3, 2, 1) * np.array([1, -1])
+    p = [[1, 2, 3]]
+
+    parties = {
+        "Alice": {s: a[i, j].tolist() for i, row in enumerate(a_secrets) for j, s in enumerate(row)},
+        "Bob": {s: b[i, j].tolist() for i, row in enumerate(b_secrets) for j, s in enumerate(row)},
+        "Charlie": {}
+    }
+
+    product = MatMulOp(a_secrets, b_secrets)
+    public_product = MatMulOp([[Scalar(v) for v in row] for row in p], b_secrets)
+    expr = Scalar(2) * product[0, 1] + product[1, 0] * public_product[0, 0]
+
+    ab = np.einsum("ikw,kjw->ijw", a, b)
+    pb = np.einsum("ik,kjw->ijw", np.array(p), b)
+    expected = (2 * ab[0, 1] + ab[1, 0] * pb[0, 0]) % q
+
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, batch_size=2)
+    results = run_processes(participants, *[(name, prot, value_dict) for name, value_dict in parties.items()])
+
+    for result in results:
+        assert result.tolist() == expected.tolist()
+    print("test_matrix_product ok")
+
+
+def test_seeded_triplets():
+    """
+    f(a, b, c) = <a, b> * c + a[0] * b[1], with the triplets expanded from seeds
+    """
+    a_secrets = [Secret() for _ in range(3)]
+    b_secrets = [Secret() for _ in range(3)]
+    c_secret = Secret()
+    a = [2, 7, 1]
+    b = [8, 2, 8]
+    c = 3
+
+    parties = {
+        "Alice": dict(zip(a_secrets, a)),
+        "Bob": dict(zip(b_secrets, b)),
+        "Charlie": {c_secret: c}
+    }
+
+    expr = DotOp(a_secrets, b_secrets) * c_secret + a_secrets[0] * b_secrets[1]
+    expected = (sum(x * y for x, y in zip(a, b)) * c + a[0] * b[1]) % q
+
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, seeded_triplets=True)
+    results = run_processes(participants, *[(name, prot, value_dict) for name, value_dict in parties.items()])
+
+    assert results == [expected] * len(parties)
+    print("test_seeded_triplets ok")
@@ -0,0 +1,148 @@
+"""
+Unit tests for the message store of the trusted server.
+"""
+
+import threading
+import time
+
+import pytest
+
+from message_store import MessageDropped, MessageStore
+
+
+def test_set_get():
+    store = MessageStore()
+    assert store.get("public", ("Alice", "label")) is None
+    store.set("public", ("Alice", "label"), b"1")
+    store.set("private", ("Alice", "label"), b"2")
+    assert store.get("public", ("Alice", "label")) == b"1"
+    assert store.get("private", ("Alice", "label")) == b"2"
+    assert len(store) == 2
+    store.clear()
+    assert len(store) == 0
+    print("test_set_get ok")
+
+def test_wait_wakes_up_on_set():
+    store = MessageStore()
+    results = []
+
+    def waiter(label):
+        results.append(store.wait("public", ("Alice", label), 5))
+
+    threads = [threading.Thread(target=waiter, args=(label,)) for label in ["a", "a", "b"]]
+    for t in threads:
+        t.start()
+
+    start = time.time()
+    store.set("public", ("Alice", "a"), b"A")
+    store.set("public", ("Alice", "b"), b"B")
+    for t in threads:
+        t.join()
+
+    assert time.time() - start < 2
+    assert sorted(results) == [b"A", b"A", b"B"]
+    # No condition is left behind once nobody waits.
+    assert store._waiting == {}
+    print("test_wait_wakes_up_on_set ok")
+
+def test_wait_timeout():
+    store = MessageStore()
+    start = time.time()
+    assert store.wait("private", ("Bob", "nothing"), 0.2) is None
+    assert time.time() - start >= 0.2
+    assert store._waiting == {}
+    print("test_wait_timeout ok")
+
+def test_delete_on_consume():
+    store = MessageStore(delete_on_consume=True)
+    store.set("public", ("Alice", "x"), b"1", readers=["Bob", "Charlie"])
+    store.set("public", ("Alice", "y"), b"2")
+
+    assert store.get("public", ("Alice", "x"), reader="Bob") == b"1"
+    assert store.wait("public", ("Alice", "x"), 1, reader="Bob") == b"1"
+    # Dropped once every reader got it.
+    assert store.get("public", ("Alice", "x"), reader="Charlie") == b"1"
+    assert store.get("public", ("Alice", "x")) is None
+    # Messages without readers are kept.
+    assert store.get("public", ("Alice", "y"), reader="Bob") == b"2"
+    assert len(store) == 1
+
+    # Nothing is consumed when some of the messages are missing.
+    store.set("private", ("Bob", "a"), b"a", readers=["Bob"])
+    assert store.wait_all("private", [("Bob", "a"), ("Bob", "b")], 0.1, reader="Bob") is None
+    store.set("private", ("Bob", "b"), b"b", readers=["Bob"])
+    assert store.wait_all("private", [("Bob", "a"), ("Bob", "b")], 0.1, reader="Bob") == [b"a", b"b"]
+    assert store.stats() == {"messages": 1, "bytes": 1, "consumed": 3, "expired": 0, "evicted": 0}
+    print("test_delete_on_consume ok")
+
+def test_bounds():
+    store = MessageStore(ttl=0.1)
+    store.set("public", ("Alice", "x"), b"1")
+    time.sleep(0.15)
+    store.set("public", ("Alice", "y"), b"2")
+    assert store.get("public", ("Alice", "x")) is None
+    assert store.get("public", ("Alice", "y")) == b"2"
+    assert store.stats()["expired"] == 1
+
+    store = MessageStore(max_bytes=4)
+    for label in "abc":
+        store.set("public", ("Alice", label), b"12")
+    # The oldest message goes first, but the newest one is kept even when too large.
+    assert store.get("public", ("Alice", "a")) is None
+    assert store.get("public", ("Alice", "c")) == b"12"
+    store.set("public", ("Alice", "d"), b"123456")
+    assert len(store) == 1
+    assert store.stats() == {"messages": 1, "bytes": 6, "consumed": 0, "expired": 0, "evicted": 3}
+    print("test_bounds ok")
+
+def test_dropped_unread():
+    store = MessageStore(ttl=0.1)
+    store.set("public", ("Alice", "x"), b"1", readers=["Bob", "Charlie"])
+    assert store.get("public", ("Alice", "x"), reader="Bob") == b"1"
+    time.sleep(0.15)
+    assert store.stats()["expired"] == 1
+    # Charlie would wait forever for the expired message, Bob already has it
+    with pytest.raises(MessageDropped):
+        store.wait("public", ("Alice", "x"), 1, reader="Charlie")
+    assert store.wait("public", ("Alice", "x"), 0.1, reader="Charlie") is None
+    store.set("public", ("Alice", "y"), b"2", readers=["Bob"])
+    time.sleep(0.15)
+    store.set("public", ("Alice", "z"), b"3")
+    with pytest.raises(MessageDropped):
+        store.wait_all("public", [("Alice", "y")], 1, reader="Bob")
+    # A new message on the channel is not affected
+    store.set("public", ("Alice", "x"), b"3", readers=["Charlie"])
+    assert store.get("public", ("Alice", "x"), reader="Charlie") == b"3"
+
+    # Messages evicted to respect max_bytes fail the same way
+    store = MessageStore(max_bytes=4)
+    store.set("public", ("Alice", "a"), b"12", readers=["Bob"])
+    store.set("public", ("Alice", "b"), b"12")
+    store.set("public", ("Alice", "c"), b"12")
+    with pytest.raises(MessageDropped):
+        store.get("public", ("Alice", "a"), reader="Bob")
+    assert store.get("public", ("Alice", "b")) == b"12"
+    print("test_dropped_unread ok")
+
+def test_max_bytes_unread():
+    # The cap holds even when nobody retrieved the messages yet
+    store = MessageStore(max_bytes=2500, delete_on_consume=True)
+    for i in range(100):
+        store.set("private", ("Bob", str(i)), bytes(1000), readers=["Bob"])
+    stats = store.stats()
+    assert (stats["messages"], stats["bytes"], stats["evicted"]) == (2, 2000, 98)
+    with pytest.raises(MessageDropped):
+        store.wait("private", ("Bob", "0"), 1, reader="Bob")
+    assert store.get("private", ("Bob", "99"), reader="Bob") == bytes(1000)
+    assert store.stats()["consumed"] == 1
+    print("test_max_bytes_unread ok")
+
+def test_clear_pools():
+    store = MessageStore()
+    store.set("s1/public", ("Alice", "x"), b"1")
+    store.set("s2/public", ("Alice", "x"), b"22")
+    store.clear(["s1/public", "s1/private"])
+    assert store.get("s1/public", ("Alice", "x")) is None
+    assert store.get("s2/public", ("Alice", "x")) == b"22"
+    assert store.stats()["bytes"] == 2
+    print("test_clear_pools ok")
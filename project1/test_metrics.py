@@ -0,0 +1,70 @@
+"""
+Tests of the instrumentation of the clients.
+"""
+
+import json
+import time
+
+from expression import Scalar, Secret
+from metrics import (
+    Metrics,
+    PHASE_BEAVER, PHASE_INPUT_SHARING, PHASE_LOCAL, PHASE_OTHER, PHASE_RECONSTRUCTION, PHASE_TRIPLETS,
+)
+from protocol import ProtocolSpec
+from smc_party import SMCParty
+
+
+def test_nested_phases():
+    metrics = Metrics()
+    start = time.perf_counter()
+    with metrics.phase("outer"):
+        metrics.record_request(10, 20)
+        with metrics.phase("inner"):
+            time.sleep(0.1)
+            metrics.record_request(1, 2)
+            metrics.record_wait(0.5, 3)
+        assert metrics.current == "outer"
+    elapsed = time.perf_counter() - start
+    metrics.record_bytes(sent=7)
+
+    outer, inner = metrics.phases["outer"], metrics.phases["inner"]
+    # The time of the inner phase is not counted in the outer one
+    assert inner["time"] >= 0.1
+    assert outer["time"] + inner["time"] <= elapsed
+    assert outer["time"] < 0.05
+    assert (outer["requests"], outer["bytes_sent"], outer["bytes_received"]) == (1, 10, 20)
+    assert (inner["requests"], inner["polls"], inner["wait_time"]) == (1, 3, 0.5)
+    assert metrics.phases[PHASE_OTHER]["bytes_sent"] == 7
+    assert metrics.total()["bytes_sent"] == 18
+    print("test_nested_phases ok")
+
+
+def test_party_metrics(run_parties, tmp_path):
+    """
+    f(a, b, c) = a * b + c * 3, with the server in a thread.
+    """
+    secrets = [Secret() for _ in range(3)]
+    participants = ["Alice", "Bob", "Charlie"]
+    value_dicts = [{secret: value} for secret, value in zip(secrets, [3, 14, 15])]
+    prot = ProtocolSpec(expr=secrets[0] * secrets[1] + secrets[2] * Scalar(3), participant_ids=participants)
+
+    parties, _ = run_parties(SMCParty, prot, value_dicts)
+
+    phases = parties[0].metrics.phases
+    # Our shares sent at once, the others' retrieved at once
+    assert phases[PHASE_INPUT_SHARING]["requests"] == 2
+    assert phases[PHASE_INPUT_SHARING]["bytes_sent"] > 0
+    assert phases[PHASE_TRIPLETS]["requests"] == 1
+    # One round: x-a and y-b published, the others' retrieved
+    assert phases[PHASE_BEAVER]["requests"] == 2
+    assert phases[PHASE_LOCAL]["requests"] == 0
+    assert phases[PHASE_RECONSTRUCTION]["requests"] == 2
+    assert phases[PHASE_RECONSTRUCTION]["bytes_received"] > 0
+    assert phases[PHASE_OTHER]["requests"] == 0
+
+    path = tmp_path / "metrics.json"
+    parties[0].metrics.to_json(str(path))
+    exported = json.loads(path.read_text())
+    assert exported["total"]["requests"] == 7
+    assert exported["phases"][PHASE_BEAVER]["requests"] == 2
+    print("test_party_metrics ok")
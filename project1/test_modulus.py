@@ -0,0 +1,41 @@
+"""
+Integration tests of protocols computed mod other moduli than the default q.
+"""
+
+import pytest
+
+from expression import Scalar, Secret
+from harness import run_processes
+from protocol import ProtocolSpec
+
+
+def suite(parties, expr, expected, modulus):
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, modulus=modulus)
+    clients = [(name, prot, value_dict) for name, value_dict in parties.items()]
+
+    results = run_processes(participants, *clients, server_kwargs={"modulus": modulus})
+
+    for result in results:
+        assert result == expected
+
+
+@pytest.mark.parametrize("modulus", [2**32, 2**64, 4294967291, 2**61 - 1])
+def test_large_values(modulus):
+    """
+    f(a, b, c) = (a ∗ b ∗ c) - K + a, with values that overflow the default q
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 3_000_000},
+        "Bob": {bob_secret: 14_000},
+        "Charlie": {charlie_secret: -2}
+    }
+
+    expr = alice_secret * bob_secret * charlie_secret - Scalar(5_000_000) + alice_secret
+    expected = (3_000_000 * 14_000 * -2 - 5_000_000 + 3_000_000) % modulus
+    suite(parties, expr, expected, modulus)
+    print("test_large_values ok")
@@ -0,0 +1,78 @@
+"""
+Tests of the peer-to-peer mode, where the participants exchange their messages directly.
+"""
+
+import time
+
+import pytest
+
+import server
+from async_smc_party import AsyncSMCParty
+from expression import Scalar, Secret
+from harness import run_processes
+from peer_communication import Inbox
+from protocol import ProtocolSpec
+from smc_party import SMCParty
+
+
+def test_peer_messages(run_parties):
+    """
+    f(a, b, c) = a * b + c * 3, with the server in a thread: it only relays the addresses.
+    """
+    secrets = [Secret() for _ in range(3)]
+    participants = ["Alice", "Bob", "Charlie"]
+    value_dicts = [{secret: value} for secret, value in zip(secrets, [3, 14, 15])]
+    prot = ProtocolSpec(
+        expr=secrets[0] * secrets[1] + secrets[2] * Scalar(3),
+        participant_ids=participants,
+        peer_to_peer=True
+    )
+
+    parties, results = run_parties(SMCParty, prot, value_dicts)
+
+    assert results == [3 * 14 + 15 * 3] * 3
+    # run stopped listening once done
+    assert all(party.comm._listener is None for party in parties)
+    # The three addresses went through the server, and nothing else (still held or consumed)
+    stats = server.store.stats()
+    assert stats["messages"] + stats["consumed"] == 3
+    print("test_peer_messages ok")
+
+
+def test_inbox_timeout():
+    inbox = Inbox()
+    inbox.put(("private", "a"), b"1")
+    assert inbox.take(("private", "a"), timeout=0.1) == b"1"
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        inbox.take(("private", "a"), timeout=0.1)
+    assert time.perf_counter() - start >= 0.1
+    print("test_inbox_timeout ok")
+
+
+def test_async_party_rejects_peer_to_peer():
+    prot = ProtocolSpec(expr=Secret() + Scalar(1), participant_ids=["Alice"], peer_to_peer=True)
+    with pytest.raises(ValueError):
+        AsyncSMCParty("Alice", "localhost", 5000, protocol_spec=prot, value_dict=dict())
+    print("test_async_party_rejects_peer_to_peer ok")
+
+
+def test_protocol_peer_to_peer():
+    """
+    f(a, b, c, d) = (a - b) * c * d + 5 over the HTTP server, with vectors.
+    """
+    secrets = [Secret() for _ in range(4)]
+    participants = ["Alice", "Bob", "Charlie", "David"]
+    value_dicts = [{secret: [value, value + 1]} for secret, value in zip(secrets, [20, 4, 3, 2])]
+    prot = ProtocolSpec(
+        expr=(secrets[0] - secrets[1]) * secrets[2] * secrets[3] + Scalar(5),
+        participant_ids=participants,
+        batch_size=2,
+        peer_to_peer=True
+    )
+
+    results = run_processes(participants, *zip(participants, [prot] * 4, value_dicts))
+
+    expected = [(20 - 4) * 3 * 2 + 5, (21 - 5) * 4 * 3 + 5]
+    assert [list(result) for result in results] == [expected] * 4
+    print("test_protocol_peer_to_peer ok")
@@ -5,4 +5,114 @@ Testing secret sharing is not obligatory.
 MODIFY THIS FILE.
 """
 
-# No tests here
\ No newline at end of file
+import multiprocessing
+
+import numpy as np
+
+from communication import decode_values, encode_values
+
+from secret_sharing import (
+    q,
+    DEFAULT_FIELD,
+    Field,
+    make_rng,
+    reconstruct_secret,
+    reconstruct_secrets,
+    share_secret,
+    share_secrets,
+    Share,
+    ShareVector,
+)
+
+
+def test_share_reconstruct():
+    for secret in [0, 1, 42, q - 1]:
+        shares = share_secret(secret, 5)
+        assert len(shares) == 5
+        assert reconstruct_secret(shares) == secret
+    print("test_share_reconstruct ok")
+
+def test_share_reconstruct_many():
+    secrets = [0, 3, 14, 2, q - 1, -1]
+    shares = share_secrets(secrets, 4)
+    assert len(shares) == 4
+    assert all(len(s) == len(secrets) for s in shares)
+    assert reconstruct_secrets(shares).tolist() == [s % q for s in secrets]
+    print("test_share_reconstruct_many ok")
+
+def test_share_vector_ops():
+    x = [3, 14, q - 1, 0]
+    y = [5, 2, 2, 7]
+    a = ShareVector(x)
+    b = ShareVector(y)
+    assert (a + b).values.tolist() == [(i + j) % q for i, j in zip(x, y)]
+    assert (a - b).values.tolist() == [(i - j) % q for i, j in zip(x, y)]
+    assert (a * b).values.tolist() == [(i * j) % q for i, j in zip(x, y)]
+    assert a.values.dtype == np.uint64
+    print("test_share_vector_ops ok")
+
+def test_share_vector_matches_share():
+    a = ShareVector([123456, 7])
+    b = ShareVector([654321, 9])
+    for i in range(2):
+        assert (a * b)[i].value == (a[i] * b[i]).value
+        assert (a - b)[i].value == (a[i] - b[i]).value
+    print("test_share_vector_matches_share ok")
+
+def test_wire_format():
+    values = [0, 1, q - 1, -1]
+    data = encode_values(values)
+    assert len(data) == 4 * len(values)
+    assert decode_values(data).tolist() == [0, 1, q - 1, q - 1]
+    assert decode_values(encode_values(7)).tolist() == [7]
+    print("test_wire_format ok")
+
+def test_fields():
+    # Native wrap-around, masked power of two, a prime just below 2**32 and the Mersenne prime 2**61 - 1
+    for modulus, dtype in [
+            (2**32, np.uint32), (2**64, np.uint64), (2**20, np.uint64), (4294967291, np.uint64), (2**61 - 1, np.uint64)
+        ]:
+        field = Field(modulus)
+        x = field.random(1000)
+        y = field.random(1000)
+        assert x.dtype == dtype
+        assert [int(v) for v in field.add(x, y)] == [(int(i) + int(j)) % modulus for i, j in zip(x, y)]
+        assert [int(v) for v in field.sub(x, y)] == [(int(i) - int(j)) % modulus for i, j in zip(x, y)]
+        assert [int(v) for v in field.mul(x, y)] == [int(i) * int(j) % modulus for i, j in zip(x, y)]
+        assert int(field.sum(x)) == sum(int(i) for i in x) % modulus
+
+        secrets = [0, 1, -1, modulus - 1, 2**70]
+        shares = share_secrets(secrets, 3, field)
+        assert reconstruct_secrets(shares).tolist() == [s % modulus for s in secrets]
+        assert reconstruct_secret(share_secret(-5, 3, field)) == -5 % modulus
+
+        data = encode_values(secrets, field)
+        assert len(data) == (4 if modulus <= 2**32 else 8) * len(secrets)
+        assert decode_values(data, field).tolist() == [s % modulus for s in secrets]
+    print("test_fields ok")
+
+def test_field_bounds():
+    for modulus in [1, 2**64 + 1, 2**33 + 1, 2**61 + 1]:
+        try:
+            Field(modulus)
+        except ValueError:
+            continue
+        assert False, modulus
+    print("test_field_bounds ok")
+
+def test_rng():
+    secrets = [3, 14, 15]
+    # A seeded generator gives reproducible shares.
+    first = share_secrets(secrets, 3, rng=make_rng(42))
+    second = share_secrets(secrets, 3, rng=make_rng(42))
+    assert all((x.values == y.values).all() for x, y in zip(first, second))
+    assert reconstruct_secrets(first).tolist() == secrets
+
+    # A forked process does not draw the same values as its parent.
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    child = ctx.Process(target=lambda: queue.put(DEFAULT_FIELD.random(8).tolist()))
+    child.start()
+    child.join()
+    assert queue.get() != DEFAULT_FIELD.random(8).tolist()
+    print("test_rng ok")
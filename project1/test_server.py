@@ -0,0 +1,239 @@
+"""
+Unit tests for the trusted server, using the Flask test client.
+"""
+
+import threading
+import time
+
+import server
+from communication import Communication, decode_values, pack_envelope, unpack_envelope
+from harness import reset_server
+from secret_sharing import q
+from ttp import expand_seed
+
+
+def make_client(participants):
+    reset_server(participants)
+    return server.app.test_client()
+
+
+def test_batch_shares():
+    client = make_client(["Alice", "Bob"])
+    op_ids = ["1", "2", "3"]
+
+    flat_alice = client.post("/shares/Alice", json=op_ids).get_json()
+    flat_bob = client.post("/shares/Bob", json=op_ids).get_json()
+    assert len(flat_alice) == len(flat_bob) == 3 * len(op_ids)
+
+    for i in range(len(op_ids)):
+        a, b, c = [(flat_alice[3 * i + j] + flat_bob[3 * i + j]) % q for j in range(3)]
+        assert c == a * b % q
+
+    # The batch endpoint agrees with the single one.
+    single = client.get("/shares/Bob/2").get_json()
+    assert [int(v) for v in single] == flat_bob[3:6]
+    print("test_batch_shares ok")
+
+
+def test_vector_shares():
+    client = make_client(["Alice", "Bob"])
+    op_ids = ["1", "2"]
+    count = 40 # more than a block of the pool
+
+    alice = decode_values(client.post("/shares/Alice?format=bin&count=40", json=op_ids).data)
+    bob = decode_values(client.post("/shares/Bob?format=bin&count=40", json=op_ids).data)
+    a, b, c = ((alice + bob) % q).reshape(len(op_ids), 3, count).transpose(1, 0, 2)
+    assert (c == a * b % q).all()
+
+    # The single endpoint agrees with the batch one.
+    single = decode_values(client.get("/shares/Bob/2?format=bin&count=40").data)
+    assert (single == bob[3 * count:]).all()
+    print("test_vector_shares ok")
+
+
+def test_long_poll():
+    client = make_client(["Alice", "Bob"])
+
+    # Without waiting, a missing message is a 404 that advertises long-polling.
+    res = client.get("/public/Bob/Alice/label")
+    assert res.status_code == 404
+    assert res.headers.get("X-Long-Poll") == "1"
+
+    # A waiting request returns as soon as the message is published.
+    timer = threading.Timer(0.2, lambda: server._set_value("public", ("Alice", "label"), b"42"))
+    timer.start()
+    start = time.time()
+    res = client.get("/public/Bob/Alice/label?wait=5")
+    assert res.status_code == 200
+    assert res.data == b"42"
+    assert time.time() - start < 2
+
+    # And times out otherwise.
+    start = time.time()
+    res = client.get("/private/Bob/nothing?wait=0.3")
+    assert res.status_code == 404
+    assert time.time() - start >= 0.3
+    print("test_long_poll ok")
+
+
+def test_pooled_server():
+    make_client(["Alice", "Bob"])
+    http_server = server.PooledWSGIServer(
+        "localhost", 5001, server.app, workers=4, handler=server.KeepAliveRequestHandler
+    )
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        alice = Communication("localhost", 5001, "Alice")
+        bob = Communication("localhost", 5001, "Bob")
+
+        # Bob blocks in a worker until Alice publishes through another one.
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(bob.retrieve_public_message("Alice", "x")))
+        waiter.start()
+        time.sleep(0.2)
+        alice.publish_message("x", b"42")
+        waiter.join(5)
+        assert results == [b"42"]
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+    print("test_pooled_server ok")
+
+
+def test_binary_shares():
+    client = make_client(["Alice", "Bob"])
+    op_ids = ["1", "2"]
+
+    as_json = client.post("/shares/Alice", json=op_ids).get_json()
+    as_bin = client.post("/shares/Alice?format=bin", json=op_ids)
+    assert as_bin.mimetype == "application/octet-stream"
+    assert len(as_bin.data) == 4 * len(as_json)
+    assert decode_values(as_bin.data).tolist() == as_json
+
+    single = client.get("/shares/Alice/2?format=bin")
+    assert decode_values(single.data).tolist() == as_json[3:]
+    print("test_binary_shares ok")
+
+
+def test_batch_messages():
+    client = make_client(["Alice", "Bob"])
+
+    client.post("/batch/private/Alice", data=pack_envelope([("Bob", "s1", b"1"), ("Bob", "s2", b"22")]))
+    client.post("/batch/public/Alice", data=pack_envelope([("x", b"3"), ("y", b"")]))
+
+    res = client.post("/batch/private/Bob/retrieve", data=pack_envelope([("s2",), ("s1",)]))
+    assert res.status_code == 200
+    assert unpack_envelope(res.data, 1) == [(b"22",), (b"1",)]
+
+    res = client.post("/batch/public/Bob/retrieve", data=pack_envelope([("Alice", "y"), ("Alice", "x")]))
+    assert unpack_envelope(res.data, 1) == [(b"",), (b"3",)]
+
+    # Batch and single routes share the same channels.
+    assert client.get("/public/Bob/Alice/x").data == b"3"
+
+    # All the messages must be there.
+    res = client.post("/batch/public/Bob/retrieve", data=pack_envelope([("Alice", "x"), ("Bob", "x")]))
+    assert res.status_code == 404
+    print("test_batch_messages ok")
+
+
+def test_consuming_server():
+    client = make_client(["Alice", "Bob", "Charlie"])
+    server.store = server.MessageStore(delete_on_consume=True)
+
+    client.post("/public/Alice/x", data=b"1")
+    client.post("/private/Alice/Bob/s", data=b"2")
+    assert client.get("/stats").get_json()["store"]["messages"] == 2
+
+    assert client.get("/private/Bob/s").data == b"2"
+    assert client.get("/private/Bob/s").status_code == 404
+
+    # A public message is kept until all the other participants got it.
+    assert client.get("/public/Bob/Alice/x").data == b"1"
+    res = client.post("/batch/public/Charlie/retrieve", data=pack_envelope([("Alice", "x")]))
+    assert unpack_envelope(res.data, 1) == [(b"1",)]
+    assert client.get("/public/Bob/Alice/x").status_code == 404
+
+    stats = client.get("/stats").get_json()
+    assert stats["store"]["messages"] == 0
+    assert stats["store"]["consumed"] == 2
+    assert stats["ttp"]["operations"] == 0
+    print("test_consuming_server ok")
+
+
+def test_dropped_before_retrieved():
+    client = make_client(["Alice", "Bob"])
+    server.ttp.max_operations = 1
+    server.store = server.MessageStore(ttl=0.1, delete_on_consume=True)
+
+    # The triplet of op1 is evicted by op2 after Alice got hers: Bob gets an error, not another one
+    assert client.get("/shares/Alice/op1").status_code == 200
+    assert client.get("/shares/Alice/op2").status_code == 200
+    assert client.get("/shares/Bob/op1").status_code == 410
+
+    # Alice's message expires before Bob retrieves it
+    client.post("/public/Alice/x", data=b"1")
+    time.sleep(0.15)
+    client.post("/public/Alice/y", data=b"2")
+    assert client.get("/public/Bob/Alice/x?wait=1").status_code == 410
+    print("test_dropped_before_retrieved ok")
+
+
+def test_sessions():
+    client = make_client(["Alice", "Bob"])
+    participants = {"participants": ["Bob", "Alice"], "modulus": 2**32}
+
+    assert client.post("/sessions/s1", json=participants).status_code == 200
+    # Every participant registers the session, with the same parameters.
+    assert client.post("/sessions/s1", json=participants).status_code == 200
+    assert client.post("/sessions/s1", json={"participants": ["Alice"], "modulus": 2**32}).status_code == 409
+    assert client.post("/sessions/s2", json={"participants": ["Alice"], "modulus": 2**64 + 1}).status_code == 400
+
+    # The session has triplets of its own, in its own field.
+    alice = decode_values(client.get("/sessions/s1/shares/Alice/1?format=bin").data, server.sessions["s1"].field)
+    bob = decode_values(client.get("/sessions/s1/shares/Bob/1?format=bin").data, server.sessions["s1"].field)
+    a, b, c = (int(x) + int(y) for x, y in zip(alice, bob))
+    assert c % 2**32 == a * b % 2**32
+    assert client.get("/sessions/nothing/shares/Alice/1").status_code == 404
+
+    # Messages of a session are not visible from the others.
+    client.post("/sessions/s1/public/Alice/x", data=b"1")
+    client.post("/public/Alice/x", data=b"2")
+    assert client.get("/sessions/s1/public/Bob/Alice/x").data == b"1"
+    assert client.get("/public/Bob/Alice/x").data == b"2"
+    # The default session also has a prefix, redirecting to the plain routes.
+    assert client.get("/sessions/default/public/Bob/Alice/x", follow_redirects=True).data == b"2"
+
+    assert list(client.get("/stats").get_json()["sessions"]) == ["s1"]
+    assert client.delete("/sessions/s1").status_code == 200
+    assert client.get("/sessions/s1/public/Bob/Alice/x").status_code == 404
+    assert client.delete("/sessions/s1").status_code == 404
+    assert server.sessions == {}
+    print("test_sessions ok")
+
+
+def test_seeded_triplets():
+    client = make_client(["Alice", "Bob"])
+    seeds = {p: client.get(f"/seeds/{p}?run=r").get_json() for p in ["Alice", "Bob"]}
+    assert [seeds[p]["corrected"] for p in ["Alice", "Bob"]] == [False, True]
+    assert client.get("/seeds/Alice").status_code == 400
+
+    body = ["1", {"op_id": "2", "shape": [1, 2, 2]}]
+    corrections = decode_values(client.post("/corrections/Bob?count=3&run=r", json=body).data)
+    # The seeds of another run were never drawn
+    assert client.post("/corrections/Bob?count=3&run=other", json=body).status_code == 410
+    assert len(corrections) == 3 + 1 * 2 * 3
+
+    triplets = {p: expand_seed(server.ttp.field, int(seeds[p]["seed"]), "1", 3) for p in seeds}
+    a, b = ((triplets["Alice"][i] + triplets["Bob"][i]) % q for i in range(2))
+    assert ((triplets["Alice"][2] + corrections[:3]) % q == a * b % q).all()
+    print("test_seeded_triplets ok")
+
+def test_random_bits():
+    client = make_client(["Alice", "Bob"])
+    body = [{"op_id": "1", "bits": 20}, {"op_id": "2", "bits": 3}]
+    shares = [decode_values(client.post(f"/bits/{p}?count=2", json=body).data) for p in ["Alice", "Bob"]]
+    assert len(shares[0]) == 20 * 2 + 3 * 2
+    assert set(((shares[0] + shares[1]) % q).tolist()) <= {0, 1}
+    print("test_random_bits ok")
@@ -0,0 +1,81 @@
+"""
+Integration tests of many computations hosted at the same time by one server, in sessions.
+"""
+
+import asyncio
+import queue as thread_queue
+import threading
+
+import pytest
+
+import server
+from async_communication import AsyncCommunication
+from communication import Communication, ServerError
+from expression import Scalar, Secret
+from harness import run_processes
+from protocol import ProtocolSpec
+from transport import QueueTransport
+
+
+def test_concurrent_sessions():
+    """
+    Three computations with the same party names run at once on a server started without
+    participants: f(a, b) = a * b + 3 twice, in different fields, and f(a, b, c) = a * b * c with
+    seeded triplets.
+    """
+    computations = []
+    for session_id, modulus, values in [("first", 2**20, [7, 9]), ("second", 2**32, [-5, 70000])]:
+        secrets = [Secret(), Secret()]
+        prot = ProtocolSpec(
+            participant_ids=["Alice", "Bob"],
+            expr=secrets[0] * secrets[1] + Scalar(3),
+            modulus=modulus,
+            session_id=session_id
+        )
+        expected = (values[0] * values[1] + 3) % modulus
+        computations.append((prot, dict(zip(["Alice", "Bob"], zip(secrets, values))), expected))
+
+    secrets = [Secret(), Secret(), Secret()]
+    prot = ProtocolSpec(
+        participant_ids=["Alice", "Bob", "Charlie"],
+        expr=secrets[0] * secrets[1] * secrets[2],
+        session_id="third",
+        seeded_triplets=True
+    )
+    computations.append((prot, dict(zip(["Alice", "Bob", "Charlie"], zip(secrets, [2, 3, 4]))), 24))
+
+    clients = [
+        (name, prot, {secret: value}, name == "Bob")
+        for prot, parties, _ in computations
+        for name, (secret, value) in parties.items()
+    ]
+    results = run_processes([], *clients)
+
+    for prot, parties, expected in computations:
+        assert [res for (_, client_prot, _, _), res in zip(clients, results) if client_prot is prot] == [expected] * len(parties)
+    print("test_concurrent_sessions ok")
+
+
+def test_unknown_session():
+    """
+    Requests to a session that was never registered fail instead of decoding the error as shares.
+    """
+    queues = [(thread_queue.Queue(), thread_queue.Queue()) for _ in range(2)]
+    thread = threading.Thread(target=server.serve_queues, args=(queues,), daemon=True)
+    thread.start()
+
+    comm = Communication("localhost", 0, "Alice", session_id="nope", transport=QueueTransport(*queues[0]))
+    with pytest.raises(ServerError) as error:
+        comm.retrieve_beaver_triplet_shares_batch(["1"], 3)
+    assert error.value.status == 404
+    with pytest.raises(ServerError):
+        comm.retrieve_triplet_seed("run")
+    comm.close()
+
+    async def retrieve():
+        async with AsyncCommunication("localhost", 0, "Alice", session_id="nope", transport=QueueTransport(*queues[1])) as comm:
+            await comm.retrieve_random_bits(["1"], 1, [4])
+    with pytest.raises(ServerError):
+        asyncio.run(retrieve())
+    thread.join(5)
+    print("test_unknown_session ok")
@@ -0,0 +1,61 @@
+"""
+Integration tests of streaming parties, evaluating an expression on a feed of batches.
+"""
+
+from expression import LessThan, Scalar, Secret
+from harness import run_processes
+from protocol import ProtocolSpec
+from secret_sharing import q
+from streaming_party import StreamingSMCParty
+
+
+def streaming_client(client_id, prot, feed, reveal_every):
+    cli = StreamingSMCParty(client_id, "localhost", 5000, protocol_spec=prot, reveal_every=reveal_every, prefetch=3)
+    return list(cli.stream(feed))
+
+
+def run_stream(participants, prot, feeds, reveal_every):
+    clients = [(name, prot, feeds[name], reveal_every) for name in participants]
+    return dict(zip(participants, run_processes(participants, *clients, client=streaming_client)))
+
+
+def test_running_sum():
+    """
+    Running sum of a * b + 1 over 7 batches of 4 events, revealed every 3 batches
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    participants = ["Alice", "Bob", "Charlie"]
+    prot = ProtocolSpec(expr=alice_secret * bob_secret + Scalar(1), participant_ids=participants, batch_size=4)
+
+    a = [[step * 4 + i for i in range(4)] for step in range(7)]
+    b = [[(step + i) % 5 for i in range(4)] for step in range(7)]
+    feeds = {
+        "Alice": [{alice_secret: values} for values in a],
+        "Bob": [{bob_secret: values} for values in b],
+        "Charlie": [dict()] * 7
+    }
+
+    results = run_stream(participants, prot, feeds, reveal_every=3)
+
+    sums = [sum(x * y + 1 for x, y in zip(a_step, b_step)) for a_step, b_step in zip(a, b)]
+    expected = [(4 * steps, sum(sums[:steps]) % q) for steps in (3, 6, 7)]
+    assert results == {name: expected for name in participants}
+    print("test_running_sum ok")
+
+
+def test_running_count():
+    """
+    Number of events above a threshold, one event per batch
+    """
+    secret = Secret()
+    participants = ["Alice", "Bob"]
+    prot = ProtocolSpec(expr=LessThan(Scalar(50), secret), participant_ids=participants)
+
+    events = [10, 60, 50, 99, 51]
+    feeds = {"Alice": [{secret: event} for event in events], "Bob": [dict()] * len(events)}
+
+    results = run_stream(participants, prot, feeds, reveal_every=2)
+
+    assert results == {name: [(2, 1), (4, 2), (5, 3)] for name in participants}
+    print("test_running_count ok")
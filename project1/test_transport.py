@@ -0,0 +1,152 @@
+"""
+Tests of the transports of the client communications: raw TCP frames and queues.
+"""
+
+import io
+import socket
+import queue
+import threading
+import time
+from multiprocessing import Queue
+
+import pytest
+
+import server
+from async_smc_party import AsyncSMCParty
+from communication import Communication
+from expression import Scalar, Secret
+from harness import reset_server, run_processes
+from protocol import ProtocolSpec
+from secret_sharing import q
+from smc_party import SMCParty
+from transport import encode_frame, read_frame, QueueTransport, TCPTransport
+
+
+def test_frames():
+    stream = io.BytesIO(encode_frame(["GET", b"", b"\x00" * 70000]) + encode_frame([]))
+    assert read_frame(stream) == [b"GET", b"", b"\x00" * 70000]
+    assert read_frame(stream) == []
+    assert read_frame(stream) is None
+    print("test_frames ok")
+
+
+def test_no_resend():
+    """
+    A request the server received is not sent again when the connection breaks: it may have
+    consumed triplets or messages.
+    """
+    listener = socket.create_server(("localhost", 0))
+    received = []
+
+    def serve():
+        # Read every request, then hang up without answering
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            with connection, connection.makefile("rb") as stream:
+                received.append(read_frame(stream))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    transport = TCPTransport("localhost", listener.getsockname()[1])
+    with pytest.raises(OSError):
+        transport.request("POST", "/shares/Alice", b"[]")
+    time.sleep(0.2)
+    listener.close()
+    assert len(received) == 1
+    print("test_no_resend ok")
+
+
+def exchange(alice, bob):
+    # Bob waits for a message of Alice, then both get triplets
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(bob.retrieve_public_message("Alice", "x")))
+    waiter.start()
+    time.sleep(0.2)
+    alice.publish_message("x", b"42")
+    waiter.join(5)
+    assert results == [b"42"]
+
+    a_alice, b_alice, c_alice = alice.retrieve_beaver_triplet_shares_batch(["1"], 3)[0]
+    a_bob, b_bob, c_bob = bob.retrieve_beaver_triplet_shares_batch(["1"], 3)[0]
+    assert ((c_alice + c_bob) % q == (a_alice + a_bob) * (b_alice + b_bob) % q).all()
+
+
+def test_tcp_transport():
+    reset_server(["Alice", "Bob"])
+    tcp_server = server.FrameServer(("localhost", 5002), server.FrameRequestHandler)
+    thread = threading.Thread(target=tcp_server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        alice, bob = (
+            Communication("localhost", 5002, name, transport=TCPTransport("localhost", 5002))
+            for name in ["Alice", "Bob"]
+        )
+        exchange(alice, bob)
+        alice.close()
+        bob.close()
+    finally:
+        tcp_server.shutdown()
+        tcp_server.server_close()
+    print("test_tcp_transport ok")
+
+
+def test_queue_transport():
+    reset_server(["Alice", "Bob"])
+    queues = [(queue.Queue(), queue.Queue()) for _ in range(2)]
+    thread = threading.Thread(target=server.serve_queues, args=(queues,), daemon=True)
+    thread.start()
+
+    alice, bob = (
+        Communication("localhost", 0, name, transport=QueueTransport(*pair))
+        for name, pair in zip(["Alice", "Bob"], queues)
+    )
+    exchange(alice, bob)
+    alice.close()
+    bob.close()
+    thread.join(5)
+    assert not thread.is_alive()
+    print("test_queue_transport ok")
+
+
+def test_async_queue_transport(run_parties):
+    """
+    f(a, b) = a * b with asyncio parties, their requests going through queues to a server thread
+    """
+    secrets = [Secret() for _ in range(2)]
+    prot = ProtocolSpec(expr=secrets[0] * secrets[1], participant_ids=["Alice", "Bob"])
+
+    _, results = run_parties(AsyncSMCParty, prot, [{secret: value} for secret, value in zip(secrets, [6, 7])])
+    assert results == [42, 42]
+    print("test_async_queue_transport ok")
+
+
+def transport_client(client_id, prot, value_dict, transport):
+    cli = SMCParty(client_id, "localhost", 5000, protocol_spec=prot, value_dict=value_dict, transport=transport)
+    return cli.run()
+
+
+def test_protocol_transports():
+    """
+    f(a, b, c) = a * b + c * 3 over TCP and over queues
+    """
+    secrets = [Secret() for _ in range(3)]
+    participants = ["Alice", "Bob", "Charlie"]
+    value_dicts = [{secret: value} for secret, value in zip(secrets, [3, 14, 15])]
+    prot = ProtocolSpec(expr=secrets[0] * secrets[1] + secrets[2] * Scalar(3), participant_ids=participants)
+
+    for name in ["tcp", "queue"]:
+        pairs = [(Queue(), Queue()) for _ in participants]
+        transports = [
+            TCPTransport("localhost", 5000) if name == "tcp" else QueueTransport(*pair) for pair in pairs
+        ]
+        results = run_processes(
+            participants,
+            *zip(participants, [prot] * 3, value_dicts, transports),
+            server_kwargs={"transport": name, "queues": pairs},
+            client=transport_client
+        )
+        assert results == [3 * 14 + 15 * 3] * 3
+    print("test_protocol_transports ok")
@@ -5,7 +5,12 @@ Testing ttp is not obligatory.
 MODIFY THIS FILE.
 """
 
-from ttp import TrustedParamGenerator
+import time
+
+from secret_sharing import q
+import pytest
+
+from ttp import expand_seed, OperationDropped, TrustedParamGenerator
 
 def test_participants():
 	my_ttp = TrustedParamGenerator()
@@ -24,4 +29,274 @@ def test_participants():
 	for p in my_ttp.participant_ids:
 		assert (p in ["Alice", "Bob", "Charlie", "Denis"])
 
-	print("Test participants ok")
\ No newline at end of file
+	print("Test participants ok")
+def test_triplet_shares():
+	my_ttp = TrustedParamGenerator(pool_size=16, low_water_mark=4)
+	for p in ["Alice", "Bob", "Charlie"]:
+		my_ttp.add_participant(p)
+	my_ttp.generate_triplets(16)
+	assert my_ttp.pool_available() == 16
+
+	for op_id in range(10):
+		shares = [my_ttp.retrieve_share(p, str(op_id)) for p in ["Alice", "Bob", "Charlie"]]
+		a = sum(s[0].value for s in shares) % q
+		b = sum(s[1].value for s in shares) % q
+		c = sum(s[2].value for s in shares) % q
+		assert c == a * b % q
+		# Asking again returns the same triplet.
+		assert my_ttp.retrieve_share("Bob", str(op_id)) is shares[1]
+
+	print("Test triplet shares ok")
+
+def test_triplet_vectors():
+	my_ttp = TrustedParamGenerator(pool_size=16, low_water_mark=4)
+	for p in ["Alice", "Bob"]:
+		my_ttp.add_participant(p)
+
+	# Vectors may span several blocks of the pool.
+	shares = [my_ttp.retrieve_share_vector(p, "op", 40) for p in ["Alice", "Bob"]]
+	a, b, c = ((x.values + y.values) % q for x, y in zip(*shares))
+	assert len(a) == 40
+	assert (c == a * b % q).all()
+	assert my_ttp.retrieve_share_vector("Bob", "op", 40) is shares[1]
+
+	print("Test triplet vectors ok")
+
+def test_triplet_modulus():
+	modulus = 2**64
+	my_ttp = TrustedParamGenerator(pool_size=16, low_water_mark=4, modulus=modulus)
+	for p in ["Alice", "Bob"]:
+		my_ttp.add_participant(p)
+
+	shares = [my_ttp.retrieve_share(p, "op") for p in ["Alice", "Bob"]]
+	a, b, c = (sum(s[i].value for s in shares) % modulus for i in range(3))
+	assert c == a * b % modulus
+
+	vectors = [my_ttp.retrieve_share_vector(p, "vec", 8) for p in ["Alice", "Bob"]]
+	a, b, c = ([(int(x) + int(y)) % modulus for x, y in zip(u.values, v.values)] for u, v in zip(*vectors))
+	assert c == [i * j % modulus for i, j in zip(a, b)]
+
+	print("Test triplet modulus ok")
+
+def test_matrix_triples():
+	my_ttp = TrustedParamGenerator(pool_size=16, low_water_mark=4)
+	for p in ["Alice", "Bob", "Charlie"]:
+		my_ttp.add_participant(p)
+
+	m, k, n, count = 2, 3, 4, 5
+	shares = [my_ttp.retrieve_share_vector(p, "op", count, (m, k, n)) for p in ["Alice", "Bob", "Charlie"]]
+	a, b, c = (sum(s[i].values for s in shares) % q for i in range(3))
+	a = a.reshape(m, k, count)
+	b = b.reshape(k, n, count)
+	c = c.reshape(m, n, count)
+	for t in range(count):
+		assert ((a[:, :, t] @ b[:, :, t]) % q == c[:, :, t]).all()
+
+	print("Test matrix triples ok")
+
+def test_pool_refill():
+	my_ttp = TrustedParamGenerator(pool_size=8, low_water_mark=4)
+	my_ttp.add_participant("Alice")
+	my_ttp.add_participant("Bob")
+
+	# The pool is filled on demand when it is empty.
+	assert my_ttp.pool_available() == 0
+	my_ttp.retrieve_share("Alice", "op")
+	assert my_ttp.pool_available() == 7
+
+	for i in range(5):
+		my_ttp.retrieve_share("Alice", f"op{i}")
+	# Going below the low-water mark triggers a background refill.
+	for _ in range(100):
+		if my_ttp.pool_available() >= 8:
+			break
+		time.sleep(0.01)
+	assert my_ttp.pool_available() == 10
+
+	print("Test pool refill ok")
+
+def test_triplet_eviction():
+	my_ttp = TrustedParamGenerator(delete_on_consume=True)
+	my_ttp.add_participant("Alice")
+	my_ttp.add_participant("Bob")
+
+	alice = my_ttp.retrieve_share("Alice", "op")
+	# Kept until every participant retrieved it.
+	assert my_ttp.retrieve_share("Alice", "op") is alice
+	my_ttp.retrieve_share("Bob", "op")
+	assert ("Alice", "op") not in my_ttp.triplet_dict
+	assert ("Bob", "op") not in my_ttp.triplet_dict
+
+	for p in ["Alice", "Bob"]:
+		my_ttp.retrieve_share_vector(p, "vec", 4)
+	assert my_ttp.vector_triplet_dict == {}
+	assert my_ttp.stats()["consumed"] == 2
+
+	my_ttp = TrustedParamGenerator(max_operations=2)
+	my_ttp.add_participant("Alice")
+	my_ttp.add_participant("Bob")
+	for i in range(3):
+		my_ttp.retrieve_share("Alice", f"op{i}")
+	# The oldest operation is dropped.
+	assert ("Bob", "op0") not in my_ttp.triplet_dict
+	assert ("Bob", "op2") in my_ttp.triplet_dict
+
+	my_ttp.ttl = 0
+	stats = my_ttp.stats()
+	assert stats["operations"] == 0
+	assert stats["evicted"] == 1 and stats["expired"] == 2
+	assert my_ttp.triplet_dict == {}
+
+	print("Test triplet eviction ok")
+
+def test_dropped_operations():
+	my_ttp = TrustedParamGenerator(max_operations=2)
+	my_ttp.add_participant("Alice")
+	my_ttp.add_participant("Bob")
+	a_alice, b_alice, c_alice = my_ttp.retrieve_share("Alice", "op1")
+	my_ttp.retrieve_share("Alice", "op2")
+	my_ttp.retrieve_share("Alice", "op3")
+	# op1 was evicted after Alice got her shares: Bob must not get shares of another triplet
+	with pytest.raises(OperationDropped):
+		my_ttp.retrieve_share("Bob", "op1")
+	# Alice evaluating the expression again gets a new triplet, and so does Bob after her
+	my_ttp.retrieve_share("Alice", "op1")
+	a_bob, b_bob, c_bob = my_ttp.retrieve_share("Bob", "op1")
+	a, b, c = (my_ttp.triplet_dict[("Alice", "op1")][i] + share for i, share in enumerate([a_bob, b_bob, c_bob]))
+	assert (a * b).value == c.value
+
+	# Operations nobody retrieved yet are dropped silently
+	my_ttp = TrustedParamGenerator(ttl=0.1)
+	my_ttp.add_participant("Alice")
+	my_ttp.add_participant("Bob")
+	my_ttp.retrieve_share_vector("Alice", "op1", 2)
+	my_ttp.generate_triplet_vector("Alice", "op2", 2)
+	time.sleep(0.15)
+	assert my_ttp.stats()["expired"] == 2
+	with pytest.raises(OperationDropped):
+		my_ttp.retrieve_share_vector("Bob", "op1", 2)
+	my_ttp.retrieve_share_vector("Bob", "op2", 2)
+
+	print("Test dropped operations ok")
+
+def test_seeded_triplets():
+	my_ttp = TrustedParamGenerator()
+	participants = ["Alice", "Bob", "Charlie"]
+	for p in participants:
+		my_ttp.add_participant(p)
+
+	seeds = [my_ttp.retrieve_seed(p, "run1") for p in participants]
+	assert [corrected for _, corrected in seeds] == [False, False, True]
+
+	count = 5
+	triplets = [expand_seed(my_ttp.field, seed, "op", count) for seed, _ in seeds]
+	# Each operation has its own triplets.
+	assert (expand_seed(my_ttp.field, seeds[0][0], "op2", count)[0] != triplets[0][0]).any()
+
+	correction = my_ttp.retrieve_correction("Charlie", "run1", "op", count)
+	a, b = (sum(t[i] for t in triplets) % q for i in range(2))
+	c = (triplets[0][2] + triplets[1][2] + correction) % q
+	assert (c == a * b % q).all()
+	# Nothing is stored.
+	assert my_ttp.stats()["operations"] == 0
+	assert (my_ttp.retrieve_correction("Charlie", "run1", "op", count) == correction).all()
+
+	m, k, n = 2, 3, 2
+	triples = [expand_seed(my_ttp.field, seed, "mat", 1, (m, k, n)) for seed, _ in seeds]
+	correction = my_ttp.retrieve_correction("Charlie", "run1", "mat", 1, (m, k, n))
+	a, b = (sum(t[i][:, :, 0] for t in triples) % q for i in range(2))
+	c = (triples[0][2] + triples[1][2] + correction)[:, :, 0] % q
+	assert (c == (a @ b) % q).all()
+
+	try:
+		my_ttp.retrieve_correction("Alice", "run1", "op", count)
+		assert False
+	except ValueError:
+		pass
+
+	# Evaluating the expression again: new seeds, so new triplets for the same op_ids
+	new_seeds = [my_ttp.retrieve_seed(p, "run2") for p in participants]
+	assert all(new[0] != old[0] for new, old in zip(new_seeds, seeds))
+	triplets = [expand_seed(my_ttp.field, seed, "op", count) for seed, _ in new_seeds]
+	correction = my_ttp.retrieve_correction("Charlie", "run2", "op", count)
+	a, b = (sum(t[i] for t in triplets) % q for i in range(2))
+	assert ((triplets[0][2] + triplets[1][2] + correction) % q == a * b % q).all()
+
+	print("Test seeded triplets ok")
+
+def test_extra_seed_retrievals():
+	my_ttp = TrustedParamGenerator(max_operations=2)
+	participants = ["Alice", "Bob"]
+	for p in participants:
+		my_ttp.add_participant(p)
+
+	# Alice fetched a seed for a run that crashed, then retries the request of the next run: Bob
+	# still gets the seeds Alice got
+	my_ttp.retrieve_seed("Alice", "crashed")
+	alice = my_ttp.retrieve_seed("Alice", "run")
+	assert my_ttp.retrieve_seed("Alice", "run") == alice
+	bob = my_ttp.retrieve_seed("Bob", "run")
+	triplets = [expand_seed(my_ttp.field, seed, "7", 1) for seed, _ in (alice, bob)]
+	correction = my_ttp.retrieve_correction("Bob", "run", "7", 1)
+	a, b = (sum(t[i] for t in triplets) % q for i in range(2))
+	assert ((triplets[0][2] + correction) % q == a * b % q).all()
+
+	# The seeds of the oldest runs are dropped: no corrections for them
+	my_ttp.retrieve_seed("Alice", "next")
+	try:
+		my_ttp.retrieve_correction("Bob", "crashed", "7", 1)
+		assert False
+	except OperationDropped:
+		pass
+	my_ttp.retrieve_correction("Bob", "run", "7", 1)
+
+	print("Test extra seed retrievals ok")
+
+def test_seeded_generator():
+	triplets = []
+	for _ in range(2):
+		my_ttp = TrustedParamGenerator(pool_size=8, seed=7)
+		my_ttp.add_participant("Alice")
+		my_ttp.add_participant("Bob")
+		triplets.append((
+			[s.value for s in my_ttp.retrieve_share("Bob", "op")],
+			my_ttp.retrieve_seed("Alice", "run")
+		))
+	assert triplets[0] == triplets[1]
+
+	# The same values whether the background refills finish before the next request or not
+	values = []
+	for delay in (0, 0.05):
+		my_ttp = TrustedParamGenerator(pool_size=8, low_water_mark=4, seed=7)
+		my_ttp.add_participant("Alice")
+		my_ttp.add_participant("Bob")
+		run = []
+		for i in range(10):
+			run.append(my_ttp.retrieve_share_vector("Alice", f"op{i}", 3)[0].values.tolist())
+			run.append(my_ttp.retrieve_random_bits("Alice", f"bits{i}", 2, 4).values.tolist())
+			time.sleep(delay)
+		values.append(run)
+	assert values[0] == values[1]
+
+	print("Test seeded generator ok")
+
+def test_random_bits():
+	my_ttp = TrustedParamGenerator()
+	participants = ["Alice", "Bob", "Charlie"]
+	for p in participants:
+		my_ttp.add_participant(p)
+
+	count, bits = 4, 20
+	shares = [my_ttp.retrieve_random_bits(p, "cmp", count, bits) for p in participants]
+	values = sum(s.values for s in shares) % q
+	assert len(values) == bits * count
+	assert set(values.tolist()) <= {0, 1}
+	assert (my_ttp.retrieve_random_bits("Alice", "cmp", count, bits).values == shares[0].values).all()
+
+	try:
+		my_ttp.retrieve_random_bits("Alice", "cmp", count, 8)
+		assert False
+	except ValueError:
+		pass
+
+	print("Test random bits ok")
@@ -0,0 +1,60 @@
+"""
+Integration tests of protocols evaluated over vectors of values.
+"""
+
+import numpy as np
+
+from expression import Scalar, Secret
+from harness import run_processes
+from protocol import ProtocolSpec
+from secret_sharing import q
+
+
+def test_vector_suite():
+    """
+    f(a, b, c) = (a ∗ b) + c ∗ K - a + 5, element-wise over vectors of 4 values
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    a = np.array([3, 0, 1000, 2**19])
+    b = np.array([14, 7, 1000, 3])
+    c = 2  # the same value for all elements
+    k = np.array([1, 2, 3, 4])
+
+    parties = {
+        "Alice": {alice_secret: a.tolist()},
+        "Bob": {bob_secret: b},
+        "Charlie": {charlie_secret: c}
+    }
+
+    expr = alice_secret * bob_secret + charlie_secret * Scalar(k.tolist()) - alice_secret + Scalar(5)
+    expected = (a * b + c * k - a + 5) % q
+
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, batch_size=len(a))
+    results = run_processes(participants, *[(name, prot, value_dict) for name, value_dict in parties.items()])
+
+    for result in results:
+        assert result.tolist() == expected.tolist()
+    print("test_vector_suite ok")
+
+
+def test_numpy_scalars():
+    """
+    f(a, b) = a ∗ b ∗ K + L, with NumPy scalars as constants, element-wise over vectors of 2 values
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    parties = {"Alice": {alice_secret: [3, 5]}, "Bob": {bob_secret: [14, 2]}}
+
+    expr = alice_secret * bob_secret * Scalar(np.int64(3)) + Scalar(np.array(2))
+
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, batch_size=2)
+    results = run_processes(participants, *[(name, prot, value_dict) for name, value_dict in parties.items()])
+
+    for result in results:
+        assert result.tolist() == [3 * 14 * 3 + 2, 5 * 2 * 3 + 2]
+    print("test_numpy_scalars ok")
@@ -0,0 +1,247 @@
+"""
+Transports carrying the requests of `Communication` to the trusted server.
+
+A request is a method, a path (e.g. "/public/Alice/label"), query parameters and a body; its
+response is a status, a body and whether the server advertised long-polling. The server answers
+the same routes whatever the transport:
+* `HTTPTransport`: HTTP requests to the Flask server (the default),
+* `TCPTransport`: length-prefixed frames over a raw TCP connection, see `server.serve_tcp`,
+* `QueueTransport`: a pair of queues (e.g. `multiprocessing.Queue`) to a server process or
+  thread, see `server.serve_queues`.
+
+The last two skip the HTTP layer, so that benchmarks can tell the cost of the protocol from the
+cost of HTTP.
+"""
+
+import socket
+import struct
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Status, body and whether the server advertised long-polling
+TransportResponse = Tuple[int, bytes, bool]
+
+
+class Transport:
+    """
+    Base class of the transports.
+
+    A request is only retried when connecting to the server fails: a request the server may have
+    received is not sent again, since retrieving triplets or messages consumes them.
+    """
+
+    def request(
+            self,
+            method: str,
+            path: str,
+            body: Union[bytes, str, None] = None,
+            params: Optional[Dict[str, str]] = None
+        ) -> TransportResponse:
+        """
+        Send a request to the server and wait for its response.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Release the connections to the server.
+        """
+
+
+class HTTPTransport(Transport):
+    """
+    HTTP requests, through one session so that connections to the server are reused.
+
+    Attributes:
+        base_url: URL of the server, e.g. "http://localhost:5000"
+        pool_size: number of keep-alive connections kept open to the server (default: 10)
+        retries: number of retries of a request when the connection to the server fails
+            (default: 3)
+    """
+
+    def __init__(self, base_url: str, pool_size: int = 10, retries: int = 3):
+        self.base_url = base_url
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0, backoff_factor=0.05)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(
+            self,
+            method: str,
+            path: str,
+            body: Union[bytes, str, None] = None,
+            params: Optional[Dict[str, str]] = None
+        ) -> TransportResponse:
+        res = self.session.request(method, self.base_url + path, data=body, params=params)
+        return res.status_code, res.content, "X-Long-Poll" in res.headers
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def encode_frame(fields: Sequence[Union[bytes, str]]) -> bytes:
+    """
+    A frame of the TCP transport: its little-endian uint32 length, then each field as its uint32
+    length followed by its bytes.
+    """
+    parts = []
+    for field in fields:
+        if isinstance(field, str):
+            field = field.encode("utf-8")
+        parts.append(struct.pack("<I", len(field)))
+        parts.append(field)
+    payload = b"".join(parts)
+    return struct.pack("<I", len(payload)) + payload
+
+
+def read_frame(stream: BinaryIO) -> Optional[List[bytes]]:
+    """
+    The fields of the next frame of a stream, None if the stream is closed.
+    """
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    (size,) = struct.unpack("<I", header)
+    payload = stream.read(size)
+    if len(payload) < size:
+        return None
+
+    fields = []
+    offset = 0
+    while offset < size:
+        (length,) = struct.unpack_from("<I", payload, offset)
+        fields.append(payload[offset + 4:offset + 4 + length])
+        offset += 4 + length
+    return fields
+
+
+def encode_request(
+        method: str,
+        path: str,
+        body: Union[bytes, str, None],
+        params: Optional[Dict[str, str]]
+    ) -> List[Union[bytes, str]]:
+    """
+    Fields of the frame of a request: method, path, query string and body.
+    """
+    return [method, path, urlencode(params or {}), body or b""]
+
+
+def decode_request(fields: List[bytes]) -> Tuple[str, str, Dict[str, str], bytes]:
+    """
+    Method, path, query parameters and body of a request frame, see `encode_request`.
+    """
+    method, path, query, body = fields
+    return method.decode(), path.decode(), dict(parse_qsl(query.decode())), body
+
+
+class TCPTransport(Transport):
+    """
+    Requests as length-prefixed frames (see `encode_frame`) over one TCP connection, opened on the
+    first request. A frame is [method, path, query string, body], the response [status,
+    long-poll flag, body].
+
+    Attributes:
+        host: hostname of the server
+        port: port of the server
+        retries: number of retries of a request when connecting to the server fails (default: 3)
+    """
+
+    def __init__(self, host: str, port: int, retries: int = 3):
+        self.host = host
+        self.port = port
+        self.retries = retries
+        self._socket: Optional[socket.socket] = None
+        self._stream: Optional[BinaryIO] = None
+        # One request at a time on the connection
+        self._lock = threading.Lock()
+
+    def request(
+            self,
+            method: str,
+            path: str,
+            body: Union[bytes, str, None] = None,
+            params: Optional[Dict[str, str]] = None
+        ) -> TransportResponse:
+        frame = encode_frame(encode_request(method, path, body, params))
+        with self._lock:
+            for attempt in range(self.retries + 1):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    break
+                except OSError:
+                    self._disconnect()
+                    if attempt == self.retries:
+                        raise
+                    time.sleep(0.05 * 2 ** attempt)
+            try:
+                self._socket.sendall(frame) # type: ignore
+                fields = read_frame(self._stream) # type: ignore
+                if fields is None:
+                    raise ConnectionError("The server closed the connection")
+            except OSError:
+                self._disconnect()
+                raise
+            status, long_poll, content = fields
+            return int(status), content, long_poll == b"1"
+
+    def _connect(self) -> None:
+        self._socket = socket.create_connection((self.host, self.port))
+        # Requests are small and wait for their response, do not delay them
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._stream = self._socket.makefile("rb")
+
+    def _disconnect(self) -> None:
+        if self._socket is not None:
+            self._stream.close() # type: ignore
+            self._socket.close()
+        self._socket = None
+        self._stream = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+
+class QueueTransport(Transport):
+    """
+    Requests put in a queue that the server reads (see `server.serve_queues`), and responses read
+    from another. Each client needs a pair of queues of its own: `multiprocessing.Queue`s to reach a
+    server process, `queue.Queue`s for a server thread of the same process.
+
+    Attributes:
+        requests: queue of the (method, path, params, body) of the requests
+        responses: queue of the responses, (status, body, long-poll flag)
+    """
+
+    def __init__(self, requests, responses):
+        self.requests = requests
+        self.responses = responses
+        self._lock = threading.Lock()
+
+    def request(
+            self,
+            method: str,
+            path: str,
+            body: Union[bytes, str, None] = None,
+            params: Optional[Dict[str, str]] = None
+        ) -> TransportResponse:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        with self._lock:
+            self.requests.put((method, path, dict(params or {}), body or b""))
+            return self.responses.get()
+
+    def close(self) -> None:
+        # Tell the server we are done with these queues
+        self.requests.put(None)
@@ -5,69 +5,534 @@ MODIFY THIS FILE.
 """
 
 import collections
+import functools
+import hashlib
+import threading
+import time
 from typing import (
+    Deque,
     Dict,
+    Optional,
     Set,
     Tuple,
     List,
 )
 
+import numpy as np
+
 from secret_sharing import (
-    share_secret,
+    make_rng,
+    share_secrets,
+    Field,
     Share,
-    q, 
+    ShareVector,
+    q,
 )
 
-import random as rnd
-
 # Feel free to add as many imports as you want.
 
 
+class OperationDropped(Exception):
+    """
+    The shares of an operation were dropped before a participant retrieved its own: new ones would
+    not match the shares the other participants already have.
+    """
+
+
+def expand_seed(
+        field: Field,
+        seed: int,
+        op_id: str,
+        count: int,
+        shape: Optional[Tuple[int, int, int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Shares of the triplets of an operation, expanded from the seed of a participant (see
+    `TrustedParamGenerator.retrieve_seed`): arrays of `count` values of a, b and c, or, given a shape
+    (m, k, n), `count` matrix triples A (m x k x count), B (k x n x count) and C (m x n x count).
+
+    Each operation has a stream of its own, Philox keyed by the seed and starting at a counter
+    derived from the op_id, so that the shares of an operation do not depend on the others.
+    """
+    digest = hashlib.blake2b(op_id.encode(), digest_size=16).digest()
+    rng = np.random.Generator(np.random.Philox(key=seed, counter=int.from_bytes(digest, "little") << 128))
+    m, k, n = shape or (1, 1, 1)
+    a, b, c = (field.random((rows, cols, count), rng) for rows, cols in ((m, k), (k, n), (m, n)))
+    if shape is None:
+        return a[0, 0], b[0, 0], c[0, 0]
+    return a, b, c
+
+
 class TrustedParamGenerator:
     """
     A trusted third party that generates random values for the Beaver triplet multiplication scheme.
+
+    Triplets are generated in batches during an offline phase and kept, already split for every
+    participant, in a pool. The pool is refilled in the background whenever the number of available
+    triplets falls below `low_water_mark`.
+
+    The triplets assigned to operations can be dropped, so that a long-running TTP does not keep
+    the ones of past protocols forever. An operation dropped before all its participants retrieved
+    their shares is remembered (for another `ttl`, and up to `max_operations` of them): those
+    participants then get an `OperationDropped` error instead of shares of another triplet.
+
+    Instead of fetching their triplets, the participants can expand them from a seed (see
+    `retrieve_seed`). Only the last participant then needs something per operation: a correction
+    of its shares of c, see `retrieve_correction`. The seeds are drawn for each run, a label the
+    participants of an evaluation agree on, so that evaluating an expression again does not reuse
+    its triplets. The seeds of a run are dropped like the operations (after `ttl`, and when more
+    than `max_operations` runs have seeds).
+
+    The TTP also supplies shares of random bits, the masks of the comparisons (see
+    `retrieve_random_bits`).
+
+    Attributes:
+        pool_size: number of triplets generated per batch
+        low_water_mark: number of available triplets under which a refill is triggered
+        field: field of the triplets, given by its modulus (default: q)
+        delete_on_consume: drop the triplet of an operation once every participant retrieved its
+            shares (default: False)
+        ttl: triplets assigned more than this many seconds ago are dropped (default: None, never)
+        max_operations: when more operations than this have triplets, the oldest are dropped
+            (default: None, no limit)
+        seed: seed of the random generator, for reproducible benchmarks (default: None, seeded
+            from the OS)
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            pool_size: int = 1024,
+            low_water_mark: int = 256,
+            modulus: int = q,
+            delete_on_consume: bool = False,
+            ttl: Optional[float] = None,
+            max_operations: Optional[int] = None,
+            seed: Optional[int] = None
+        ):
+        self.field = Field(modulus)
+        self.seed = seed
+        # The pool, the seeds of the participants and the rest (matrix triples, random bits) come
+        # from streams of their own, so that the values do not depend on when the background
+        # refills run.
+        pool_seed, participant_seed, other_seed = np.random.SeedSequence(seed).spawn(3)
+        self.rng = make_rng(other_seed)
+        self._pool_rng = make_rng(pool_seed)
+        self._seed_rng = make_rng(participant_seed)
+        self.delete_on_consume = delete_on_consume
+        self.ttl = ttl
+        self.max_operations = max_operations
         self.participant_ids: Set[str] = set()
-        self.triplet_dict: Dict[Tuple[str, str], Tuple[Share, Share, Share]] = collections.defaultdict(dict)
+        self.triplet_dict: Dict[Tuple[str, str], Tuple[Share, Share, Share]] = dict()
+        # Vectors of triplets, for the element-wise multiplications of vector secrets
+        self.vector_triplet_dict: Dict[Tuple[str, str], Tuple[ShareVector, ShareVector, ShareVector]] = dict()
+        # Shares of the random bits of the comparisons
+        self.random_bits_dict: Dict[Tuple[str, str], ShareVector] = dict()
+        self.pool_size = pool_size
+        self.low_water_mark = low_water_mark
+
+        # Each block holds the shares of a, b and c, with one row per participant (in the order of
+        # `self._participants`) and one column per triplet.
+        self._participants: List[str] = []
+        self._pool: Deque[Tuple[np.ndarray, np.ndarray, np.ndarray]] = collections.deque()
+        self._pool_cursor = 0
+        self._pool_available = 0
+        # Whether a block of the pool is being generated in the background. Only one block is
+        # generated at a time, so that they are drawn from the pool stream in the order they are
+        # used.
+        self._refilling = False
+        self._lock = threading.RLock()
+        self._refilled = threading.Condition(self._lock)
+
+        # Operations with a triplet, keyed by (dict holding it, op_id), oldest first: time of
+        # assignment, participants it was split for and participants that did not retrieve it yet
+        self._operations: Dict[Tuple[str, str], Tuple[float, List[str], Set[str]]] = collections.OrderedDict()
+        self._counters = collections.Counter({"consumed": 0, "expired": 0, "evicted": 0})
+        # Operations dropped before all their participants retrieved their shares, with the time
+        # they were dropped and those participants, oldest first
+        self._dropped: Dict[Tuple[str, str], Tuple[float, Set[str]]] = collections.OrderedDict()
+
+        # Seeds of each participant for each run, with the time they were drawn (when the first
+        # participant retrieved its seed), oldest first
+        self._seeds: Dict[str, Tuple[float, Dict[str, int]]] = collections.OrderedDict()
 
     def add_participant(self, participant_id: str) -> None:
         """
         Add a participant.
         """
-        self.participant_ids.add(participant_id)
+        with self._lock:
+            if participant_id not in self.participant_ids:
+                self.participant_ids.add(participant_id)
+                # Triplets already in the pool were split for the old set of participants.
+                self._pool.clear()
+                self._pool_cursor = 0
+                self._pool_available = 0
+                self._seeds.clear()
 
-    def generate_triplet(self, client_id: str, op_id: str) -> Tuple[Share, Share, Share]:
+    def generate_triplets(self, n: int) -> None:
         """
-        Generate a triplet for a given op_id and retrieve the share for the pair (client_id, op_id)
+        Offline phase: generate n triplets at once, split them for all participants and add them to
+        the pool.
         """
-        # Generate a triplet
-        a = rnd.randint(0, q)
-        b = rnd.randint(0, q)
-        c = a * b % q
+        with self._lock:
+            self._refilled.wait_for(lambda: not self._refilling)
+            participants = sorted(self.participant_ids)
+            self._add_block(participants, self._generate_block(n, len(participants)))
+
+    def _generate_block(self, n: int, nb_participants: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Generate n triplets split for `nb_participants`, from the pool stream: must not be called
+        while another block is being generated.
+        """
+        a = self.field.random(n, self._pool_rng)
+        b = self.field.random(n, self._pool_rng)
+        c = self.field.mul(a, b)
 
         # Split each value into multiples shares (each clients will have a share of a, b and c)
+        return tuple( # type: ignore
+            np.stack([s.values for s in share_secrets(v, nb_participants, self.field, self._pool_rng)])
+            for v in (a, b, c)
+        )
+
+    def _add_block(self, participants: List[str], block: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> None:
+        """
+        Add a block generated for `participants` to the pool. Must be called with the lock held.
+        """
+        if participants != sorted(self.participant_ids):
+            # Participants changed while we were generating, drop this block.
+            return
+        self._participants = participants
+        self._pool.append(block)
+        self._pool_available += block[0].shape[1]
+
+    def pool_available(self) -> int:
+        """
+        Number of triplets left in the pool.
+        """
+        return self._pool_available
+
+    def generate_triplet(self, client_id: str, op_id: str) -> Tuple[Share, Share, Share]:
+        """
+        Assign a triplet from the pool to a given op_id and retrieve the share for the pair (client_id, op_id)
+        """
+        with self._lock:
+            a_shares, b_shares, c_shares = self._draw(1)
+
+            # Store the shares in the ttp's dict
+            for idx, p_id in enumerate(self._participants):
+                self.triplet_dict[(p_id, op_id)] = (
+                    Share(int(a_shares[idx, 0]), self.field),
+                    Share(int(b_shares[idx, 0]), self.field),
+                    Share(int(c_shares[idx, 0]), self.field),
+                )
+            self._assigned("triplet_dict", op_id, self._participants)
+
+            return self.triplet_dict.get((client_id, op_id))
+
+    def generate_triplet_vector(
+            self,
+            client_id: str,
+            op_id: str,
+            count: int,
+            shape: Tuple[int, int, int] = (1, 1, 1)
+        ) -> Tuple[ShareVector, ShareVector, ShareVector]:
+        """
+        Assign `count` triplets from the pool to a given op_id and retrieve the shares for the pair
+        (client_id, op_id), as three vectors.
+
+        Given a shape (m, k, n), the triplets are matrix triples: A (m x k), B (k x n) and C = A.B,
+        flattened (row-major, the `count` triples varying the fastest).
+        """
+        with self._lock:
+            if shape == (1, 1, 1):
+                a_shares, b_shares, c_shares = self._draw(count)
+                participants = self._participants
+            else:
+                a_shares, b_shares, c_shares = self._matrix_triples(shape, count)
+                participants = sorted(self.participant_ids)
+
+            for idx, p_id in enumerate(participants):
+                self.vector_triplet_dict[(p_id, op_id)] = (
+                    ShareVector._wrap(a_shares[idx], self.field),
+                    ShareVector._wrap(b_shares[idx], self.field),
+                    ShareVector._wrap(c_shares[idx], self.field),
+                )
+            self._assigned("vector_triplet_dict", op_id, participants)
+
+            return self.vector_triplet_dict.get((client_id, op_id))
+
+    def _matrix_triples(
+            self,
+            shape: Tuple[int, int, int],
+            count: int
+        ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Generate `count` matrix triples, split for all participants. They are not pooled, since
+        their shape depends on the operation.
+        """
+        m, k, n = shape
+        a = self.field.random((m, k, count), self.rng)
+        b = self.field.random((k, n, count), self.rng)
+        c = self.field.matmul(a, b)
         nb_participants = len(self.participant_ids)
-        a_shares : List[Share] = share_secret(a, nb_participants)
-        b_shares : List[Share] = share_secret(b, nb_participants)
-        c_shares : List[Share] = share_secret(c, nb_participants)
+        return tuple( # type: ignore
+            np.stack([s.values for s in share_secrets(v.ravel(), nb_participants, self.field, self.rng)])
+            for v in (a, b, c)
+        )
 
-        # Store the shares in the ttp's dict
-        for idx, p_id in enumerate(self.participant_ids):
-            self.triplet_dict[(p_id, op_id)] = (a_shares[idx], b_shares[idx], c_shares[idx])
+    def _draw(self, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Take `count` triplets out of the pool, as arrays with one row per participant.
+        Must be called with the lock held.
+        """
+        parts = []
+        while count > 0:
+            if self._pool_available == 0:
+                # Rather wait for the block of a background refill than draw another one meanwhile
+                self._refilled.wait_for(lambda: not self._refilling)
+            if self._pool_available == 0:
+                self.generate_triplets(max(self.pool_size, count))
+
+            a_shares, b_shares, c_shares = self._pool[0]
+            start = self._pool_cursor
+            nb_taken = min(count, a_shares.shape[1] - start)
+            parts.append(tuple(v[:, start:start + nb_taken] for v in (a_shares, b_shares, c_shares)))
+            self._pool_cursor += nb_taken
+            self._pool_available -= nb_taken
+            count -= nb_taken
+            if self._pool_cursor == a_shares.shape[1]:
+                self._pool.popleft()
+                self._pool_cursor = 0
 
-        res = self.triplet_dict.get((client_id, op_id))
+        if self._pool_available < self.low_water_mark and not self._refilling:
+            self._refilling = True
+            threading.Thread(target=self._refill, daemon=True).start()
 
-        return res
+        if len(parts) == 1:
+            return parts[0]
+        return tuple(np.concatenate([part[k] for part in parts], axis=1) for k in range(3)) # type: ignore
+
+    def _refill(self) -> None:
+        """
+        Background regeneration of the pool.
+        """
+        try:
+            with self._lock:
+                participants = sorted(self.participant_ids)
+            block = self._generate_block(self.pool_size, len(participants))
+            with self._lock:
+                self._add_block(participants, block)
+        finally:
+            with self._lock:
+                self._refilling = False
+                self._refilled.notify_all()
 
     def retrieve_share(self, client_id: str, op_id: str) -> Tuple[Share, Share, Share]:
         """
         Retrieve a triplet of shares for a given client_id.
         """
-        triplet = self.triplet_dict.get((client_id, op_id))
-        if triplet == None:
-            triplet = self.generate_triplet(client_id, op_id)
-        return triplet
+        with self._lock:
+            triplet = self.triplet_dict.get((client_id, op_id))
+            if triplet == None:
+                self._check_dropped("triplet_dict", op_id, client_id)
+                triplet = self.generate_triplet(client_id, op_id)
+            self._retrieved("triplet_dict", op_id, client_id)
+            return triplet
+
+    def retrieve_share_vector(
+            self,
+            client_id: str,
+            op_id: str,
+            count: int,
+            shape: Tuple[int, int, int] = (1, 1, 1)
+        ) -> Tuple[ShareVector, ShareVector, ShareVector]:
+        """
+        Retrieve `count` triplets (or matrix triples of the given shape) of shares for a given
+        client_id, as three vectors.
+        """
+        with self._lock:
+            triplet = self.vector_triplet_dict.get((client_id, op_id))
+            if triplet is None:
+                self._check_dropped("vector_triplet_dict", op_id, client_id)
+                triplet = self.generate_triplet_vector(client_id, op_id, count, shape)
+            elif len(triplet[0]) != shape[0] * shape[1] * count or len(triplet[2]) != shape[0] * shape[2] * count:
+                raise ValueError(f"Operation {op_id} already has triplets of another shape or count")
+            self._retrieved("vector_triplet_dict", op_id, client_id)
+            return triplet
+
+    def generate_random_bits(
+            self,
+            client_id: str,
+            op_id: str,
+            count: int,
+            bits: int
+        ) -> ShareVector:
+        """
+        Draw `bits` random bits for each of `count` values, assign them to a given op_id and
+        retrieve the shares for the pair (client_id, op_id): `bits` x `count` shares, flattened
+        row-major (the `count` values varying the fastest). Each bit is shared in the field, like
+        any other value.
+        """
+        with self._lock:
+            values = self.rng.integers(0, 2, size=bits * count, dtype=self.field.dtype)
+            participants = sorted(self.participant_ids)
+            for p_id, shares in zip(participants, share_secrets(values, len(participants), self.field, self.rng)):
+                self.random_bits_dict[(p_id, op_id)] = shares
+            self._assigned("random_bits_dict", op_id, participants)
+
+            return self.random_bits_dict.get((client_id, op_id))
+
+    def retrieve_random_bits(
+            self,
+            client_id: str,
+            op_id: str,
+            count: int,
+            bits: int
+        ) -> ShareVector:
+        """
+        Retrieve the shares of the random bits of an operation for a given client_id, see
+        `generate_random_bits`.
+        """
+        with self._lock:
+            shares = self.random_bits_dict.get((client_id, op_id))
+            if shares is None:
+                self._check_dropped("random_bits_dict", op_id, client_id)
+                shares = self.generate_random_bits(client_id, op_id, count, bits)
+            elif len(shares) != bits * count:
+                raise ValueError(f"Operation {op_id} already has another number of random bits")
+            self._retrieved("random_bits_dict", op_id, client_id)
+            return shares
+
+    def retrieve_seed(self, client_id: str, run: str) -> Tuple[int, bool]:
+        """
+        Seed a participant expands its shares of the triplets of a run from (see `expand_seed`), and
+        whether it is the participant that needs the corrections of its shares of c.
+
+        `run` is a label all the participants of an evaluation give, and no other evaluation does
+        (e.g. a nonce one of them draws). The seeds of a new run are drawn by its first retrieval;
+        retrieving a seed again gives the same one.
+        """
+        with self._lock:
+            entry = self._seeds.get(run)
+            if entry is None:
+                seeds = {
+                    p_id: int.from_bytes(self._seed_rng.bytes(16), "little") for p_id in sorted(self.participant_ids)
+                }
+                entry = self._seeds[run] = (time.monotonic(), seeds)
+                self._evict()
+            seeds = entry[1]
+            return seeds[client_id], client_id == max(seeds)
+
+    def retrieve_correction(
+            self,
+            client_id: str,
+            run: str,
+            op_id: str,
+            count: int,
+            shape: Optional[Tuple[int, int, int]] = None
+        ) -> np.ndarray:
+        """
+        Shares of c of the last participant for the triplets of an operation expanded from the seeds
+        of a run: c - (the shares of c of the others), where c = a.b for the a and b of all the
+        participants.
+        Nothing is stored, retrieving it again gives the same correction. Raise `OperationDropped`
+        if the seeds of the run were dropped (or never retrieved): the others may have expanded
+        triplets from them already.
+        """
+        with self._lock:
+            entry = self._seeds.get(run)
+            if entry is None:
+                raise OperationDropped(f"The seeds of run {run} were dropped before {client_id} got corrections")
+            seeds = dict(entry[1])
+        participants = sorted(seeds)
+        if client_id != participants[-1]:
+            raise ValueError(f"Only {participants[-1]} gets corrections, not {client_id}")
+
+        triplets = [expand_seed(self.field, seeds[p_id], op_id, count, shape) for p_id in participants]
+        a = functools.reduce(self.field.add, [t[0] for t in triplets])
+        b = functools.reduce(self.field.add, [t[1] for t in triplets])
+        c = self.field.mul(a, b) if shape is None else self.field.matmul(a, b)
+        return functools.reduce(self.field.sub, [t[2] for t in triplets[:-1]], c)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Current number of operations with a triplet and of triplets left in the pool, and number of
+        operations dropped so far because they were consumed, expired or evicted.
+        """
+        with self._lock:
+            self._evict()
+            return {
+                "operations": len(self._operations),
+                "pool_available": self._pool_available,
+                **self._counters
+            }
+
+    def _assigned(self, store: str, op_id: str, participants: List[str]) -> None:
+        # A triplet was split for all participants and stored in the dict `store`
+        key = (store, op_id)
+        self._operations.pop(key, None)
+        self._operations[key] = (time.monotonic(), list(participants), set(participants))
+        self._evict()
+
+    def _retrieved(self, store: str, op_id: str, client_id: str) -> None:
+        # A participant got its shares, drop the triplet if it was the last one (with
+        # delete_on_consume)
+        operation = self._operations.get((store, op_id))
+        if operation is None:
+            return
+        operation[2].discard(client_id)
+        if not operation[2] and self.delete_on_consume:
+            self._drop((store, op_id))
+            self._counters["consumed"] += 1
+
+    def _check_dropped(self, store: str, op_id: str, client_id: str) -> None:
+        # Raise if the operation was dropped before the participant retrieved its shares. A
+        # participant that did retrieve them asks for the operation again (e.g. the same expression
+        # evaluated again), it gets a new triplet.
+        key = (store, op_id)
+        dropped = self._dropped.get(key)
+        if dropped is None:
+            return
+        if client_id not in dropped[1]:
+            del self._dropped[key]
+            return
+        dropped[1].discard(client_id)
+        if not dropped[1]:
+            del self._dropped[key]
+        raise OperationDropped(f"The shares of operation {op_id} were dropped before {client_id} retrieved them")
+
+    def _evict(self) -> None:
+        # Drop the expired operations and seeds, then the oldest ones while above max_operations
+        # (but never the newest one)
+        if self.ttl is not None:
+            expiry = time.monotonic() - self.ttl
+            while self._dropped and next(iter(self._dropped.values()))[0] < expiry:
+                self._dropped.popitem(last=False) # type: ignore
+            while len(self._seeds) > 1 and next(iter(self._seeds.values()))[0] < expiry:
+                self._seeds.popitem(last=False) # type: ignore
+            while self._operations:
+                key, (assigned, _, _) = next(iter(self._operations.items()))
+                if assigned >= expiry:
+                    break
+                self._drop(key)
+                self._counters["expired"] += 1
+
+        if self.max_operations is not None:
+            while len(self._operations) > max(self.max_operations, 1):
+                self._drop(next(iter(self._operations)))
+                self._counters["evicted"] += 1
+            while len(self._dropped) > self.max_operations:
+                self._dropped.popitem(last=False) # type: ignore
+            while len(self._seeds) > max(self.max_operations, 1):
+                self._seeds.popitem(last=False) # type: ignore
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        store, op_id = key
+        _, participants, missing = self._operations.pop(key)
+        if missing and len(missing) < len(participants):
+            # Some participants have shares of this triplet, the others must not get another one
+            self._dropped[key] = (time.monotonic(), set(missing))
+        triplets = getattr(self, store)
+        for p_id in participants:
+            triplets.pop((p_id, op_id), None)
 
     # Feel free to add as many methods as you want.